@@ -1,22 +1,32 @@
 """
 Sistema de Autenticación con OAuth2, JWT y RBAC
 """
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional, List
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+import uuid
 
 from app.core.config import settings
-from app.models.database import get_db
+from app.core.user_cache import auth_cache
+from app.models.database import get_async_db
 from app.models.models import User, UserRole
 
 # Configuración de seguridad
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
 
+# bcrypt (~250 ms por hash) fuera del event loop, en un pool propio para no
+# ocupar el threadpool por defecto de Starlette
+_password_executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+
 
 class AuthService:
     """Servicio de autenticación"""
@@ -31,6 +41,18 @@ class AuthService:
         """Hash de contraseña"""
         return pwd_context.hash(password)
     
+    @staticmethod
+    async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+        """Verificar contraseña en el pool de bcrypt"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_password_executor, pwd_context.verify, plain_password, hashed_password)
+    
+    @staticmethod
+    async def get_password_hash_async(password: str) -> str:
+        """Hash de contraseña en el pool de bcrypt"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_password_executor, pwd_context.hash, password)
+    
     @staticmethod
     def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
         """Crear JWT token"""
@@ -53,34 +75,60 @@ class AuthService:
         if not AuthService.verify_password(password, user.hashed_password):
             return None
         return user
+    
+    @staticmethod
+    async def authenticate_user_async(db: AsyncSession, email: str, password: str) -> Optional[User]:
+        """Autenticar usuario sin bloquear el event loop (consulta async, bcrypt en su pool)"""
+        user = (await db.execute(select(User).where(User.email == email))).scalar_one_or_none()
+        if not user:
+            return None
+        if not await AuthService.verify_password_async(password, user.hashed_password):
+            return None
+        return user
 
 
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> User:
-    """Obtener usuario actual desde token JWT"""
+    """Obtener usuario actual desde token JWT (sesión async: no bloquea el event loop)"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="No se pudieron validar las credenciales",
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
+    # Token ya verificado: se omite la firma (el cache respeta su exp)
+    payload = auth_cache.get_token(token)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        except JWTError:
             raise credentials_exception
-    except JWTError:
+        auth_cache.set_token(token, payload)
+    
+    # Los tokens de acceso no llevan "type": cualquier otro token firmado (p.ej. de subida) no autentica
+    if "type" in payload:
         raise credentials_exception
     
-    user = db.query(User).filter(User.id == user_id).first()
+    try:
+        user_id = uuid.UUID(payload.get("sub"))
+    except (TypeError, ValueError):
+        raise credentials_exception
+    
+    # Usuario activo en cache (TTL + invalidación explícita al cambiar rol o estado)
+    user = auth_cache.get_user(user_id)
+    if user is not None:
+        return user
+    
+    user = (await db.execute(select(User).where(User.id == user_id))).scalar_one_or_none()
     if user is None:
         raise credentials_exception
     
     if not user.is_active:
         raise HTTPException(status_code=400, detail="Usuario inactivo")
     
+    auth_cache.set_user(user)
     return user
 
 
@@ -0,0 +1,105 @@
+"""
+Paginación keyset (cursor) y proyección de columnas para endpoints de listado
+
+El cursor es la clave de orden de la última fila entregada, (columna de orden, id)
+en JSON + base64 URL-safe; la página siguiente filtra con una comparación de filas
+`(orden, id) < (:orden, :id)` (`>` en orden ascendente) sobre un índice compuesto,
+así el costo no depende de la profundidad (sin OFFSET). El cuerpo de la respuesta sigue siendo una lista; el
+cursor de la página siguiente va en el header X-Next-Cursor (ausente en la última).
+
+Con `fields` (lista separada por comas de campos del modelo de respuesta) sólo se
+leen esas columnas (más las del cursor) y se responden como dicts.
+"""
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+from fastapi import HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import DateTime, Integer, tuple_
+from sqlalchemy.dialects.postgresql import UUID
+
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def projection(model, fields: Optional[str], allowed: Iterable[str], keyset: "Keyset") -> Optional[List]:
+    """
+    Columnas pedidas en `fields` más las del cursor (None = fila completa)
+    
+    Raises:
+        HTTPException 400: campo fuera del modelo de respuesta
+    """
+    if not fields:
+        return None
+    allowed = set(allowed)
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Campos desconocidos: {', '.join(unknown)}")
+    keys = [column.key for column in keyset.columns]
+    return [getattr(model, name) for name in dict.fromkeys([*keys, *names])]
+
+
+class Keyset:
+    """Orden por (columnas..., id) con cursor opaco (la última columna debe ser única)"""
+    
+    def __init__(self, *columns, descending: bool = True):
+        self.columns = columns
+        self.descending = descending
+    
+    def _decode_value(self, column, value):
+        if value is None:
+            return None
+        if isinstance(column.type, DateTime):
+            return datetime.fromisoformat(value)
+        if isinstance(column.type, UUID):
+            return uuid.UUID(value)
+        if isinstance(column.type, Integer):
+            return int(value)
+        return value
+    
+    def decode(self, cursor: str) -> list:
+        """
+        Raises:
+            HTTPException 400: cursor mal formado
+        """
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode() + b"=" * (-len(cursor) % 4)))
+            if len(values) != len(self.columns):
+                raise ValueError("largo de cursor inválido")
+            return [self._decode_value(column, value) for column, value in zip(self.columns, values)]
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+    
+    def encode(self, row) -> str:
+        values = [getattr(row, column.key) for column in self.columns]
+        payload = json.dumps([value.isoformat() if isinstance(value, datetime) else value for value in values], default=str)
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+    
+    def apply(self, query, cursor: Optional[str], limit: int):
+        """Filtro del cursor, orden y una fila extra para saber si hay página siguiente"""
+        if cursor:
+            key, after = tuple_(*self.columns), tuple_(*self.decode(cursor))
+            query = query.where(key < after if self.descending else key > after)
+        order = [column.desc() if self.descending else column.asc() for column in self.columns]
+        return query.order_by(*order).limit(limit + 1)
+    
+    def page(self, rows, limit: int, response: Response, projected: bool = False):
+        """Recortar la fila extra y publicar el cursor siguiente en el header"""
+        rows = list(rows)
+        next_cursor = self.encode(rows[limit - 1]) if len(rows) > limit else None
+        rows = rows[:limit]
+        
+        if projected:
+            # Sin response_model: dicts con sólo las columnas pedidas
+            return JSONResponse(
+                jsonable_encoder([row._asdict() for row in rows]),
+                headers={NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+            )
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        return rows
@@ -0,0 +1,163 @@
+"""
+Cache de autenticación del proceso API (camino caliente de get_current_user)
+
+- Tokens: payload JWT ya verificado, hasta su `exp` (sin repetir la firma HMAC)
+- Usuarios: instancia User desacoplada de la sesión, con TTL AUTH_USER_CACHE_TTL_SECONDS
+
+Ambos son LRU acotados a AUTH_CACHE_MAX_ENTRIES. Al desactivar un usuario o cambiar
+su rol, `invalidate_user` lo borra del cache local y publica el id en Redis para
+que los demás procesos de la API hagan lo mismo. Si la publicación falla se
+reintenta y, de no lograrse, se informa al llamador (InvalidationError): en los
+demás procesos la copia puede seguir vigente hasta AUTH_USER_CACHE_TTL_SECONDS.
+Publicación y suscripción comparten un único cliente Redis por proceso. Se usa
+sólo desde el event loop.
+"""
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+import redis.asyncio as redis
+
+from app.core.config import settings
+
+
+INVALIDATION_CHANNEL = "auth:user-invalidated"
+PUBLISH_ATTEMPTS = 3
+
+_client: Optional[redis.Redis] = None
+
+
+class InvalidationError(Exception):
+    """No se pudo avisar a los demás procesos API (su cache vence por TTL)"""
+
+
+def _redis_client() -> redis.Redis:
+    """Cliente Redis del proceso (un solo pool para publicar y escuchar)"""
+    global _client
+    if _client is None:
+        _client = redis.from_url(settings.REDIS_URL)
+    return _client
+
+
+async def close_redis():
+    """Cerrar el cliente compartido (apagado de la API)"""
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.aclose()
+
+
+class TTLCache:
+    """LRU con vencimiento por entrada"""
+    
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()  # clave -> (vence en monotonic, valor)
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+    
+    def set(self, key, value, ttl: float):
+        if ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def pop(self, key):
+        self._entries.pop(key, None)
+    
+    def clear(self):
+        self._entries.clear()
+
+
+class AuthCache:
+    """Tokens verificados y usuarios activos"""
+    
+    def __init__(self, max_entries: Optional[int] = None):
+        max_entries = max_entries or settings.AUTH_CACHE_MAX_ENTRIES
+        self.tokens = TTLCache(max_entries)
+        self.users = TTLCache(max_entries)
+    
+    def get_token(self, token: str) -> Optional[dict]:
+        return self.tokens.get(token)
+    
+    def set_token(self, token: str, payload: dict):
+        """Guardar hasta el vencimiento del token"""
+        expires_at = payload.get("exp")
+        if expires_at is not None:
+            self.tokens.set(token, payload, expires_at - time.time())
+    
+    def get_user(self, user_id):
+        return self.users.get(user_id)
+    
+    def set_user(self, user):
+        self.users.set(user.id, user, settings.AUTH_USER_CACHE_TTL_SECONDS)
+    
+    def drop_user(self, user_id):
+        self.users.pop(user_id)
+    
+    def stats(self) -> dict:
+        return {
+            "token_hits": self.tokens.hits,
+            "token_misses": self.tokens.misses,
+            "user_hits": self.users.hits,
+            "user_misses": self.users.misses
+        }
+
+
+auth_cache = AuthCache()
+
+
+async def invalidate_user(user_id):
+    """
+    Quitar un usuario del cache de este proceso y avisar al resto de los procesos API
+    
+    Raises:
+        InvalidationError: Redis no aceptó la publicación tras PUBLISH_ATTEMPTS intentos
+    """
+    auth_cache.drop_user(user_id)
+    for attempt in range(1, PUBLISH_ATTEMPTS + 1):
+        try:
+            await _redis_client().publish(INVALIDATION_CHANNEL, str(user_id))
+            return
+        except (redis.RedisError, OSError) as e:
+            error = e
+            if attempt < PUBLISH_ATTEMPTS:
+                await asyncio.sleep(0.1 * attempt)
+    
+    print(
+        f"❌ No se pudo publicar la invalidación del usuario {user_id}: {error}. "
+        f"Otros procesos API pueden usar su estado anterior hasta {settings.AUTH_USER_CACHE_TTL_SECONDS}s"
+    )
+    raise InvalidationError(str(error)) from error
+
+
+async def listen_for_invalidations():
+    """Tarea de fondo del proceso API: aplicar las invalidaciones publicadas por otros procesos"""
+    # Cliente compartido del proceso; cada reconexión sólo abre (y cierra) un pubsub
+    while True:
+        try:
+            async with _redis_client().pubsub() as pubsub:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Mensajes perdidos mientras no había suscripción: vaciar el cache de usuarios
+                auth_cache.users.clear()
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        auth_cache.drop_user(uuid.UUID(message["data"].decode()))
+        except (redis.RedisError, OSError, ValueError) as e:
+            print(f"⚠️  Suscripción de invalidaciones de usuario interrumpida: {e}")
+            await asyncio.sleep(5)
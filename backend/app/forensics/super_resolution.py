@@ -2,26 +2,109 @@
 Módulo de Super-Resolution usando Real-ESRGAN
 Mejora la calidad de rostros pixelados para análisis forense
 """
+import math
+import os
 import cv2
 import numpy as np
 import torch
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 from pathlib import Path
 
 
+# Memoria aproximada de activaciones de RRDBNet x4 (float32) por pixel de entrada.
+# El pico ocurre en las capas de upsampling (64 canales a 16x pixels).
+RRDB_BYTES_PER_INPUT_PIXEL = 16 * 1024
+
+# Límites del tamaño de tile automático
+MIN_TILE_SIZE = 64
+TILE_SIZE_MULTIPLE = 32
+
+# Niveles del enhancer de fallback (sin Real-ESRGAN), de más rápido a mejor calidad.
+# Medidos con scripts/benchmark_fallback_tiers.py
+FALLBACK_TIERS = ("fast", "balanced", "best")
+
+# Tamaños objetivo de enhance_face (rostros: cuadrado)
+FACE_RESOLUTIONS = {
+    "4k": (512, 512),
+    "1080p": (256, 256),
+    "720p": (128, 128)
+}
+
+# Granularidad de los buckets de batch_enhance: recortes cuyo alto/ancho caen en
+# el mismo múltiplo se rellenan a la misma forma y se procesan en una sola pasada
+BATCH_BUCKET_SIZE = 32
+
+
+def available_memory_bytes() -> int:
+    """
+    Memoria disponible para el proceso: MemAvailable del sistema acotado
+    por el límite del cgroup (contenedores Docker/Kubernetes)
+    """
+    available = None
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    available = int(line.split()[1]) * 1024
+                    break
+    except OSError:
+        pass
+    
+    if available is None:
+        try:
+            available = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+        except (ValueError, OSError, AttributeError):
+            available = 2 * 1024 ** 3  # Supuesto conservador: 2 GB
+    
+    # cgroup v2 (el OOM killer del contenedor actúa sobre este límite)
+    try:
+        limit = Path("/sys/fs/cgroup/memory.max").read_text().strip()
+        usage = int(Path("/sys/fs/cgroup/memory.current").read_text().strip())
+        if limit != "max":
+            available = min(available, int(limit) - usage)
+    except (OSError, ValueError):
+        pass
+    
+    return max(available, 0)
+
+
 class SuperResolutionModule:
     """Módulo de mejora de imagen usando Real-ESRGAN"""
     
-    def __init__(self, model_path: Optional[str] = None):
+    def __init__(
+        self,
+        model_path: Optional[str] = None,
+        tile_size: int = 0,
+        tile_overlap: int = 16,
+        tile_workers: int = 1,
+        memory_fraction: float = 0.5,
+        fallback_tier: str = "balanced"
+    ):
         """
         Inicializar modelo Real-ESRGAN
         
         Args:
             model_path: Ruta al modelo RealESRGAN_x4plus.pth
+            tile_size: Tamaño de tile en pixels de entrada (0 = automático según memoria, -1 = sin tiles)
+            tile_overlap: Solape entre tiles (pixels de entrada) para mezclar sin costuras
+            tile_workers: Threads para procesar tiles (o recortes no apilables) en paralelo
+            memory_fraction: Fracción de la memoria disponible que puede usar la inferencia
+            fallback_tier: Nivel del enhancer sin Real-ESRGAN ("fast", "balanced", "best")
         """
+        if fallback_tier not in FALLBACK_TIERS:
+            raise ValueError(f"Nivel de fallback no soportado: {fallback_tier}")
+        
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.model = None
+        self.net = None
         self.scale = 4  # Factor de escalado 4x
+        self.half = self.device.type == "cuda"
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        self.tile_workers = max(1, tile_workers)
+        self.memory_fraction = memory_fraction
+        self.fallback_tier = fallback_tier
         
         try:
             from basicsr.archs.rrdbnet_arch import RRDBNet
@@ -46,9 +129,11 @@ class SuperResolutionModule:
                     tile=0,
                     tile_pad=10,
                     pre_pad=0,
-                    half=True if self.device.type == "cuda" else False,
+                    half=self.half,
                     device=self.device
                 )
+                # Red RRDBNet ya cargada (pesos, eval, device) para inferencia por tiles
+                self.net = self.model.model
                 print(f"✅ Real-ESRGAN loaded: {model_path}")
             else:
                 print("⚠️  Real-ESRGAN model not found, using fallback")
@@ -75,7 +160,7 @@ class SuperResolutionModule:
         if self.model is not None:
             try:
                 # Usar Real-ESRGAN
-                enhanced, _ = self.model.enhance(image, outscale=self.scale)
+                enhanced = self._upscale(image)
                 
                 if target_size:
                     enhanced = cv2.resize(enhanced, target_size, interpolation=cv2.INTER_LANCZOS4)
@@ -87,33 +172,201 @@ class SuperResolutionModule:
         else:
             return self._fallback_enhance(image, target_size)
     
+    def _upscale(self, image: np.ndarray) -> np.ndarray:
+        """
+        Escalar 4x con Real-ESRGAN, por tiles si la imagen completa no cabe en memoria
+        """
+        is_bgr_uint8 = image.ndim == 3 and image.shape[2] == 3 and image.dtype == np.uint8
+        if self.net is None or not is_bgr_uint8:
+            # Grises, alpha o 16 bits: dejar el pre/post-proceso a RealESRGANer
+            enhanced, _ = self.model.enhance(image, outscale=self.scale)
+            return enhanced
+        
+        height, width = image.shape[:2]
+        tile = self.choose_tile_size(height, width)
+        if tile == 0:
+            return self._infer(image[np.newaxis])[0]
+        return self._tiled_upscale(image, tile)
+    
+    def choose_tile_size(self, height: int, width: int) -> int:
+        """
+        Elegir tamaño de tile según memoria disponible y tamaño de entrada
+        
+        Returns:
+            Tamaño de tile en pixels de entrada, 0 si la imagen cabe completa
+        """
+        if self.tile_size < 0:
+            return 0
+        if self.tile_size > 0:
+            return self.tile_size if self.tile_size < max(height, width) else 0
+        
+        max_pixels = self._max_inference_pixels()
+        if height * width <= max_pixels:
+            return 0
+        
+        # El tile procesado incluye el solape por ambos lados
+        tile = int(math.sqrt(max_pixels)) - 2 * self.tile_overlap
+        tile = (tile // TILE_SIZE_MULTIPLE) * TILE_SIZE_MULTIPLE
+        return max(tile, MIN_TILE_SIZE)
+    
+    def _max_inference_pixels(self) -> int:
+        """Pixels de entrada que caben en una pasada de RRDBNet por thread de inferencia"""
+        if self.device.type == "cuda":
+            free_bytes, _ = torch.cuda.mem_get_info(self.device)
+        else:
+            free_bytes = available_memory_bytes()
+        
+        bytes_per_pixel = RRDB_BYTES_PER_INPUT_PIXEL / (2 if self.half else 1)
+        budget = free_bytes * self.memory_fraction / self.tile_workers
+        return int(budget / bytes_per_pixel)
+    
+    def _infer(self, batch: np.ndarray) -> np.ndarray:
+        """
+        Inferencia directa de RRDBNet sobre un batch (N, H, W, 3) BGR uint8
+        
+        Returns:
+            Batch escalado (N, H*4, W*4, 3) BGR uint8
+        """
+        tensor = torch.from_numpy(
+            np.ascontiguousarray(batch[..., ::-1].transpose(0, 3, 1, 2))
+        ).to(self.device)
+        tensor = tensor.half() if self.half else tensor.float()
+        tensor = tensor / 255.0
+        
+        with torch.no_grad():
+            output = self.net(tensor)
+        
+        output = output.float().clamp_(0, 1).mul_(255.0).round_().byte().cpu().numpy()
+        return np.ascontiguousarray(output.transpose(0, 2, 3, 1)[..., ::-1])
+    
+    def _tiled_upscale(self, image: np.ndarray, tile: int) -> np.ndarray:
+        """
+        Escalar por tiles con solape y mezcla lineal en las zonas compartidas
+        
+        Se procesa una franja horizontal de tiles a la vez: sólo la franja actual
+        se acumula en float32, así la memoria no crece con la altura de la imagen.
+        Los pesos de tiles vecinos son rampas complementarias (suman 1), por lo
+        que no hace falta normalizar al final.
+        """
+        height, width = image.shape[:2]
+        scale = self.scale
+        overlap = min(self.tile_overlap, tile // 2)
+        output = np.empty((height * scale, width * scale, 3), dtype=np.uint8)
+        
+        row_starts = list(range(0, height, tile))
+        col_starts = list(range(0, width, tile))
+        carry = None  # Filas de salida compartidas con la franja anterior
+        
+        with ThreadPoolExecutor(max_workers=self.tile_workers) as executor:
+            for row_idx, y0 in enumerate(row_starts):
+                y1 = min(y0 + tile, height)
+                in_y0, in_y1 = max(y0 - overlap, 0), min(y1 + overlap, height)
+                strip = np.zeros(((in_y1 - in_y0) * scale, width * scale, 3), dtype=np.float32)
+                if carry is not None:
+                    strip[:carry.shape[0]] += carry
+                
+                weight_y = self._blend_ramp(in_y0, in_y1, y0, y1, height, overlap)
+                
+                regions = []
+                for x0 in col_starts:
+                    x1 = min(x0 + tile, width)
+                    in_x0, in_x1 = max(x0 - overlap, 0), min(x1 + overlap, width)
+                    regions.append((x0, x1, in_x0, in_x1))
+                
+                tiles = executor.map(
+                    lambda r: self._infer(image[np.newaxis, in_y0:in_y1, r[2]:r[3]])[0],
+                    regions
+                )
+                
+                for (x0, x1, in_x0, in_x1), upscaled in zip(regions, tiles):
+                    weight_x = self._blend_ramp(in_x0, in_x1, x0, x1, width, overlap)
+                    weight = weight_y[:, np.newaxis, np.newaxis] * weight_x[np.newaxis, :, np.newaxis]
+                    strip[:, in_x0 * scale:in_x1 * scale] += upscaled * weight
+                
+                # Filas que ya no comparte ninguna franja posterior
+                if row_idx + 1 < len(row_starts):
+                    final_rows = (max(y1 - overlap, 0) - in_y0) * scale
+                else:
+                    final_rows = strip.shape[0]
+                
+                out_y0 = in_y0 * scale
+                output[out_y0:out_y0 + final_rows] = np.clip(
+                    np.rint(strip[:final_rows]), 0, 255
+                ).astype(np.uint8)
+                carry = strip[final_rows:]
+        
+        return output
+    
+    def _blend_ramp(
+        self,
+        in_start: int,
+        in_end: int,
+        core_start: int,
+        core_end: int,
+        limit: int,
+        overlap: int
+    ) -> np.ndarray:
+        """
+        Pesos 1D (en pixels de salida) de un tile: rampa ascendente en el solape
+        con el tile anterior, descendente en el solape con el siguiente
+        """
+        scale = self.scale
+        weights = np.ones((in_end - in_start) * scale, dtype=np.float32)
+        
+        if core_start > 0:
+            band = (min(core_start + overlap, limit) - in_start) * scale
+            weights[:band] = (np.arange(band, dtype=np.float32) + 0.5) / band
+        
+        if core_end < limit:
+            band_start = (core_end - overlap - in_start) * scale
+            band = weights.shape[0] - band_start
+            weights[band_start:] *= 1.0 - (np.arange(band, dtype=np.float32) + 0.5) / band
+        
+        return weights
+    
     def _fallback_enhance(
         self,
         image: np.ndarray,
-        target_size: Optional[tuple] = None
+        target_size: Optional[tuple] = None,
+        sharpen: bool = True
     ) -> np.ndarray:
         """
         Método de mejora alternativo sin Real-ESRGAN
-        Usa interpolación bicúbica y filtros de nitidez
+        
+        Todos los niveles reducen ruido con un filtro bilateral sobre la imagen
+        pequeña (antes de escalar) y escalan una sola vez al tamaño objetivo:
+            fast: bicúbica y unsharp mask
+            balanced: Lanczos, unsharp mask y bilateral suave sobre el resultado
+            best: Lanczos, unsharp mask y Non-Local Means sobre el resultado
+        
+        Args:
+            sharpen: Aplicar unsharp mask; enhance_face lo omite porque su
+                post-procesamiento facial ya enfoca
         """
         if target_size is None:
             # Escalar 4x por defecto
             height, width = image.shape[:2]
             target_size = (width * 4, height * 4)
         
-        # Upscaling con interpolación Lanczos (mejor calidad)
-        upscaled = cv2.resize(image, target_size, interpolation=cv2.INTER_LANCZOS4)
+        # Reducir ruido antes de escalar: el costo es proporcional a la entrada
+        denoised = cv2.bilateralFilter(image, 5, 30, 5)
         
-        # Aplicar filtro de nitidez
-        kernel = np.array([[-1,-1,-1],
-                          [-1, 9,-1],
-                          [-1,-1,-1]])
-        sharpened = cv2.filter2D(upscaled, -1, kernel)
+        if self.fallback_tier == "fast":
+            upscaled = cv2.resize(denoised, target_size, interpolation=cv2.INTER_CUBIC)
+        else:
+            upscaled = cv2.resize(denoised, target_size, interpolation=cv2.INTER_LANCZOS4)
         
-        # Reducción de ruido
-        denoised = cv2.fastNlMeansDenoisingColored(sharpened, None, 10, 10, 7, 21)
+        if sharpen:
+            blurred = cv2.GaussianBlur(upscaled, (0, 0), 2)
+            upscaled = cv2.addWeighted(upscaled, 1.5, blurred, -0.5, 0)
         
-        return denoised
+        # Limpieza de ruido/halos sobre la imagen escalada
+        if self.fallback_tier == "balanced":
+            upscaled = cv2.bilateralFilter(upscaled, 7, 25, 7)
+        elif self.fallback_tier == "best":
+            upscaled = cv2.fastNlMeansDenoisingColored(upscaled, None, 5, 5, 7, 21)
+        
+        return upscaled
     
     def enhance_face(
         self,
@@ -130,18 +383,37 @@ class SuperResolutionModule:
         Returns:
             Rostro mejorado en la resolución objetivo
         """
-        # Definir tamaños objetivo
-        resolutions = {
-            "4k": (512, 512),      # Para rostros, usamos cuadrado
-            "1080p": (256, 256),
-            "720p": (128, 128)
-        }
-        
-        target_size = resolutions.get(target_resolution, (512, 512))
+        if self.model is None:
+            # Sin Real-ESRGAN: escalar una sola vez directo al tamaño final
+            target_size = FACE_RESOLUTIONS.get(target_resolution, (512, 512))
+            enhanced = self._fallback_enhance(face_image, target_size, sharpen=False)
+            return self._enhance_face_details(enhanced)
         
         # Primero, mejorar con ESRGAN
         enhanced = self.enhance_image(face_image, target_size=None)
         
+        return self._finish_face(enhanced, target_resolution)
+    
+    def batch_enhance_faces(
+        self,
+        face_images: list,
+        target_resolution: str = "4k"
+    ) -> list:
+        """Mejorar múltiples rostros con una pasada del modelo por bucket de tamaño"""
+        if self.model is None:
+            # Fallback en OpenCV (libera el GIL): un rostro por thread
+            with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as executor:
+                return list(executor.map(
+                    lambda face: self.enhance_face(face, target_resolution), face_images
+                ))
+        
+        enhanced_images = self.batch_enhance(face_images, target_size=None)
+        return [self._finish_face(enhanced, target_resolution) for enhanced in enhanced_images]
+    
+    def _finish_face(self, enhanced: np.ndarray, target_resolution: str) -> np.ndarray:
+        """Redimensionar un rostro ya escalado y aplicar post-procesamiento facial"""
+        target_size = FACE_RESOLUTIONS.get(target_resolution, (512, 512))
+        
         # Redimensionar al tamaño final
         final = cv2.resize(enhanced, target_size, interpolation=cv2.INTER_LANCZOS4)
         
@@ -180,20 +452,86 @@ class SuperResolutionModule:
     ) -> list:
         """
         Mejorar múltiples imágenes en batch
-        Más eficiente que procesar una por una
+        
+        Los recortes se agrupan en buckets de tamaño, se rellenan (reflect) a la
+        forma común del bucket y se procesan con una sola pasada de RRDBNet por
+        bucket (partida sólo si no cabe en memoria); la salida se recorta al
+        tamaño escalado de cada original. Las imágenes que no se pueden apilar
+        (sin modelo, grises/alpha o que requieren tiles) se procesan en threads.
         """
-        enhanced_images = []
+        enhanced_images = [None] * len(images)
+        buckets = {}
+        unstackable = []
         
-        for image in images:
-            try:
-                enhanced = self.enhance_image(image, target_size)
-                enhanced_images.append(enhanced)
-            except Exception as e:
-                print(f"Error mejorando imagen: {e}")
-                enhanced_images.append(image)  # Retornar original en caso de error
+        for idx, image in enumerate(images):
+            if self._is_stackable(image):
+                height, width = image.shape[:2]
+                bucket = (
+                    -(-height // BATCH_BUCKET_SIZE) * BATCH_BUCKET_SIZE,
+                    -(-width // BATCH_BUCKET_SIZE) * BATCH_BUCKET_SIZE
+                )
+                buckets.setdefault(bucket, []).append(idx)
+            else:
+                unstackable.append(idx)
+        
+        max_pixels = self._max_inference_pixels() if buckets else 0
+        for (bucket_h, bucket_w), indices in buckets.items():
+            per_pass = max(1, max_pixels // (bucket_h * bucket_w))
+            for start in range(0, len(indices), per_pass):
+                chunk = indices[start:start + per_pass]
+                batch = np.stack([
+                    self._pad_to(images[i], bucket_h, bucket_w) for i in chunk
+                ])
+                try:
+                    outputs = self._infer(batch)
+                except Exception as e:
+                    print(f"Error en batch Real-ESRGAN ({bucket_h}x{bucket_w}): {e}")
+                    unstackable.extend(chunk)
+                    continue
+                
+                for i, output in zip(chunk, outputs):
+                    height, width = images[i].shape[:2]
+                    enhanced = output[:height * self.scale, :width * self.scale]
+                    if target_size:
+                        enhanced = cv2.resize(enhanced, target_size, interpolation=cv2.INTER_LANCZOS4)
+                    enhanced_images[i] = np.ascontiguousarray(enhanced)
+        
+        if unstackable:
+            # OpenCV y torch liberan el GIL: paralelismo real en CPU
+            workers = self.tile_workers if self.net is not None else (os.cpu_count() or 1)
+            with ThreadPoolExecutor(max_workers=min(workers, len(unstackable))) as executor:
+                results = executor.map(
+                    lambda i: self._safe_enhance(images[i], target_size), unstackable
+                )
+                for i, enhanced in zip(unstackable, results):
+                    enhanced_images[i] = enhanced
         
         return enhanced_images
     
+    def _is_stackable(self, image: np.ndarray) -> bool:
+        """Imagen BGR uint8 que cabe completa en una pasada del modelo"""
+        return (
+            self.net is not None
+            and image.ndim == 3 and image.shape[2] == 3 and image.dtype == np.uint8
+            and image.size > 0
+            and self.choose_tile_size(*image.shape[:2]) == 0
+        )
+    
+    @staticmethod
+    def _pad_to(image: np.ndarray, height: int, width: int) -> np.ndarray:
+        """Rellenar abajo/derecha por reflexión hasta la forma del bucket"""
+        return cv2.copyMakeBorder(
+            image, 0, height - image.shape[0], 0, width - image.shape[1], cv2.BORDER_REFLECT
+        )
+    
+    def _safe_enhance(self, image: np.ndarray, target_size: Optional[tuple]) -> np.ndarray:
+        """enhance_image que retorna el original en caso de error"""
+        try:
+            return self.enhance_image(image, target_size)
+        except Exception as e:
+            print(f"Error mejorando imagen: {e}")
+            return image  # Retornar original en caso de error
+    
     def compare_quality(
         self,
         original: np.ndarray,
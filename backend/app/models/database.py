@@ -1,7 +1,13 @@
 """
 Configuración de base de datos PostgreSQL con soporte pgvector
+
+Dos caminos hacia la misma base:
+- Sync (psycopg2, `SessionLocal` / `get_db`): workers Celery, scripts y endpoints de escritura
+- Async (asyncpg, `AsyncSessionLocal` / `get_async_db`): endpoints de lectura de la API,
+  para que una consulta lenta no bloquee el event loop del worker uvicorn
 """
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
@@ -18,6 +24,26 @@ engine = create_engine(
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+
+def async_database_url(url: str) -> str:
+    """URL de DATABASE_URL con el driver asyncpg"""
+    scheme, _, rest = url.partition("://")
+    return f"postgresql+asyncpg://{rest}" if scheme.startswith("postgresql") else url
+
+
+# Motor async para la API. Los vectores viajan en formato texto (Vector de pgvector
+# serializa a '[...]'), así que no se registra el codec binario de pgvector.asyncpg
+async_engine = create_async_engine(
+    settings.ASYNC_DATABASE_URL or async_database_url(settings.DATABASE_URL),
+    pool_pre_ping=True,
+    pool_size=settings.ASYNC_DB_POOL_SIZE,
+    max_overflow=settings.ASYNC_DB_MAX_OVERFLOW,
+    echo=settings.DEBUG
+)
+
+# expire_on_commit=False: los objetos siguen legibles al serializar la respuesta
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 def get_db():
     """Dependency para obtener sesión de base de datos"""
     db = SessionLocal()
@@ -26,6 +52,11 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    """Dependency para obtener sesión async (endpoints de lectura)"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
 def init_db():
     """Inicializar base de datos y extensiones"""
     from sqlalchemy import text
@@ -6,7 +6,7 @@ from datetime import datetime
 from enum import Enum as PyEnum
 from sqlalchemy import (
     Column, Integer, String, DateTime, ForeignKey, 
-    Boolean, Text, Float, Enum, JSON, Index
+    Boolean, Text, Float, Enum, JSON, Index, LargeBinary, text
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import UUID, JSONB
@@ -58,6 +58,10 @@ class User(Base):
     videos = relationship("Video", back_populates="user", cascade="all, delete-orphan")
     alerts = relationship("Alert", foreign_keys="Alert.user_id", back_populates="user", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index('idx_user_created', 'created_at', 'id'),
+    )
+
 
 class Video(Base):
     """Modelo de Video con cadena de custodia"""
@@ -71,6 +75,7 @@ class Video(Base):
     # Almacenamiento en Cloud
     s3_url = Column(String(1000))
     thumbnail_url = Column(String(1000))
+    thumbnail_renditions = Column(JSONB)  # {tile|preview|full: {url, width, height, bytes, content_type}}
     
     # Metadata del video
     duration = Column(Float)  # segundos
@@ -78,6 +83,7 @@ class Video(Base):
     resolution = Column(String(50))  # e.g., "1920x1080"
     codec = Column(String(50))
     file_size = Column(Integer)  # bytes
+    camera_id = Column(String(100), index=True)  # Cámara / fuente de la grabación
     
     # Estado y procesamiento
     status = Column(Enum(VideoStatus), default=VideoStatus.UPLOADED)
@@ -106,7 +112,8 @@ class Video(Base):
 
     __table_args__ = (
         Index('idx_video_user_status', 'user_id', 'status'),
-        Index('idx_video_created', 'uploaded_at'),
+        Index('idx_video_uploaded_keyset', 'uploaded_at', 'id'),  # Paginación por cursor
+        Index('idx_video_user_uploaded', 'user_id', 'uploaded_at', 'id'),
     )
 
 
@@ -167,10 +174,16 @@ class FaceEmbedding(Base):
     # URL de imagen de la cara extraída
     face_image_url = Column(String(1000))
     enhanced_face_url = Column(String(1000))  # Versión mejorada con Real-ESRGAN
+    face_renditions = Column(JSONB)  # Renditions del recorte original (tile, preview, full)
+    enhanced_face_renditions = Column(JSONB)  # Renditions de la versión mejorada
     
     # Marcado por investigadores
     is_person_of_interest = Column(Boolean, default=False)
     poi_label = Column(String(255))  # Etiqueta personalizada
+    poi_marked_at = Column(DateTime)  # Último cambio de la marca POI (refresco incremental de la watchlist)
+
+    # Identidad asignada por el clustering (NULL = pendiente de asignar)
+    identity_id = Column(UUID(as_uuid=True), ForeignKey("face_identities.id"))
     notes = Column(Text)
     
     detected_at = Column(DateTime, default=datetime.utcnow)
@@ -178,13 +191,18 @@ class FaceEmbedding(Base):
     # Relaciones
     video = relationship("Video", back_populates="face_embeddings")
     matches = relationship("FaceMatch", foreign_keys="FaceMatch.query_face_id", back_populates="query_face")
+    identity = relationship("FaceIdentity", back_populates="faces")
 
+    # El índice vectorial (HNSW / IVFFlat) lo gestiona VectorIndexManager:
+    # IVFFlat debe entrenarse con datos, no al crear la tabla vacía
     __table_args__ = (
-        Index('idx_face_video', 'video_id'),
-        Index('idx_face_poi', 'is_person_of_interest'),
-        # Índice IVFFlat para búsqueda rápida de vectores
-        Index('idx_face_embedding', 'embedding', postgresql_using='ivfflat', 
-              postgresql_with={'lists': 100}, postgresql_ops={'embedding': 'vector_cosine_ops'}),
+        Index('idx_face_video_frame', 'video_id', 'frame_number', 'id'),  # También cubre filtros por video_id
+        # Índice parcial: sólo las caras marcadas (búsquedas y listados de POI)
+        Index('idx_face_poi_only', 'video_id', postgresql_where=text('is_person_of_interest')),
+        Index('idx_face_poi_marked', 'poi_marked_at', postgresql_where=text('poi_marked_at IS NOT NULL')),
+        # Apariciones de una identidad y cola de caras pendientes de clustering
+        Index('idx_face_identity', 'identity_id', 'video_id', 'timestamp_in_video'),
+        Index('idx_face_unclustered', 'detected_at', postgresql_where=text('identity_id IS NULL')),
     )
 
 
@@ -196,7 +214,7 @@ class FaceMatch(Base):
     query_face_id = Column(UUID(as_uuid=True), ForeignKey("face_embeddings.id"), nullable=False)
     matched_face_id = Column(UUID(as_uuid=True), ForeignKey("face_embeddings.id"), nullable=False)
     
-    # Similitud (distancia coseno: 0-2, donde 0 es idéntico)
+    # Similitud (1 - distancia coseno: -1 a 1, donde 1 es idéntico)
     similarity_score = Column(Float, nullable=False)
     
     # Flag si es confirmado por investigador
@@ -212,6 +230,54 @@ class FaceMatch(Base):
     __table_args__ = (
         Index('idx_match_query', 'query_face_id'),
         Index('idx_match_similarity', 'similarity_score'),
+        Index('idx_match_matched', 'matched_face_id'),
+        # Aristas escritas en bloque por el clustering (par canónico, sin duplicados)
+        Index('idx_match_pair', 'query_face_id', 'matched_face_id', unique=True),
+    )
+
+
+class FaceIdentity(Base):
+    """Identidad: grupo de caras de la misma persona (clustering global de embeddings)"""
+    __tablename__ = "face_identities"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    label = Column(String(255))  # Nombre asignado por un investigador
+
+    # Cara más representativa (mayor confianza de detección); sin FK para evitar el ciclo
+    representative_face_id = Column(UUID(as_uuid=True))
+
+    # Estadísticas recalculadas al asignar / re-agrupar
+    face_count = Column(Integer, default=0)
+    video_count = Column(Integer, default=0)
+    first_seen_at = Column(DateTime)
+    last_seen_at = Column(DateTime)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Relaciones
+    faces = relationship("FaceEmbedding", back_populates="identity")
+
+
+class IdentityCooccurrence(Base):
+    """Co-apariciones de dos identidades en un video (par canónico identity_a < identity_b)"""
+    __tablename__ = "identity_cooccurrences"
+
+    identity_a = Column(UUID(as_uuid=True), ForeignKey("face_identities.id", ondelete="CASCADE"), primary_key=True)
+    identity_b = Column(UUID(as_uuid=True), ForeignKey("face_identities.id", ondelete="CASCADE"), primary_key=True)
+    video_id = Column(UUID(as_uuid=True), ForeignKey("videos.id", ondelete="CASCADE"), primary_key=True)
+
+    # Evidencia: pares de apariciones dentro de la ventana y rango de tiempo en el video
+    occurrences = Column(Integer, nullable=False)
+    first_timestamp = Column(Float)
+    last_timestamp = Column(Float)
+
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # identity_a se resuelve con la PK; el otro lado del par necesita su propio índice
+        Index('idx_cooccurrence_b', 'identity_b'),
+        Index('idx_cooccurrence_video', 'video_id'),
     )
 
 
@@ -250,6 +316,62 @@ class DetectedObject(Base):
     )
 
 
+class ObjectTrack(Base):
+    """Detecciones de un mismo objeto enlazadas entre frames (IoU + clase) en una sola fila"""
+    __tablename__ = "object_tracks"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    video_id = Column(UUID(as_uuid=True), ForeignKey("videos.id", ondelete="CASCADE"), nullable=False)
+
+    object_class = Column(String(100), nullable=False)
+    start_frame = Column(Integer, nullable=False)
+    end_frame = Column(Integer, nullable=False)
+    start_time = Column(Float)  # segundos en el video
+    end_time = Column(Float)
+    detection_count = Column(Integer, nullable=False)
+
+    # Confianza máxima y frame donde se alcanzó
+    peak_confidence = Column(Float)
+    peak_frame = Column(Integer)
+
+    # Trayectoria: puntos clave int32 (frame - start_frame, x, y, width, height); ver object_tracker
+    trajectory = Column(LargeBinary, nullable=False)
+    trajectory_points = Column(Integer, nullable=False)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('idx_track_video_time', 'video_id', 'start_time', 'id'),  # Paginación por cursor
+        Index('idx_track_class', 'object_class'),
+    )
+
+
+class VideoObjectSummary(Base):
+    """Resumen materializado de detecciones por video y clase (triage sin recorrer detected_objects)"""
+    __tablename__ = "video_object_summaries"
+
+    video_id = Column(UUID(as_uuid=True), ForeignKey("videos.id", ondelete="CASCADE"), primary_key=True)
+    object_class = Column(String(100), primary_key=True)
+
+    # Desnormalizado del video: filtros por fecha y dueño sin JOIN
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    recorded_at = Column(DateTime)  # COALESCE(recorded_at, uploaded_at) del video
+
+    detection_count = Column(Integer, nullable=False)
+    frame_count = Column(Integer, nullable=False)  # Frames con al menos una detección
+    first_seen = Column(Float)  # segundos en el video
+    last_seen = Column(Float)
+    max_confidence = Column(Float)
+    minute_histogram = Column(JSONB)  # Detecciones por minuto de video: [n_min0, n_min1, ...]
+
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        Index('idx_object_summary_class_time', 'object_class', 'recorded_at', 'video_id'),  # Paginación por cursor
+        Index('idx_object_summary_user_class', 'user_id', 'object_class', 'recorded_at', 'video_id'),
+    )
+
+
 class MotionHeatmap(Base):
     """Heatmaps de movimiento para visualización"""
     __tablename__ = "motion_heatmaps"
@@ -260,6 +382,7 @@ class MotionHeatmap(Base):
     # Datos del heatmap
     heatmap_data = Column(JSONB)  # Matriz de calor serializada
     heatmap_image_url = Column(String(1000))  # Visualización renderizada
+    heatmap_renditions = Column(JSONB)
     
     # Segmento temporal
     start_time = Column(Float)  # segundos
@@ -343,6 +466,7 @@ class Alert(Base):
 
     __table_args__ = (
         Index('idx_alert_user_status', 'user_id', 'is_read'),
+        Index('idx_alert_user_created', 'user_id', 'created_at', 'id'),
         Index('idx_alert_level', 'alert_level'),
     )
 
@@ -373,3 +497,22 @@ class ForensicReport(Base):
         Index('idx_report_video', 'video_id'),
         Index('idx_report_user', 'generated_by'),
     )
+
+
+class VectorIndexState(Base):
+    """Estado de los índices vectoriales gestionados (construcción, parámetros, calibración)"""
+    __tablename__ = "vector_index_state"
+
+    index_name = Column(String(100), primary_key=True)
+    table_name = Column(String(100), nullable=False)
+    index_type = Column(String(20), nullable=False)  # "hnsw" | "ivfflat"
+    params = Column(JSONB)  # {"m", "ef_construction"} o {"lists"}
+    quantization = Column(String(20), default="none")  # Expresión indexada: none | halfvec | binary
+
+    # Filas al construir: base para decidir el re-entrenamiento de IVFFlat
+    rows_at_build = Column(Integer, default=0)
+    build_seconds = Column(Float)
+    built_at = Column(DateTime, default=datetime.utcnow)
+
+    # Recall objetivo -> probes / ef_search medidos (ver scripts/benchmark_face_search.py)
+    recall_profile = Column(JSONB)
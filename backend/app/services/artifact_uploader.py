@@ -0,0 +1,187 @@
+"""
+Subida concurrente de artefactos (caras, thumbnails, heatmaps) a storage
+
+Las imágenes ya codificadas se encolan y se suben en paralelo con concurrencia
+acotada, de modo que la latencia de S3 se solapa con la inferencia. Cada subida
+puede apuntar a una columna de una fila (modelo, id, campo); las URLs resultantes
+se escriben en la base de datos en bloque con bulk_update_mappings.
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+from typing import Optional, Tuple
+
+from app.core.config import settings
+from app.services.renditions import pick_rendition
+from app.services.storage_service import StorageService
+
+
+class ArtifactUploader:
+    """Cola de subidas con concurrencia acotada, reintentos y resolución de URLs en bloque"""
+    
+    def __init__(
+        self,
+        storage: Optional[StorageService] = None,
+        max_concurrency: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        max_retries: Optional[int] = None
+    ):
+        """
+        Args:
+            storage: Servicio de almacenamiento (cliente S3 compartido)
+            max_concurrency: Subidas simultáneas
+            max_pending: Subidas encoladas + en curso; submit() bloquea al alcanzarlo
+                (acota la memoria ocupada por imágenes codificadas)
+            max_retries: Reintentos por subida con backoff exponencial
+        """
+        self.storage = storage or StorageService()
+        self.max_retries = max_retries if max_retries is not None else settings.ARTIFACT_UPLOAD_MAX_RETRIES
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency or settings.ARTIFACT_UPLOAD_CONCURRENCY,
+            thread_name_prefix="artifact-upload"
+        )
+        self._slots = threading.BoundedSemaphore(max_pending or settings.ARTIFACT_UPLOAD_MAX_PENDING)
+        self._targets = []  # (future, model, row_id, field, transform) pendientes de resolver
+        self._counter_lock = threading.Lock()
+        self.uploaded = 0
+        self.failed = 0
+    
+    def submit(
+        self,
+        content: bytes,
+        filename: str,
+        folder: str,
+        content_type: str = "image/jpeg",
+        target: Optional[Tuple] = None,
+        fallback_local: bool = True
+    ) -> Future:
+        """
+        Encolar una subida
+        
+        Args:
+            target: (Modelo, id, campo) donde registrar la URL al resolver
+            fallback_local: Guardar en disco local si fallan todos los reintentos
+                (False para objetos que deben quedar en el bucket: la subida falla)
+        """
+        self._slots.acquire()
+        future = self._executor.submit(self._upload, content, filename, folder, content_type, fallback_local)
+        future.add_done_callback(lambda _: self._slots.release())
+        
+        if target is not None:
+            self.register(future, target)
+        return future
+    
+    def register(self, future: Future, target: Tuple, value=None):
+        """
+        Registrar (Modelo, id, campo) para escribir al resolver, sólo si `future` terminó sin error
+        
+        Args:
+            value: Valor a escribir en lugar del resultado de la subida (p.ej. la
+                URL de un recorte dentro de un shard, conocida de antemano)
+        """
+        model, row_id, field = target
+        self._targets.append((future, model, row_id, field, None if value is None else (lambda _: value)))
+    
+    def submit_renditions(
+        self,
+        renditions: dict,
+        stem: str,
+        folder: str,
+        target: Optional[Tuple] = None,
+        url_field: Optional[str] = None
+    ) -> Future:
+        """
+        Encolar la subida de un set de renditions ({nombre: Rendition}) como "{stem}_{nombre}"
+        
+        Args:
+            target: (Modelo, id, campo) donde registrar el dict de renditions
+            url_field: Campo del mismo registro que recibe la URL de la rendition más grande
+        """
+        self._slots.acquire()
+        future = self._executor.submit(self._upload_renditions, renditions, stem, folder)
+        future.add_done_callback(lambda _: self._slots.release())
+        
+        if target is not None:
+            model, row_id, field = target
+            self._targets.append((future, model, row_id, field, None))
+            if url_field:
+                self._targets.append((future, model, row_id, url_field, _largest_url))
+        return future
+    
+    def resolve(self, db, wait_all: bool = False) -> int:
+        """
+        Escribir en bloque las URLs de las subidas terminadas
+        
+        Las filas destino ya deben existir en la base de datos (commit previo).
+        
+        Args:
+            wait_all: Esperar todas las subidas pendientes (al final del procesamiento)
+        
+        Returns:
+            Número de filas actualizadas
+        """
+        if wait_all:
+            wait([target[0] for target in self._targets])
+        
+        mappings = {}  # modelo -> {id: {campo: url}}
+        remaining = []
+        for future, model, row_id, field, transform in self._targets:
+            if not future.done():
+                remaining.append((future, model, row_id, field, transform))
+                continue
+            if future.exception() is not None:
+                continue  # Ya contabilizada en self.failed
+            row = mappings.setdefault(model, {}).setdefault(row_id, {"id": row_id})
+            row[field] = transform(future.result()) if transform else future.result()
+        
+        self._targets = remaining
+        updated = 0
+        for model, rows in mappings.items():
+            db.bulk_update_mappings(model, list(rows.values()))
+            updated += len(rows)
+        return updated
+    
+    def close(self):
+        """Esperar las subidas en curso y liberar los threads"""
+        self._executor.shutdown(wait=True)
+    
+    def _upload_renditions(self, renditions: dict, stem: str, folder: str) -> dict:
+        """Subir cada rendition de un set y retornar su metadata con URL"""
+        return {
+            name: rendition.metadata(self._upload(
+                rendition.content, f"{stem}_{name}{rendition.extension}", folder, rendition.content_type
+            ))
+            for name, rendition in renditions.items()
+        }
+    
+    def _upload(
+        self,
+        content: bytes,
+        filename: str,
+        folder: str,
+        content_type: str,
+        fallback_local: bool = True
+    ) -> str:
+        """Subir con reintentos (backoff exponencial con jitter); último recurso: storage local"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                url = self.storage.put_bytes(
+                    content, filename, folder, content_type,
+                    fallback_local=fallback_local and attempt == self.max_retries
+                )
+                with self._counter_lock:
+                    self.uploaded += 1
+                return url
+            except Exception as e:
+                if attempt == self.max_retries:
+                    with self._counter_lock:
+                        self.failed += 1
+                    print(f"Error subiendo {folder}/{filename}: {e}")
+                    raise
+                time.sleep(min(2 ** attempt * 0.2, 5.0) * (0.5 + random.random()))
+
+
+def _largest_url(renditions: dict) -> str:
+    """URL de la rendition más grande (compatibilidad con las columnas *_url)"""
+    return pick_rendition(renditions)["url"]
@@ -0,0 +1,223 @@
+"""
+Persistencia en bloque de detecciones (DetectedObject), tracks (ObjectTrack) y embeddings (FaceEmbedding)
+
+Las filas se acumulan en forma columnar (una lista por columna) y se escriben por
+lotes dentro de la transacción de la sesión, sin instancias ORM ni unit-of-work:
+- "copy": COPY ... FROM STDIN en formato binario de Postgres (vectores pgvector
+  incluidos, float4 big-endian) - la opción más rápida
+- "executemany": INSERT multi-fila de SQLAlchemy (insertmanyvalues), para otros
+  dialectos o como alternativa
+"""
+import io
+import json
+import struct
+import uuid
+from datetime import datetime, timezone
+from typing import Optional
+
+import numpy as np
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import Boolean, DateTime, Float, Integer, LargeBinary, String, Text
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.models import DetectedObject, FaceEmbedding, ObjectTrack
+
+
+# Formato binario de COPY: firma, flags y longitud de extensión del header
+_COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+_COPY_TRAILER = struct.pack(">h", -1)
+_PG_EPOCH = datetime(2000, 1, 1)
+
+
+def _encode_vector(value) -> bytes:
+    """vector de pgvector: dim (int16), reservado (int16) y float4 big-endian"""
+    array = np.asarray(value, dtype=">f4")
+    return struct.pack(">HH", array.shape[0], 0) + array.tobytes()
+
+
+def _encode_timestamp(value: datetime) -> bytes:
+    """timestamp sin zona: microsegundos desde 2000-01-01 (los valores con zona se pasan a UTC)"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    delta = value - _PG_EPOCH
+    return struct.pack(">q", (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds)
+
+
+def _binary_encoder(column_type):
+    """Codificador binario de COPY según el tipo de la columna"""
+    if isinstance(column_type, Vector):
+        return _encode_vector
+    if isinstance(column_type, UUID):
+        return lambda value: (value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))).bytes
+    if isinstance(column_type, JSONB):
+        return lambda value: b"\x01" + json.dumps(value).encode()
+    if isinstance(column_type, Boolean):
+        return lambda value: b"\x01" if value else b"\x00"
+    if isinstance(column_type, Integer):
+        return lambda value: struct.pack(">i", int(value))
+    if isinstance(column_type, Float):
+        return lambda value: struct.pack(">d", float(value))
+    if isinstance(column_type, DateTime):
+        return _encode_timestamp
+    if isinstance(column_type, LargeBinary):
+        return bytes
+    if isinstance(column_type, (String, Text)):
+        return lambda value: str(value).encode()
+    raise TypeError(f"Tipo de columna sin codificador COPY: {column_type!r}")
+
+
+class _RowContext:
+    """Contexto mínimo para defaults que reciben el contexto de ejecución (sólo ven la fila)"""
+    
+    def __init__(self, row: dict):
+        self.current_parameters = row
+    
+    def get_current_parameters(self, isolate_multiinsert_groups: bool = True) -> dict:
+        return self.current_parameters
+
+
+def _column_default(column, row: dict):
+    """
+    Default Python del modelo para una columna omitida (None si no tiene)
+    
+    SQLAlchemy envuelve los callables sin argumentos como fn(context), así que
+    todos los callables se invocan con un contexto que expone la fila.
+    
+    Raises:
+        TypeError: default SQL (sólo lo puede evaluar la base de datos)
+    """
+    default = column.default
+    if default is None:
+        return None
+    if default.is_scalar:
+        return default.arg
+    if default.is_callable:
+        return default.arg(_RowContext(row))
+    raise TypeError(f"Default no soportado en escritura en bloque: {column.name}")
+
+
+class ColumnarBuffer:
+    """Filas pendientes de una tabla, almacenadas por columna"""
+    
+    def __init__(self, model):
+        self.table = model.__table__
+        self.columns = list(self.table.columns)
+        self.data = {column.name: [] for column in self.columns}
+        self._encoders = None
+    
+    def __len__(self) -> int:
+        return len(self.data["id"])
+    
+    def append(self, values: dict):
+        """Agregar una fila; las columnas omitidas toman su default del modelo (o NULL)"""
+        row = dict(values)
+        for column in self.columns:
+            if column.name not in row:
+                row[column.name] = _column_default(column, row)
+            self.data[column.name].append(row[column.name])
+    
+    def rows(self) -> list:
+        """Filas como dicts (para executemany)"""
+        names = list(self.data)
+        return [dict(zip(names, values)) for values in zip(*self.data.values())]
+    
+    def copy_payload(self) -> io.BytesIO:
+        """Contenido binario para COPY ... FROM STDIN (FORMAT binary)"""
+        if self._encoders is None:
+            self._encoders = [_binary_encoder(column.type) for column in self.columns]
+        
+        payload = io.BytesIO()
+        payload.write(_COPY_HEADER)
+        field_count = struct.pack(">h", len(self.columns))
+        null = struct.pack(">i", -1)
+        columns = [self.data[column.name] for column in self.columns]
+        
+        for row in zip(*columns):
+            payload.write(field_count)
+            for encode, value in zip(self._encoders, row):
+                if value is None:
+                    payload.write(null)
+                    continue
+                encoded = encode(value)
+                payload.write(struct.pack(">i", len(encoded)))
+                payload.write(encoded)
+        
+        payload.write(_COPY_TRAILER)
+        payload.seek(0)
+        return payload
+    
+    def clear(self):
+        for values in self.data.values():
+            values.clear()
+
+
+class BulkDetectionWriter:
+    """Buffer de detecciones y embeddings con escritura por lotes"""
+    
+    def __init__(self, db: Session, batch_size: Optional[int] = None, method: Optional[str] = None):
+        """
+        Args:
+            db: Sesión cuya transacción recibe las filas (el commit lo hace el llamador)
+            batch_size: Filas pendientes (objetos + tracks + caras) que disparan la escritura
+            method: "copy" o "executemany" (por defecto BULK_INSERT_METHOD)
+        """
+        self.db = db
+        self.batch_size = batch_size or settings.BULK_INSERT_BATCH_SIZE
+        self.method = method or settings.BULK_INSERT_METHOD
+        if self.method == "copy" and db.get_bind().dialect.name != "postgresql":
+            self.method = "executemany"
+        
+        self.objects = ColumnarBuffer(DetectedObject)
+        self.tracks = ColumnarBuffer(ObjectTrack)
+        self.faces = ColumnarBuffer(FaceEmbedding)
+        self.rows_written = 0
+    
+    @property
+    def pending(self) -> int:
+        return len(self.objects) + len(self.tracks) + len(self.faces)
+    
+    @property
+    def is_full(self) -> bool:
+        return self.pending >= self.batch_size
+    
+    def add_object(self, **values):
+        """Agregar un DetectedObject (columnas del modelo como kwargs)"""
+        values.setdefault("id", uuid.uuid4())
+        self.objects.append(values)
+    
+    def add_track(self, **values):
+        """Agregar un ObjectTrack (columnas del modelo como kwargs; trayectoria ya codificada)"""
+        values.setdefault("id", uuid.uuid4())
+        self.tracks.append(values)
+    
+    def add_face(self, **values):
+        """Agregar un FaceEmbedding (columnas del modelo como kwargs; embedding como array)"""
+        values.setdefault("id", uuid.uuid4())
+        self.faces.append(values)
+    
+    def flush(self) -> int:
+        """Escribir las filas pendientes en la transacción actual; retorna filas escritas"""
+        written = 0
+        for buffer in (self.objects, self.tracks, self.faces):
+            if not len(buffer):
+                continue
+            if self.method == "copy":
+                self._copy(buffer)
+            else:
+                self.db.execute(buffer.table.insert(), buffer.rows())
+            written += len(buffer)
+            buffer.clear()
+        
+        self.rows_written += written
+        return written
+    
+    def _copy(self, buffer: ColumnarBuffer):
+        """COPY binario con el cursor psycopg2 de la conexión de la sesión"""
+        column_names = ", ".join(f'"{column.name}"' for column in buffer.columns)
+        statement = f'COPY "{buffer.table.name}" ({column_names}) FROM STDIN WITH (FORMAT binary)'
+        
+        raw_connection = self.db.connection().connection.driver_connection
+        with raw_connection.cursor() as cursor:
+            cursor.copy_expert(statement, buffer.copy_payload())
@@ -0,0 +1,157 @@
+"""
+Índice de co-apariciones entre identidades ("quién aparece junto a quién")
+
+Por video, dos identidades co-aparecen cuando sus caras están a menos de
+FACE_COOCCURRENCE_WINDOW_SECONDS en timestamp_in_video. El índice se reconstruye
+por video (idempotente) cuando sus caras tienen identidad o cambian de identidad
+tras un re-agrupamiento, y la consulta por identidad es una lectura indexada.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.models import FaceEmbedding, IdentityCooccurrence
+
+
+class CooccurrenceIndex:
+    """Construcción por video y consulta por identidad"""
+    
+    def __init__(self, window_seconds: Optional[float] = None):
+        self.window = window_seconds if window_seconds is not None else settings.FACE_COOCCURRENCE_WINDOW_SECONDS
+    
+    def pairs_for_video(self, appearances: List) -> Dict:
+        """
+        Pares de identidades dentro de la ventana (ventana deslizante sobre el tiempo)
+        
+        Args:
+            appearances: (identity_id, timestamp) ordenadas por timestamp
+        
+        Returns:
+            {(identity_a, identity_b): [apariciones, primer timestamp, último timestamp]}
+        """
+        pairs = {}
+        start = 0
+        for end, (identity, timestamp) in enumerate(appearances):
+            while timestamp - appearances[start][1] > self.window:
+                start += 1
+            for other, other_timestamp in appearances[start:end]:
+                if other == identity:
+                    continue
+                key = (identity, other) if str(identity) < str(other) else (other, identity)
+                evidence = pairs.get(key)
+                if evidence is None:
+                    pairs[key] = [1, other_timestamp, timestamp]
+                else:
+                    evidence[0] += 1
+                    evidence[2] = timestamp
+        return pairs
+    
+    def build_video(self, db: Session, video_id) -> int:
+        """Reconstruir las co-apariciones de un video en la transacción actual; retorna pares"""
+        rows = (
+            db.query(FaceEmbedding.identity_id, FaceEmbedding.timestamp_in_video)
+            .filter(
+                FaceEmbedding.video_id == video_id,
+                FaceEmbedding.identity_id.isnot(None),
+                FaceEmbedding.timestamp_in_video.isnot(None)
+            )
+            .distinct()  # Detecciones repetidas de la misma identidad en el mismo instante
+            .order_by(FaceEmbedding.timestamp_in_video)
+            .all()
+        )
+        pairs = self.pairs_for_video(rows)
+        
+        db.query(IdentityCooccurrence).filter(IdentityCooccurrence.video_id == video_id).delete(synchronize_session=False)
+        if pairs:
+            now = datetime.utcnow()
+            db.execute(
+                pg_insert(IdentityCooccurrence).on_conflict_do_nothing(),
+                [
+                    {
+                        "identity_a": identity_a,
+                        "identity_b": identity_b,
+                        "video_id": video_id,
+                        "occurrences": occurrences,
+                        "first_timestamp": first,
+                        "last_timestamp": last,
+                        "updated_at": now
+                    }
+                    for (identity_a, identity_b), (occurrences, first, last) in pairs.items()
+                ]
+            )
+        return len(pairs)
+    
+    def related(
+        self,
+        db: Session,
+        identity_id,
+        limit: int = 20,
+        evidence_limit: int = 5,
+        owner_id=None
+    ) -> List[dict]:
+        """
+        Identidades que co-aparecen con `identity_id`, ordenadas por videos compartidos
+        
+        Args:
+            evidence_limit: Videos de evidencia por identidad (los de más apariciones)
+            owner_id: Restringir la evidencia a videos de este usuario
+        
+        Returns:
+            [{identity_id, label, representative_face_id, face_count, videos, occurrences, evidence}]
+        """
+        owner_filter = "AND v.user_id = CAST(:owner_id AS uuid)" if owner_id else ""
+        rows = db.execute(
+            text(f"""
+                SELECT
+                    c.other AS identity_id,
+                    fi.label, fi.representative_face_id, fi.face_count,
+                    count(*) AS videos,
+                    sum(c.occurrences) AS occurrences,
+                    array_to_json((array_agg(json_build_object(
+                        'video_id', c.video_id,
+                        'video_filename', v.filename,
+                        'first_timestamp', c.first_timestamp,
+                        'last_timestamp', c.last_timestamp,
+                        'occurrences', c.occurrences
+                    ) ORDER BY c.occurrences DESC))[1:CAST(:evidence_limit AS int)]) AS evidence
+                FROM (
+                    SELECT identity_b AS other, video_id, occurrences, first_timestamp, last_timestamp
+                    FROM identity_cooccurrences WHERE identity_a = :identity_id
+                    UNION ALL
+                    SELECT identity_a, video_id, occurrences, first_timestamp, last_timestamp
+                    FROM identity_cooccurrences WHERE identity_b = :identity_id
+                ) c
+                JOIN videos v ON v.id = c.video_id {owner_filter}
+                JOIN face_identities fi ON fi.id = c.other
+                GROUP BY c.other, fi.label, fi.representative_face_id, fi.face_count
+                ORDER BY videos DESC, occurrences DESC
+                LIMIT :limit
+            """),
+            {
+                "identity_id": str(identity_id),
+                "owner_id": str(owner_id) if owner_id else None,
+                "evidence_limit": evidence_limit,
+                "limit": limit
+            }
+        ).fetchall()
+        return [dict(row._mapping) for row in rows]
+
+
+def completed_videos(db: Session, video_ids: List) -> List[str]:
+    """Videos sin caras pendientes de identidad (listos para el índice de co-apariciones)"""
+    if not video_ids:
+        return []
+    pending = {
+        str(row.video_id) for row in db.execute(
+            text("""
+                SELECT DISTINCT video_id FROM face_embeddings
+                WHERE video_id = ANY(CAST(:video_ids AS uuid[])) AND identity_id IS NULL
+            """),
+            {"video_ids": [str(video_id) for video_id in video_ids]}
+        )
+    }
+    return [str(video_id) for video_id in video_ids if str(video_id) not in pending]
@@ -0,0 +1,357 @@
+"""
+Clustering global de caras en identidades (FaceIdentity) y aristas FaceMatch
+
+- Incremental: las caras sin identidad se toman por lotes (FOR UPDATE SKIP LOCKED,
+  varios workers en paralelo), se buscan sus vecinas con un k-NN LATERAL sobre el
+  índice vectorial y se asignan a la identidad más votada entre sus vecinas; las
+  caras del lote enlazadas entre sí forman un componente que comparte identidad,
+  y si ninguna vecina tiene identidad se crea una nueva.
+- Re-agrupamiento periódico por bloques de identidades: las identidades unidas
+  por al menos FACE_CLUSTER_MERGE_MIN_EDGES aristas se fusionan.
+- Las aristas (par canónico, distancia coseno) se escriben en bloque en
+  face_matches con ON CONFLICT DO NOTHING.
+
+"Todas las apariciones de esta persona" pasa a ser una lectura por identity_id
+(índice idx_face_identity) en lugar de búsquedas repetidas por umbral.
+"""
+import uuid
+from collections import Counter, defaultdict
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import insert, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.models import FaceEmbedding, FaceIdentity, FaceMatch
+from app.services.face_search_service import search_similar_faces_batch
+
+
+# Asignación (compartido, en paralelo) vs re-agrupamiento (exclusivo)
+CLUSTER_LOCK_KEY = "face_clustering"
+
+
+class _UnionFind:
+    """Componentes conexos de un lote"""
+    
+    def __init__(self):
+        self.parent = {}
+    
+    def find(self, item):
+        self.parent.setdefault(item, item)
+        while self.parent[item] != item:
+            self.parent[item] = self.parent[self.parent[item]]
+            item = self.parent[item]
+        return item
+    
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[root_b] = root_a
+
+
+class FaceClusterer:
+    """Asignación incremental y re-agrupamiento de identidades"""
+    
+    def __init__(
+        self,
+        threshold: Optional[float] = None,
+        neighbors: Optional[int] = None,
+        batch_size: Optional[int] = None
+    ):
+        """
+        Args:
+            threshold: Distancia coseno máxima para considerar la misma persona
+            neighbors: Vecinas consultadas por cara (k del k-NN)
+            batch_size: Caras pendientes por lote
+        """
+        self.threshold = threshold if threshold is not None else settings.FACE_CLUSTER_THRESHOLD
+        self.neighbors = neighbors or settings.FACE_CLUSTER_NEIGHBORS
+        self.batch_size = batch_size or settings.FACE_CLUSTER_BATCH_SIZE
+    
+    # ==================== Asignación incremental ====================
+    
+    def assign_pending(self, db: Session, max_batches: Optional[int] = None) -> dict:
+        """
+        Asignar identidad a las caras pendientes, un lote por transacción
+        
+        Returns:
+            Totales y `video_ids` de las caras asignadas
+        """
+        totals = Counter()
+        video_ids = set()
+        while max_batches is None or totals["batches"] < max_batches:
+            db.execute(text("SELECT pg_advisory_xact_lock_shared(hashtext(:key))"), {"key": CLUSTER_LOCK_KEY})
+            claimed = db.execute(
+                text("""
+                    SELECT id, video_id FROM face_embeddings
+                    WHERE identity_id IS NULL
+                    ORDER BY detected_at
+                    LIMIT :batch_size
+                    FOR UPDATE SKIP LOCKED
+                """),
+                {"batch_size": self.batch_size}
+            ).fetchall()
+            if not claimed:
+                db.rollback()
+                break
+            
+            totals.update(self._assign_batch(db, [row.id for row in claimed]))
+            totals["batches"] += 1
+            db.commit()
+            video_ids.update(row.video_id for row in claimed)
+        
+        return {**totals, "video_ids": [str(video_id) for video_id in video_ids]}
+    
+    def _assign_batch(self, db: Session, face_ids: List) -> Counter:
+        """Vecinas del lote en una consulta, votación por componente y escritura en bloque"""
+        # Las aristas se registran hasta FACE_MATCH_THRESHOLD; el enlace de identidad es más estricto
+        search_threshold = max(self.threshold, settings.FACE_MATCH_THRESHOLD)
+        results = search_similar_faces_batch(
+            db,
+            queries={face_id: search_threshold for face_id in face_ids},
+            threshold=search_threshold,
+            max_results=self.neighbors
+        )
+        
+        batch = set(face_ids)
+        neighbor_ids = {row.id for rows in results.values() for row in rows} - batch
+        identities = dict(
+            db.query(FaceEmbedding.id, FaceEmbedding.identity_id)
+            .filter(FaceEmbedding.id.in_(list(neighbor_ids)), FaceEmbedding.identity_id.isnot(None))
+            .all()
+        ) if neighbor_ids else {}
+        
+        # Componentes del lote y votos (1 - distancia) por identidad existente
+        components = _UnionFind()
+        votes = defaultdict(Counter)
+        for face_id in face_ids:
+            components.find(face_id)
+        for face_id, rows in results.items():
+            for row in rows:
+                if row.distance >= self.threshold:
+                    continue
+                if row.id in batch:
+                    components.union(face_id, row.id)
+                elif row.id in identities:
+                    votes[face_id][identities[row.id]] += 1.0 - row.distance
+        
+        component_votes = defaultdict(Counter)
+        for face_id, face_votes in votes.items():
+            component_votes[components.find(face_id)].update(face_votes)
+        
+        new_identities = []
+        identity_by_root = {}
+        for face_id in face_ids:
+            root = components.find(face_id)
+            if root in identity_by_root:
+                continue
+            if component_votes[root]:
+                identity_by_root[root] = component_votes[root].most_common(1)[0][0]
+            else:
+                identity_id = uuid.uuid4()
+                identity_by_root[root] = identity_id
+                new_identities.append({"id": identity_id, "representative_face_id": root})
+        
+        if new_identities:
+            db.execute(insert(FaceIdentity), new_identities)
+        db.bulk_update_mappings(FaceEmbedding, [
+            {"id": face_id, "identity_id": identity_by_root[components.find(face_id)]}
+            for face_id in face_ids
+        ])
+        
+        edges = self.record_edges(db, (
+            (face_id, row.id, row.distance) for face_id, rows in results.items() for row in rows
+        ))
+        self.refresh_identity_stats(db, set(identity_by_root.values()))
+        
+        return Counter(
+            faces_assigned=len(face_ids),
+            identities_created=len(new_identities),
+            edges_written=edges
+        )
+    
+    # ==================== Aristas y estadísticas ====================
+    
+    def record_edges(self, db: Session, edges: Iterable) -> int:
+        """
+        Escribir aristas FaceMatch en bloque (par canónico; duplicados ignorados)
+        
+        Como en el resto de face_matches, similarity_score guarda la similitud
+        (1 - distancia coseno), no la distancia.
+        
+        Args:
+            edges: (cara, cara vecina, distancia coseno)
+        """
+        pairs = {}
+        for face_a, face_b, distance in edges:
+            if face_a == face_b or distance >= settings.FACE_MATCH_THRESHOLD:
+                continue
+            key = (face_a, face_b) if str(face_a) < str(face_b) else (face_b, face_a)
+            pairs[key] = min(distance, pairs.get(key, distance))
+        if not pairs:
+            return 0
+        
+        db.execute(
+            pg_insert(FaceMatch).on_conflict_do_nothing(index_elements=["query_face_id", "matched_face_id"]),
+            [
+                {"query_face_id": query_id, "matched_face_id": matched_id, "similarity_score": 1 - distance}
+                for (query_id, matched_id), distance in pairs.items()
+            ]
+        )
+        return len(pairs)
+    
+    def refresh_identity_stats(self, db: Session, identity_ids: Iterable):
+        """Recalcular conteos, fechas y cara representativa de las identidades"""
+        identity_ids = [str(identity_id) for identity_id in identity_ids]
+        if not identity_ids:
+            return
+        db.execute(
+            text("""
+                UPDATE face_identities fi SET
+                    face_count = s.faces,
+                    video_count = s.videos,
+                    first_seen_at = s.first_seen,
+                    last_seen_at = s.last_seen,
+                    representative_face_id = s.representative,
+                    updated_at = now()
+                FROM (
+                    SELECT
+                        fe.identity_id,
+                        count(*) AS faces,
+                        count(DISTINCT fe.video_id) AS videos,
+                        min(COALESCE(v.recorded_at, v.uploaded_at)) AS first_seen,
+                        max(COALESCE(v.recorded_at, v.uploaded_at)) AS last_seen,
+                        (array_agg(fe.id ORDER BY fe.confidence DESC NULLS LAST))[1] AS representative
+                    FROM face_embeddings fe
+                    JOIN videos v ON v.id = fe.video_id
+                    WHERE fe.identity_id = ANY(CAST(:identity_ids AS uuid[]))
+                    GROUP BY fe.identity_id
+                ) s
+                WHERE fi.id = s.identity_id
+            """),
+            {"identity_ids": identity_ids}
+        )
+    
+    # ==================== Re-agrupamiento ====================
+    
+    def recluster(self, db: Session, chunk_size: Optional[int] = None) -> dict:
+        """
+        Fusionar identidades unidas por suficientes aristas, por bloques de identidades
+        
+        Cada bloque es una transacción con bloqueo exclusivo frente a la asignación
+        incremental (que lo toma compartido), así nunca se asigna una identidad
+        que se está eliminando.
+        
+        Returns:
+            Totales y `video_ids` cuyas caras cambiaron de identidad
+        """
+        chunk_size = chunk_size or settings.FACE_CLUSTER_RECLUSTER_CHUNK
+        totals = Counter()
+        video_ids = set()
+        last_id = None
+        
+        while True:
+            db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": CLUSTER_LOCK_KEY})
+            chunk = [
+                row.id for row in db.execute(
+                    text("""
+                        SELECT id FROM face_identities
+                        WHERE CAST(:last_id AS uuid) IS NULL OR id > CAST(:last_id AS uuid)
+                        ORDER BY id
+                        LIMIT :chunk_size
+                    """),
+                    {"last_id": str(last_id) if last_id else None, "chunk_size": chunk_size}
+                )
+            ]
+            if not chunk:
+                db.rollback()
+                break
+            
+            merged, affected = self._merge_chunk(db, chunk)
+            totals["identities_merged"] += merged
+            video_ids.update(affected)
+            totals["chunks"] += 1
+            db.commit()
+            last_id = chunk[-1]
+        
+        return {**totals, "video_ids": [str(video_id) for video_id in video_ids]}
+    
+    def _merge_chunk(self, db: Session, chunk: List) -> Tuple[int, set]:
+        """Fusionar las identidades del bloque con las conectadas; retorna (eliminadas, videos afectados)"""
+        pairs = db.execute(
+            text("""
+                WITH chunk_faces AS (
+                    SELECT id, identity_id FROM face_embeddings
+                    WHERE identity_id = ANY(CAST(:chunk AS uuid[]))
+                ),
+                edges AS (
+                    SELECT cf.identity_id AS source, fm.matched_face_id AS other
+                    FROM chunk_faces cf JOIN face_matches fm ON fm.query_face_id = cf.id
+                    WHERE fm.similarity_score > 1 - :threshold
+                    UNION ALL
+                    SELECT cf.identity_id, fm.query_face_id
+                    FROM chunk_faces cf JOIN face_matches fm ON fm.matched_face_id = cf.id
+                    WHERE fm.similarity_score > 1 - :threshold
+                )
+                SELECT e.source, fe.identity_id AS target
+                FROM edges e
+                JOIN face_embeddings fe ON fe.id = e.other
+                WHERE fe.identity_id IS NOT NULL AND fe.identity_id <> e.source
+                GROUP BY e.source, fe.identity_id
+                HAVING count(*) >= :min_edges
+            """),
+            {
+                "chunk": [str(identity_id) for identity_id in chunk],
+                "threshold": self.threshold,
+                "min_edges": settings.FACE_CLUSTER_MERGE_MIN_EDGES
+            }
+        ).fetchall()
+        if not pairs:
+            return 0, set()
+        
+        components = _UnionFind()
+        for source, target in pairs:
+            components.union(source, target)
+        groups = defaultdict(list)
+        for identity_id in list(components.parent):
+            groups[components.find(identity_id)].append(identity_id)
+        
+        face_counts = dict(
+            db.query(FaceIdentity.id, FaceIdentity.face_count)
+            .filter(FaceIdentity.id.in_(list(components.parent)))
+            .all()
+        )
+        merged = 0
+        targets = []
+        video_ids = set()
+        for members in groups.values():
+            # La identidad más grande absorbe al resto (conserva su id y etiqueta)
+            members.sort(key=lambda identity_id: face_counts.get(identity_id) or 0, reverse=True)
+            target, sources = members[0], [str(identity_id) for identity_id in members[1:]]
+            params = {"target": str(target), "sources": sources}
+            video_ids.update(row.video_id for row in db.execute(
+                text("SELECT DISTINCT video_id FROM face_embeddings WHERE identity_id = ANY(CAST(:sources AS uuid[]))"),
+                params
+            ))
+            db.execute(
+                text("UPDATE face_embeddings SET identity_id = :target WHERE identity_id = ANY(CAST(:sources AS uuid[]))"),
+                params
+            )
+            db.execute(
+                text("""
+                    UPDATE face_identities SET label = (
+                        SELECT label FROM face_identities
+                        WHERE id = ANY(CAST(:sources AS uuid[])) AND label IS NOT NULL
+                        LIMIT 1
+                    )
+                    WHERE id = :target AND label IS NULL
+                """),
+                params
+            )
+            db.execute(text("DELETE FROM face_identities WHERE id = ANY(CAST(:sources AS uuid[]))"), params)
+            merged += len(sources)
+            targets.append(target)
+        
+        self.refresh_identity_stats(db, targets)
+        return merged, video_ids
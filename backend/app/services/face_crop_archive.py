@@ -0,0 +1,163 @@
+"""
+Archivos empaquetados de recortes faciales por video
+
+En lugar de un objeto por cara, los recortes de un video se agregan a pocos
+shards (face_archives/{video_id}/{nombre}.bin) con un índice de offsets en JSON.
+La URL de cada cara codifica shard, offset y longitud, de modo que el endpoint
+de servicio la resuelve con una única lectura por rango, sin consultar el índice.
+El índice queda en storage para auditoría, reconstrucción y borrado por video.
+
+Los shards se suben sin fallback a disco local (la lectura por rango va siempre
+al bucket) y las URLs de sus recortes se registran en la fila destino recién al
+resolver la subida del shard (ArtifactUploader.resolve): si el shard falla, la
+fila queda sin URL en lugar de apuntar a un shard inexistente.
+"""
+import json
+import re
+import uuid
+from io import BytesIO
+from typing import Optional, Tuple
+
+from app.core.config import settings
+from app.services.artifact_uploader import ArtifactUploader
+from app.services.renditions import pick_rendition
+from app.services.storage_service import StorageService
+
+
+ARCHIVE_FOLDER = "face_archives"
+CROP_URL_PREFIX = f"{settings.API_V1_STR}/face-crops/"
+_CROP_URL_PATTERN = re.compile(
+    r"^" + re.escape(CROP_URL_PREFIX) + r"(?P<video_id>[0-9a-f-]{36})/(?P<shard>[\w-]+)/(?P<offset>\d+)/(?P<length>\d+)$"
+)
+
+
+def crop_url(video_id, shard: str, offset: int, length: int) -> str:
+    """URL servible de un recorte dentro de un shard"""
+    return f"{CROP_URL_PREFIX}{video_id}/{shard}/{offset}/{length}"
+
+
+def parse_crop_url(url: str) -> Optional[Tuple[str, str, int, int]]:
+    """(video_id, shard, offset, length) de una URL empaquetada; None si es un objeto individual"""
+    match = _CROP_URL_PATTERN.match(url or "")
+    if not match:
+        return None
+    return match["video_id"], match["shard"], int(match["offset"]), int(match["length"])
+
+
+def shard_key(video_id, shard: str) -> str:
+    """Key de storage de un shard"""
+    return f"{ARCHIVE_FOLDER}/{video_id}/{shard}.bin"
+
+
+def read_crop(storage: StorageService, url: str) -> bytes:
+    """Leer un recorte desde su URL, sea empaquetada (lectura por rango) u objeto individual"""
+    location = parse_crop_url(url)
+    if location is None:
+        return storage.get_bytes(storage.key_from_url(url))
+    
+    video_id, shard, offset, length = location
+    return storage.read_range(shard_key(video_id, shard), offset, length)
+
+
+class FaceCropArchiveWriter:
+    """Agrega recortes de un video a shards y los sube al completarse cada uno"""
+    
+    def __init__(
+        self,
+        video_id,
+        kind: str,
+        uploader: ArtifactUploader,
+        shard_max_bytes: Optional[int] = None
+    ):
+        """
+        Args:
+            video_id: Video al que pertenecen los recortes
+            kind: "faces" o "faces_enhanced" (prefijo de shards e índice)
+            uploader: Cola de subidas compartida con el resto de artefactos
+            shard_max_bytes: Tamaño a partir del cual se cierra un shard
+        """
+        self.video_id = video_id
+        self.uploader = uploader
+        self.shard_max_bytes = shard_max_bytes or settings.FACE_CROP_SHARD_MAX_MB * 1024 * 1024
+        # Token por escritor: un reproceso o un lote de enhance_face_task no pisa shards previos
+        self.prefix = f"{kind}-{uuid.uuid4().hex[:8]}"
+        self.index = {}  # face_id[/rendition] -> [shard, offset, length]
+        self.shards = []
+        self._targets = []  # ((Modelo, id, campo), valor) del shard actual
+        self._buffer = BytesIO()
+        self._shard_number = 0
+    
+    @property
+    def _shard_name(self) -> str:
+        return f"{self.prefix}-{self._shard_number:04d}"
+    
+    def append(self, face_id, content: bytes, rendition: Optional[str] = None) -> str:
+        """
+        Agregar un recorte codificado
+        
+        Args:
+            rendition: Nombre de la rendition (tile, preview, full) si la cara tiene varias
+        
+        Returns:
+            URL servible del recorte (válida una vez subido su shard)
+        """
+        if self._buffer.tell() and self._buffer.tell() + len(content) > self.shard_max_bytes:
+            self._flush_shard()
+        
+        offset = self._buffer.tell()
+        self._buffer.write(content)
+        entry = f"{face_id}/{rendition}" if rendition else str(face_id)
+        self.index[entry] = [self._shard_name, offset, len(content)]
+        return crop_url(self.video_id, self._shard_name, offset, len(content))
+    
+    def append_renditions(
+        self,
+        face_id,
+        renditions: dict,
+        target: Optional[Tuple] = None,
+        url_field: Optional[str] = None
+    ) -> dict:
+        """
+        Agregar un set de renditions ({nombre: Rendition}); retorna su metadata con URLs
+        
+        Args:
+            target: (Modelo, id, campo) donde registrar la metadata al subirse el shard
+            url_field: Campo del mismo registro que recibe la URL de la rendition más grande
+        """
+        metadata = {
+            name: rendition.metadata(self.append(face_id, rendition.content, name))
+            for name, rendition in renditions.items()
+        }
+        if target is not None:
+            model, row_id, field = target
+            self._targets.append((target, metadata))
+            if url_field:
+                self._targets.append(((model, row_id, url_field), pick_rendition(metadata)["url"]))
+        return metadata
+    
+    def close(self) -> dict:
+        """Subir el último shard y el índice; retorna el índice"""
+        if self._buffer.tell():
+            self._flush_shard()
+        
+        if self.index:
+            manifest = {"video_id": str(self.video_id), "shards": self.shards, "crops": self.index}
+            self.uploader.submit(
+                json.dumps(manifest).encode(), f"{self.prefix}.index.json",
+                f"{ARCHIVE_FOLDER}/{self.video_id}", "application/json", fallback_local=False
+            )
+        return self.index
+    
+    def _flush_shard(self):
+        """Encolar la subida del shard actual (con las URLs de sus recortes) y comenzar uno nuevo"""
+        content = self._buffer.getvalue()
+        future = self.uploader.submit(
+            content, f"{self._shard_name}.bin", f"{ARCHIVE_FOLDER}/{self.video_id}", "application/octet-stream",
+            fallback_local=False
+        )
+        for target, value in self._targets:
+            self.uploader.register(future, target, value)
+        self._targets = []
+        self.shards.append({"name": self._shard_name, "size": len(content)})
+        self._buffer = BytesIO()
+        self._shard_number += 1
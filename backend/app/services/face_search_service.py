@@ -0,0 +1,307 @@
+"""
+Búsqueda de caras similares con pgvector
+
+El SQL se arma aquí (y no en el endpoint) para que la API, las tareas y el
+benchmark ejecuten exactamente la misma consulta. El k-NN se resuelve en una
+subconsulta ORDER BY distancia LIMIT k, la forma que usa el índice vectorial;
+el umbral y el JOIN con videos se aplican sobre esos k candidatos. La búsqueda
+por lotes repite el mismo k-NN por cara con CROSS JOIN LATERAL.
+
+Con filtros (videos, cámaras, organización, fechas, POI) el filtro va dentro
+del k-NN, nunca después del paso ANN. Si el conjunto filtrado es chico se
+busca en forma exacta; si no, con scan iterativo del índice (pgvector >= 0.8)
+para completar k resultados que cumplan el filtro. Excluir el video de la cara
+consultada también es un filtro: sin scan iterativo, los vecinos del mismo
+video llenarían ef_search y desplazarían las coincidencias de otros videos.
+"""
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.services.vector_index import EMBEDDING_DIMENSIONS, QUANTIZATIONS, VectorIndexManager
+
+
+def distance_expression(quantization: str = "none", query_param: str = ":query_embedding") -> str:
+    """Distancia tal como está indexada (debe coincidir con la expresión del índice)"""
+    expression, _, operator = QUANTIZATIONS[quantization]
+    query = f"CAST({query_param} AS vector({EMBEDDING_DIMENSIONS}))"
+    if quantization == "halfvec":
+        query = f"CAST({query_param} AS halfvec({EMBEDDING_DIMENSIONS}))"
+    elif quantization == "binary":
+        query = f"binary_quantize({query})"
+    return f"{expression} {operator} {query}"
+
+
+def candidate_count(max_results: int, quantization: str = "none") -> int:
+    """Candidatos del primer paso: binary sobre-recupera para el re-ranking"""
+    if quantization == "binary":
+        return max_results * max(settings.VECTOR_RERANK_FACTOR, 1)
+    return max_results
+
+
+@dataclass
+class SearchFilters:
+    """Restricciones de una búsqueda (None / vacío = sin restricción)"""
+    video_ids: Optional[List] = None
+    camera_ids: Optional[List[str]] = None
+    organization: Optional[str] = None
+    recorded_from: Optional[datetime] = None
+    recorded_to: Optional[datetime] = None
+    poi_only: bool = False
+    
+    def clause(self) -> Tuple[str, dict]:
+        """Condición SQL sobre face_embeddings ("" sin filtros) y sus parámetros"""
+        video_conditions = []
+        params = {}
+        if self.video_ids:
+            video_conditions.append("v.id = ANY(CAST(:filter_video_ids AS uuid[]))")
+            params["filter_video_ids"] = [str(video_id) for video_id in self.video_ids]
+        if self.camera_ids:
+            video_conditions.append("v.camera_id = ANY(CAST(:filter_camera_ids AS varchar[]))")
+            params["filter_camera_ids"] = list(self.camera_ids)
+        if self.organization:
+            video_conditions.append("v.user_id IN (SELECT u.id FROM users u WHERE u.organization = :filter_organization)")
+            params["filter_organization"] = self.organization
+        # Rango temporal: videos cuya grabación se solapa con [desde, hasta]
+        if self.recorded_to:
+            video_conditions.append("COALESCE(v.recorded_at, v.uploaded_at) <= :filter_recorded_to")
+            params["filter_recorded_to"] = self.recorded_to
+        if self.recorded_from:
+            video_conditions.append(
+                "COALESCE(v.recorded_at, v.uploaded_at) + make_interval(secs => COALESCE(v.duration, 0)) "
+                ">= :filter_recorded_from"
+            )
+            params["filter_recorded_from"] = self.recorded_from
+        
+        conditions = []
+        if video_conditions:
+            conditions.append(f"video_id IN (SELECT v.id FROM videos v WHERE {' AND '.join(video_conditions)})")
+        if self.poi_only:
+            conditions.append("is_person_of_interest")  # Índice parcial idx_face_poi_only
+        return " AND ".join(conditions), params
+
+
+def choose_strategy(
+    db: Session,
+    filters: Optional[SearchFilters],
+    exclude_same_video: bool = False
+) -> Tuple[str, str, dict]:
+    """
+    Estrategia de búsqueda según lo selectivo del filtro
+    
+    Args:
+        exclude_same_video: La consulta descarta los vecinos del video de cada cara
+            consultada (filtro por consulta: no se puede contar de antemano)
+    
+    Returns:
+        ("index" | "exact" | "iterative", condición SQL, parámetros)
+    """
+    where, params = filters.clause() if filters else ("", {})
+    if not where:
+        return ("iterative" if exclude_same_video else "index"), where, params
+    
+    # Conteo acotado: nunca recorre más de FACE_SEARCH_EXACT_MAX_ROWS + 1 filas
+    limit = settings.FACE_SEARCH_EXACT_MAX_ROWS
+    count = db.execute(
+        text(f"SELECT count(*) FROM (SELECT 1 FROM face_embeddings WHERE {where} LIMIT :count_limit) s"),
+        {**params, "count_limit": limit + 1}
+    ).scalar()
+    return ("exact" if count <= limit else "iterative"), where, params
+
+
+def prepare_search(
+    db: Session,
+    recall: Optional[float],
+    max_results: int,
+    filters: Optional[SearchFilters] = None,
+    exclude_same_video: bool = False
+) -> Tuple[str, str, dict]:
+    """
+    Elegir estrategia y fijar los parámetros de sesión de la transacción
+    
+    Returns:
+        (cuantización de la consulta, condición de filtro, parámetros base)
+    """
+    manager = VectorIndexManager()
+    strategy, where, params = choose_strategy(db, filters, exclude_same_video)
+    if strategy == "exact":
+        # Conjunto chico: distancia exacta sobre las filas filtradas (sin índice vectorial)
+        quantization = "none"
+        recall = 1.0
+    else:
+        quantization = manager.quantization(db)
+    
+    candidates = candidate_count(max_results, quantization)
+    manager.apply_search_settings(db, recall, candidates, iterative=strategy == "iterative")
+    params.update(max_results=max_results, candidates=candidates)
+    return quantization, where, params
+
+
+def knn_subquery(
+    quantization: str = "none",
+    query: str = ":query_embedding",
+    where: str = "id IS DISTINCT FROM CAST(:query_face_id AS uuid)"
+) -> str:
+    """
+    k vecinos más cercanos de un embedding, con su distancia coseno exacta
+    
+    Con cuantización, el primer paso ordena por la expresión indexada y trae
+    :candidates filas; el segundo re-ordena por la distancia coseno exacta del
+    vector completo, así el umbral y las distancias retornadas no se degradan.
+    
+    Args:
+        query: Parámetro o columna con el embedding de consulta (LATERAL)
+        where: Condición sobre face_embeddings (por defecto excluye la cara consultada)
+    """
+    exact = distance_expression(query_param=query)
+    if quantization == "none":
+        return f"""
+            SELECT id, video_id, face_image_url, timestamp_in_video, {exact} AS distance
+            FROM face_embeddings
+            WHERE {where}
+            ORDER BY {exact}
+            LIMIT :max_results
+        """
+    return f"""
+        SELECT id, video_id, face_image_url, timestamp_in_video, {exact} AS distance
+        FROM (
+            SELECT id, video_id, face_image_url, timestamp_in_video, embedding
+            FROM face_embeddings
+            WHERE {where}
+            ORDER BY {distance_expression(quantization, query)}
+            LIMIT :candidates
+        ) candidates
+        ORDER BY distance
+        LIMIT :max_results
+    """
+
+
+def similar_faces_sql(quantization: str = "none", filter_clause: str = ""):
+    """Consulta k-NN de una cara contra todos los embeddings (excluyendo la propia)"""
+    where = "id IS DISTINCT FROM CAST(:query_face_id AS uuid)"
+    if filter_clause:
+        where = f"{where} AND {filter_clause}"
+    return text(f"""
+        SELECT
+            fe.id, fe.video_id, fe.face_image_url, fe.timestamp_in_video,
+            v.filename,
+            fe.distance
+        FROM ({knn_subquery(quantization, where=where)}) fe
+        JOIN videos v ON fe.video_id = v.id
+        WHERE fe.distance < :threshold
+        ORDER BY fe.distance
+    """).bindparams(bindparam("query_embedding", type_=Vector(EMBEDDING_DIMENSIONS)))
+
+
+def batch_similar_faces_sql(quantization: str = "none", by_video: bool = False, filter_clause: str = ""):
+    """
+    k-NN de muchas caras en una sola consulta (CROSS JOIN LATERAL por cara)
+    
+    Los embeddings de consulta se leen en el mismo SQL: por ids con umbral propio
+    (:query_ids / :thresholds) o todas las caras de :video_id con :threshold.
+    """
+    if by_video:
+        queries = """
+            SELECT id AS query_face_id, video_id AS query_video_id, embedding AS query_embedding,
+                   CAST(:threshold AS float8) AS threshold
+            FROM face_embeddings
+            WHERE video_id = :video_id
+        """
+    else:
+        queries = """
+            SELECT q.id AS query_face_id, q.video_id AS query_video_id, q.embedding AS query_embedding,
+                   t.threshold
+            FROM unnest(CAST(:query_ids AS uuid[]), CAST(:thresholds AS float8[])) AS t(id, threshold)
+            JOIN face_embeddings q ON q.id = t.id
+        """
+    
+    where = "id <> queries.query_face_id AND (NOT :exclude_same_video OR video_id <> queries.query_video_id)"
+    if filter_clause:
+        where = f"{where} AND {filter_clause}"
+    knn = knn_subquery(quantization, query="queries.query_embedding", where=where)
+    return text(f"""
+        WITH queries AS ({queries})
+        SELECT
+            queries.query_face_id,
+            fe.id, fe.video_id, fe.face_image_url, fe.timestamp_in_video,
+            v.filename,
+            fe.distance
+        FROM queries
+        CROSS JOIN LATERAL ({knn}) fe
+        JOIN videos v ON fe.video_id = v.id
+        WHERE fe.distance < queries.threshold
+        ORDER BY queries.query_face_id, fe.distance
+    """)
+
+
+def search_similar_faces(
+    db: Session,
+    query_embedding,
+    threshold: float,
+    max_results: int,
+    exclude_face_id=None,
+    recall: Optional[float] = None,
+    filters: Optional[SearchFilters] = None
+) -> List:
+    """
+    Buscar las caras más cercanas a un embedding
+    
+    Args:
+        threshold: Distancia coseno máxima (0 = idéntico)
+        recall: Recall objetivo; fija probes / ef_search para esta transacción
+        filters: Restringir la búsqueda (videos, cámaras, organización, fechas, POI)
+    
+    Returns:
+        Filas (id, video_id, face_image_url, timestamp_in_video, filename, distance)
+    """
+    quantization, where, params = prepare_search(db, recall, max_results, filters)
+    params.update(
+        query_embedding=query_embedding,
+        query_face_id=str(exclude_face_id) if exclude_face_id else None,
+        threshold=threshold
+    )
+    return db.execute(similar_faces_sql(quantization, where), params).fetchall()
+
+
+def search_similar_faces_batch(
+    db: Session,
+    queries: Optional[Dict] = None,
+    video_id=None,
+    threshold: float = 0.6,
+    max_results: int = 10,
+    recall: Optional[float] = None,
+    exclude_same_video: bool = False,
+    filters: Optional[SearchFilters] = None
+) -> Dict:
+    """
+    Buscar las caras más cercanas para muchas caras de consulta en un round trip
+    
+    Args:
+        queries: {face_id: umbral} (alternativa a video_id)
+        video_id: Consultar todas las caras del video con `threshold`
+        exclude_same_video: Ignorar coincidencias dentro del video de la cara consultada
+        filters: Restringir las caras candidatas (no las de consulta)
+    
+    Returns:
+        {query_face_id: [filas (id, video_id, face_image_url, timestamp_in_video, filename, distance)]}
+    """
+    quantization, where, params = prepare_search(db, recall, max_results, filters, exclude_same_video)
+    params["exclude_same_video"] = exclude_same_video
+    if video_id is not None:
+        params.update(video_id=str(video_id), threshold=threshold)
+    else:
+        params.update(
+            query_ids=[str(face_id) for face_id in queries],
+            thresholds=[float(value) for value in queries.values()]
+        )
+    
+    results = defaultdict(list)
+    for row in db.execute(batch_similar_faces_sql(quantization, video_id is not None, where), params):
+        results[row.query_face_id].append(row)
+    return results
@@ -0,0 +1,140 @@
+"""
+Resúmenes por video y clase de objeto (video_object_summaries)
+
+Se acumulan en memoria durante el procesamiento, al mismo tiempo que las
+detecciones van al BulkDetectionWriter, y se escriben una vez por video. Para
+videos procesados antes de existir la tabla, `rebuild_video_summaries` los
+recalcula agregando detected_objects por clase y minuto. Los videos procesados
+sin OBJECT_STORE_FRAME_DETECTIONS sólo tienen object_tracks, que no permiten
+recontar frames por clase; su resumen (escrito al procesar) no se toca.
+"""
+from collections import defaultdict
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import distinct, func
+from sqlalchemy.orm import Session
+
+from app.models.models import DetectedObject, Video, VideoObjectSummary
+
+
+class ObjectSummaryAccumulator:
+    """Conteos, rango temporal, confianza máxima e histograma por minuto de cada clase"""
+    
+    def __init__(self):
+        self._classes = {}
+    
+    def add(self, object_class: str, frame_number: int, timestamp: float, confidence: float):
+        """Una detección (los frames llegan en orden, así que basta recordar el último)"""
+        summary = self._summary(object_class, timestamp, confidence)
+        summary["detection_count"] += 1
+        if summary["last_frame"] != frame_number:
+            summary["frame_count"] += 1
+            summary["last_frame"] = frame_number
+        summary["first_seen"] = min(summary["first_seen"], timestamp)
+        summary["last_seen"] = max(summary["last_seen"], timestamp)
+        summary["max_confidence"] = max(summary["max_confidence"], confidence or 0.0)
+        summary["minutes"][int(timestamp // 60)] += 1
+    
+    def add_bucket(
+        self,
+        object_class: str,
+        minute: int,
+        detections: int,
+        frames: int,
+        first_seen: float,
+        last_seen: float,
+        max_confidence: float
+    ):
+        """Un minuto ya agregado (backfill); un frame cae en un solo minuto, así que los frames suman"""
+        summary = self._summary(object_class, first_seen, max_confidence)
+        summary["detection_count"] += detections
+        summary["frame_count"] += frames
+        summary["first_seen"] = min(summary["first_seen"], first_seen)
+        summary["last_seen"] = max(summary["last_seen"], last_seen)
+        summary["max_confidence"] = max(summary["max_confidence"], max_confidence or 0.0)
+        summary["minutes"][int(minute)] += detections
+    
+    def _summary(self, object_class: str, timestamp: float, confidence: float) -> dict:
+        summary = self._classes.get(object_class)
+        if summary is None:
+            summary = self._classes[object_class] = {
+                "detection_count": 0,
+                "frame_count": 0,
+                "last_frame": None,
+                "first_seen": timestamp,
+                "last_seen": timestamp,
+                "max_confidence": confidence or 0.0,
+                "minutes": defaultdict(int)
+            }
+        return summary
+    
+    def rows(self, video: Video) -> List[dict]:
+        """Filas de video_object_summaries para el video"""
+        recorded_at = video.recorded_at or video.uploaded_at
+        now = datetime.utcnow()
+        rows = []
+        for object_class, summary in self._classes.items():
+            minutes = summary["minutes"]
+            rows.append({
+                "video_id": video.id,
+                "object_class": object_class,
+                "user_id": video.user_id,
+                "recorded_at": recorded_at,
+                "detection_count": summary["detection_count"],
+                "frame_count": summary["frame_count"],
+                "first_seen": summary["first_seen"],
+                "last_seen": summary["last_seen"],
+                "max_confidence": summary["max_confidence"],
+                "minute_histogram": [minutes.get(minute, 0) for minute in range(max(minutes) + 1)],
+                "updated_at": now
+            })
+        return rows
+    
+    def save(self, db: Session, video: Video) -> int:
+        """Reemplazar los resúmenes del video en la transacción actual; retorna clases"""
+        db.query(VideoObjectSummary).filter(VideoObjectSummary.video_id == video.id).delete(synchronize_session=False)
+        rows = self.rows(video)
+        if rows:
+            db.execute(VideoObjectSummary.__table__.insert(), rows)
+        return len(rows)
+
+
+def rebuild_video_summaries(db: Session, video: Video) -> Optional[int]:
+    """
+    Recalcular los resúmenes de un video desde detected_objects (backfill)
+    
+    Returns:
+        Clases escritas, o None si el video no tiene detected_objects (sólo
+        tracks): se conserva el resumen existente en lugar de vaciarlo
+    """
+    minute = func.floor(func.coalesce(DetectedObject.timestamp_in_video, 0) / 60)
+    buckets = (
+        db.query(
+            DetectedObject.object_class,
+            minute.label("minute"),
+            func.count().label("detections"),
+            func.count(distinct(DetectedObject.frame_number)).label("frames"),
+            func.min(DetectedObject.timestamp_in_video).label("first_seen"),
+            func.max(DetectedObject.timestamp_in_video).label("last_seen"),
+            func.max(DetectedObject.confidence).label("max_confidence")
+        )
+        .filter(DetectedObject.video_id == video.id)
+        .group_by(DetectedObject.object_class, minute)
+        .all()
+    )
+    if not buckets:
+        return None
+    
+    accumulator = ObjectSummaryAccumulator()
+    for bucket in buckets:
+        accumulator.add_bucket(
+            bucket.object_class,
+            bucket.minute,
+            bucket.detections,
+            bucket.frames,
+            bucket.first_seen or 0.0,
+            bucket.last_seen or 0.0,
+            bucket.max_confidence
+        )
+    return accumulator.save(db, video)
@@ -0,0 +1,198 @@
+"""
+Tracking de objetos entre frames para compactar detected_objects
+
+Cada detección se enlaza con el track activo de la misma clase con mayor IoU
+(asignación greedy por frame). Un track se cierra cuando pasa más de
+OBJECT_TRACK_MAX_GAP_SECONDS sin verse y se guarda como una sola fila
+(ObjectTrack). La trayectoria sólo guarda puntos clave: una detección entra cuando
+el bbox se movió más de OBJECT_TRACK_POSITION_TOLERANCE px respecto al último
+punto guardado, así que un auto estacionado una hora ocupa dos puntos.
+
+Formato de la trayectoria: int32 little-endian, 5 por punto
+(frame - start_frame, x, y, width, height).
+"""
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+
+
+_POINT_FIELDS = 5
+_TRAJECTORY_DTYPE = "<i4"
+
+
+def iou(a: tuple, b: tuple) -> float:
+    """Intersección sobre unión de dos bbox (x, y, width, height)"""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    inter_w = min(ax + aw, bx + bw) - max(ax, bx)
+    inter_h = min(ay + ah, by + bh) - max(ay, by)
+    if inter_w <= 0 or inter_h <= 0:
+        return 0.0
+    intersection = inter_w * inter_h
+    union = aw * ah + bw * bh - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def encode_trajectory(points: List[tuple], start_frame: int) -> bytes:
+    """Puntos (frame, x, y, width, height) a bytes compactos"""
+    array = np.asarray(points, dtype=np.int64).reshape(-1, _POINT_FIELDS)
+    array[:, 0] -= start_frame
+    return array.astype(_TRAJECTORY_DTYPE).tobytes()
+
+
+def decode_trajectory(data: bytes, start_frame: int) -> List[dict]:
+    """Bytes de la trayectoria a [{frame_number, bbox_x, bbox_y, bbox_width, bbox_height}]"""
+    array = np.frombuffer(data, dtype=_TRAJECTORY_DTYPE).reshape(-1, _POINT_FIELDS)
+    return [
+        {
+            "frame_number": start_frame + int(offset),
+            "bbox_x": int(x),
+            "bbox_y": int(y),
+            "bbox_width": int(width),
+            "bbox_height": int(height)
+        }
+        for offset, x, y, width, height in array
+    ]
+
+
+class _Track:
+    """Track activo (en memoria hasta cerrarse)"""
+    
+    __slots__ = (
+        "object_class", "start_frame", "end_frame", "start_time", "end_time", "detection_count",
+        "peak_confidence", "peak_frame", "bbox", "points", "last_point"
+    )
+    
+    def __init__(self, object_class: str, frame_number: int, timestamp: float, bbox: tuple, confidence: float):
+        self.object_class = object_class
+        self.start_frame = self.end_frame = self.peak_frame = frame_number
+        self.start_time = self.end_time = timestamp
+        self.detection_count = 1
+        self.peak_confidence = confidence
+        self.bbox = bbox
+        self.points = [(frame_number, *bbox)]
+        self.last_point = None  # Última detección no guardada como punto clave
+    
+    def extend(self, frame_number: int, timestamp: float, bbox: tuple, confidence: float, tolerance: int):
+        self.end_frame = frame_number
+        self.end_time = timestamp
+        self.detection_count += 1
+        if confidence is not None and (self.peak_confidence is None or confidence > self.peak_confidence):
+            self.peak_confidence = confidence
+            self.peak_frame = frame_number
+        self.bbox = bbox
+        
+        point = (frame_number, *bbox)
+        keyframe = self.points[-1]
+        if max(abs(value - previous) for value, previous in zip(bbox, keyframe[1:])) > tolerance:
+            self.points.append(point)
+            self.last_point = None
+        else:
+            self.last_point = point
+    
+    def to_row(self, video_id) -> dict:
+        """Columnas de ObjectTrack (el último frame siempre queda como punto clave)"""
+        points = self.points + [self.last_point] if self.last_point else self.points
+        return {
+            "video_id": video_id,
+            "object_class": self.object_class,
+            "start_frame": self.start_frame,
+            "end_frame": self.end_frame,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "detection_count": self.detection_count,
+            "peak_confidence": self.peak_confidence,
+            "peak_frame": self.peak_frame,
+            "trajectory": encode_trajectory(points, self.start_frame),
+            "trajectory_points": len(points)
+        }
+
+
+class ObjectTracker:
+    """Enlaza detecciones por IoU y clase; los tracks cerrados van al BulkDetectionWriter"""
+    
+    def __init__(
+        self,
+        video_id,
+        iou_threshold: Optional[float] = None,
+        max_gap_seconds: Optional[float] = None,
+        position_tolerance: Optional[int] = None
+    ):
+        self.video_id = video_id
+        self.iou_threshold = iou_threshold if iou_threshold is not None else settings.OBJECT_TRACK_IOU_THRESHOLD
+        self.max_gap = max_gap_seconds if max_gap_seconds is not None else settings.OBJECT_TRACK_MAX_GAP_SECONDS
+        self.tolerance = position_tolerance if position_tolerance is not None else settings.OBJECT_TRACK_POSITION_TOLERANCE
+        self._active: Dict[str, List[_Track]] = {}
+        self.tracks_closed = 0
+    
+    def update(self, frame_number: int, timestamp: float, detections: List[dict]) -> List[dict]:
+        """
+        Procesar las detecciones de un frame (formato de AIInferenceModule.detect_objects)
+        
+        Returns:
+            Filas de los tracks que se cerraron en este frame
+        """
+        # Cerrar primero los vencidos: un objeto que reaparece tras el gap abre un track nuevo
+        closed = self._close(lambda track: timestamp - track.end_time > self.max_gap)
+        
+        by_class: Dict[str, List[dict]] = {}
+        for detection in detections:
+            by_class.setdefault(detection["class"], []).append(detection)
+        
+        for object_class, class_detections in by_class.items():
+            tracks = self._active.setdefault(object_class, [])
+            boxes = [self._bbox(detection) for detection in class_detections]
+            
+            # Pares (IoU, track, detección) de mayor a menor, cada uno usado una vez
+            candidates = sorted(
+                (
+                    (overlap, track_index, detection_index)
+                    for track_index, track in enumerate(tracks)
+                    for detection_index, box in enumerate(boxes)
+                    for overlap in (iou(track.bbox, box),)
+                    if overlap >= self.iou_threshold
+                ),
+                reverse=True
+            )
+            used_tracks, used_detections = set(), set()
+            for _, track_index, detection_index in candidates:
+                if track_index in used_tracks or detection_index in used_detections:
+                    continue
+                used_tracks.add(track_index)
+                used_detections.add(detection_index)
+                tracks[track_index].extend(
+                    frame_number, timestamp, boxes[detection_index],
+                    class_detections[detection_index]["confidence"], self.tolerance
+                )
+            
+            for detection_index, detection in enumerate(class_detections):
+                if detection_index not in used_detections:
+                    tracks.append(_Track(
+                        object_class, frame_number, timestamp, boxes[detection_index], detection["confidence"]
+                    ))
+        
+        return closed
+    
+    def finish(self) -> List[dict]:
+        """Cerrar todos los tracks activos (fin del video)"""
+        return self._close(lambda track: True)
+    
+    def _close(self, expired) -> List[dict]:
+        closed = []
+        for object_class, tracks in self._active.items():
+            remaining = []
+            for track in tracks:
+                if expired(track):
+                    closed.append(track.to_row(self.video_id))
+                else:
+                    remaining.append(track)
+            self._active[object_class] = remaining
+        self.tracks_closed += len(closed)
+        return closed
+    
+    @staticmethod
+    def _bbox(detection: dict) -> tuple:
+        bbox = detection["bbox"]
+        return (bbox["x"], bbox["y"], bbox["width"], bbox["height"])
@@ -0,0 +1,208 @@
+"""
+Watchlist de personas de interés en memoria para el cruce durante el ingest
+
+Cada proceso worker mantiene una matriz numpy (N x 512, float32, normalizada L2)
+con los embeddings marcados como POI. Las caras nuevas de un video se cruzan
+por lotes con un solo producto matricial (similitud coseno = producto punto),
+sin consultas a la base por cara. La watchlist se refresca en forma incremental
+con `poi_marked_at`, que mark-poi actualiza en cada cambio de marca.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.models import Alert, AlertLevel, FaceEmbedding, Video
+
+
+# Margen al releer cambios: una marca confirmada tarde con timestamp anterior no se pierde
+REFRESH_OVERLAP = timedelta(seconds=5)
+
+
+class POIWatchlist:
+    """Embeddings POI normalizados y sus etiquetas"""
+    
+    def __init__(self):
+        self._entries: Dict = {}  # face_id -> (vector normalizado, etiqueta, video_id)
+        self._snapshot = ([], np.zeros((0, 0), dtype=np.float32), [])  # (ids, matriz, etiquetas)
+        self.loaded_until: Optional[datetime] = None
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._snapshot[0])
+    
+    def refresh(self, db: Session, force: bool = False) -> int:
+        """
+        Aplicar las marcas nuevas o retiradas desde la última lectura
+        
+        Como mucho una consulta cada POI_WATCHLIST_REFRESH_SECONDS (salvo `force`).
+        
+        Returns:
+            Filas leídas
+        """
+        if not force and time.monotonic() - self._last_refresh < settings.POI_WATCHLIST_REFRESH_SECONDS:
+            return 0
+        
+        with self._lock:
+            query = db.query(
+                FaceEmbedding.id, FaceEmbedding.embedding, FaceEmbedding.poi_label, FaceEmbedding.video_id,
+                FaceEmbedding.is_person_of_interest, FaceEmbedding.poi_marked_at
+            )
+            if self.loaded_until is None:
+                # Carga inicial: índice parcial de POIs
+                query = query.filter(FaceEmbedding.is_person_of_interest.is_(True))
+            else:
+                # Incremental: también trae las marcas retiradas (is_person_of_interest = False)
+                query = query.filter(FaceEmbedding.poi_marked_at >= self.loaded_until - REFRESH_OVERLAP)
+            rows = query.all()
+            
+            changed = False
+            for row in rows:
+                if row.is_person_of_interest:
+                    vector = np.asarray(row.embedding, dtype=np.float32)
+                    vector = vector / max(float(np.linalg.norm(vector)), 1e-12)
+                    self._entries[row.id] = (vector, row.poi_label, row.video_id)
+                    changed = True
+                elif self._entries.pop(row.id, None) is not None:
+                    changed = True
+                if row.poi_marked_at and (self.loaded_until is None or row.poi_marked_at > self.loaded_until):
+                    self.loaded_until = row.poi_marked_at
+            
+            if self.loaded_until is None:
+                self.loaded_until = datetime.min + REFRESH_OVERLAP  # Sin marcas con fecha: siguientes lecturas incrementales
+            if changed:
+                self._rebuild()
+            self._last_refresh = time.monotonic()
+        
+        return len(rows)
+    
+    def _rebuild(self):
+        """Nueva matriz inmutable (las búsquedas en curso siguen con la anterior)"""
+        ids = list(self._entries)
+        if ids:
+            matrix = np.stack([self._entries[face_id][0] for face_id in ids])
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        labels = [self._entries[face_id][1] for face_id in ids]
+        self._snapshot = (ids, matrix, labels)
+    
+    def match(self, embeddings, threshold: Optional[float] = None) -> List[Tuple[int, object, str, float]]:
+        """
+        POI más cercano de cada embedding, si está bajo el umbral
+        
+        Args:
+            embeddings: Matriz (M x 512) de caras nuevas
+            threshold: Distancia coseno máxima (por defecto POI_MATCH_THRESHOLD)
+        
+        Returns:
+            [(fila del embedding, id de la cara POI, etiqueta, distancia)]
+        """
+        ids, matrix, labels = self._snapshot
+        if not ids or not len(embeddings):
+            return []
+        threshold = threshold if threshold is not None else settings.POI_MATCH_THRESHOLD
+        
+        queries = np.asarray(embeddings, dtype=np.float32)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        similarities = queries @ matrix.T
+        best = similarities.argmax(axis=1)
+        distances = 1.0 - similarities[np.arange(len(queries)), best]
+        
+        return [
+            (int(row), ids[best[row]], labels[best[row]], float(distances[row]))
+            for row in np.nonzero(distances < threshold)[0]
+        ]
+
+
+class POIMatchRecorder:
+    """Cruce de las caras de un video contra la watchlist y alertas poi_detected"""
+    
+    def __init__(self, watchlist: POIWatchlist, video: Video):
+        self.watchlist = watchlist
+        self.video = video
+        self._pending_ids = []
+        self._pending_embeddings = []
+        self._pending_timestamps = []
+        self.alerts: Dict = {}  # id de la cara POI -> Alert (una por POI y video)
+        self.hits = 0
+    
+    def add(self, face_id, embedding, timestamp: float):
+        """Encolar una cara nueva (se cruza en flush)"""
+        self._pending_ids.append(face_id)
+        self._pending_embeddings.append(embedding)
+        self._pending_timestamps.append(timestamp)
+    
+    def flush(self, db: Session) -> int:
+        """
+        Cruzar las caras encoladas y crear / actualizar alertas en la sesión
+        
+        Llamar después de escribir las caras (la alerta referencia su FaceEmbedding);
+        el commit lo hace el llamador.
+        
+        Returns:
+            Coincidencias encontradas en el lote
+        """
+        if not self._pending_ids:
+            return 0
+        self.watchlist.refresh(db)
+        matches = self.watchlist.match(np.stack(self._pending_embeddings))
+        
+        for row, poi_face_id, label, distance in matches:
+            face_id = self._pending_ids[row]
+            timestamp = self._pending_timestamps[row]
+            alert = self.alerts.get(poi_face_id)
+            if alert is None:
+                alert = Alert(
+                    user_id=self.video.user_id,
+                    video_id=self.video.id,
+                    face_embedding_id=face_id,
+                    title=f"Persona de interés detectada: {label or 'sin etiqueta'}",
+                    description=f"Coincidencia en {self.video.original_filename} (segundo {timestamp:.1f})",
+                    alert_level=AlertLevel.CRITICAL,
+                    alert_type="poi_detected",
+                    alert_metadata={
+                        "poi_face_id": str(poi_face_id),
+                        "poi_label": label,
+                        "best_distance": distance,
+                        "best_face_id": str(face_id),
+                        "first_seen_at": timestamp,
+                        "hits": 0
+                    }
+                )
+                db.add(alert)
+                self.alerts[poi_face_id] = alert
+            
+            metadata = dict(alert.alert_metadata)  # Reasignar para que el cambio en JSONB se detecte
+            metadata["hits"] += 1
+            if distance < metadata["best_distance"]:
+                metadata.update(best_distance=distance, best_face_id=str(face_id))
+                alert.face_embedding_id = face_id
+            alert.alert_metadata = metadata
+        
+        self._pending_ids, self._pending_embeddings, self._pending_timestamps = [], [], []
+        self.hits += len(matches)
+        return len(matches)
+
+
+# Watchlist por proceso (se recrea tras un fork)
+_watchlist = None
+_owner_pid = None
+_lock = threading.Lock()
+
+
+def get_watchlist() -> POIWatchlist:
+    """Watchlist compartida por las tareas del proceso"""
+    global _watchlist, _owner_pid
+    
+    if _owner_pid != os.getpid():
+        with _lock:
+            if _owner_pid != os.getpid():
+                _watchlist = POIWatchlist()
+                _owner_pid = os.getpid()
+    return _watchlist
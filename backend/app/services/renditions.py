@@ -0,0 +1,145 @@
+"""
+Renditions de imágenes (caras, thumbnails, heatmaps) en varios tamaños
+
+A partir de una sola imagen decodificada se generan tile / preview / full en WebP
+(o JPEG) con calidad ajustada por tamaño. La codificación se hace en un pool de
+threads (OpenCV libera el GIL), y la API elige la rendition más pequeña que
+alcanza el tamaño pedido en lugar de descargar siempre la imagen completa.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from app.core.config import settings
+
+
+# Lado mayor de cada rendition (None = tamaño original)
+RENDITION_SIZES = {
+    "tile": 128,
+    "preview": 384,
+    "full": None
+}
+
+# Calidad por formato y rendition: las miniaturas toleran más compresión
+RENDITION_QUALITY = {
+    "webp": {"tile": 70, "preview": 80, "full": 90},
+    "jpeg": {"tile": 75, "preview": 85, "full": 92}
+}
+
+_FORMATS = {
+    "webp": (".webp", "image/webp", cv2.IMWRITE_WEBP_QUALITY),
+    "jpeg": (".jpg", "image/jpeg", cv2.IMWRITE_JPEG_QUALITY)
+}
+
+# Pool de codificación por proceso (se recrea tras un fork)
+_executor = None
+_owner_pid = None
+_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Pool de threads de codificación compartido por proceso"""
+    global _executor, _owner_pid
+    
+    if _owner_pid != os.getpid():
+        with _lock:
+            if _owner_pid != os.getpid():
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.RENDITION_ENCODE_WORKERS,
+                    thread_name_prefix="rendition"
+                )
+                _owner_pid = os.getpid()
+    return _executor
+
+
+@dataclass
+class Rendition:
+    """Imagen codificada en un tamaño"""
+    name: str
+    content: bytes
+    width: int
+    height: int
+    extension: str
+    content_type: str
+    
+    def metadata(self, url: str) -> dict:
+        """Entrada a registrar en la columna *_renditions"""
+        return {
+            "url": url,
+            "width": self.width,
+            "height": self.height,
+            "bytes": len(self.content),
+            "content_type": self.content_type
+        }
+
+
+class RenditionGenerator:
+    """Genera el set de renditions de una o varias imágenes en paralelo"""
+    
+    def __init__(self, image_format: Optional[str] = None):
+        """
+        Args:
+            image_format: "webp" o "jpeg" (por defecto RENDITION_FORMAT)
+        """
+        self.image_format = image_format or settings.RENDITION_FORMAT
+        if self.image_format not in _FORMATS:
+            raise ValueError(f"Formato de rendition no soportado: {self.image_format}")
+        self.extension, self.content_type, self._quality_flag = _FORMATS[self.image_format]
+    
+    def generate(self, image: np.ndarray) -> Dict[str, Rendition]:
+        """Generar las renditions de una imagen BGR"""
+        return self.generate_many([image])[0]
+    
+    def generate_many(self, images: List[np.ndarray]) -> List[Dict[str, Rendition]]:
+        """Generar las renditions de varias imágenes; todas se codifican en paralelo"""
+        executor = _get_executor()
+        jobs = []
+        for index, image in enumerate(images):
+            longest = max(image.shape[:2])
+            for name, max_side in RENDITION_SIZES.items():
+                # Sin upscaling: una rendition que no reduce el tamaño duplicaría a "full"
+                if max_side is not None and longest <= max_side:
+                    continue
+                jobs.append((index, name, executor.submit(self._encode, image, name, max_side)))
+        
+        results = [{} for _ in images]
+        for index, name, job in jobs:
+            results[index][name] = job.result()
+        return results
+    
+    def _encode(self, image: np.ndarray, name: str, max_side: Optional[int]) -> Rendition:
+        """Redimensionar (INTER_AREA) y codificar una rendition"""
+        height, width = image.shape[:2]
+        if max_side is not None:
+            scale = max_side / max(height, width)
+            width, height = max(1, round(width * scale)), max(1, round(height * scale))
+            image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+        
+        quality = RENDITION_QUALITY[self.image_format][name]
+        ok, encoded = cv2.imencode(self.extension, image, [self._quality_flag, quality])
+        if not ok:
+            raise ValueError(f"No se pudo codificar la rendition {name} en {self.image_format}")
+        
+        return Rendition(name, encoded.tobytes(), width, height, self.extension, self.content_type)
+
+
+def pick_rendition(renditions: Optional[dict], min_size: Optional[int] = None) -> Optional[dict]:
+    """
+    Elegir la rendition más pequeña cuyo lado mayor alcanza min_size
+    
+    Sin min_size (o si ninguna lo alcanza) se retorna la más grande.
+    """
+    if not renditions:
+        return None
+    
+    ordered = sorted(renditions.values(), key=lambda r: max(r["width"], r["height"]))
+    if min_size:
+        for rendition in ordered:
+            if max(rendition["width"], rendition["height"]) >= min_size:
+                return rendition
+    return ordered[-1]
@@ -1,28 +1,86 @@
 """
 Servicio de Almacenamiento - AWS S3 / Google Cloud Storage
+
+Las operaciones de boto3 son bloqueantes: los métodos async las ejecutan en un
+pool de threads dedicado y acotado, para no detener el event loop de FastAPI.
+Cada proceso comparte un único cliente S3 (thread-safe) con pool de conexiones.
+Los workers Celery (síncronos) usan directamente los métodos bloqueantes.
 """
+import asyncio
+import hashlib
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Optional
+
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
-from typing import Optional
-import io
 from app.core.config import settings
 
 
-class StorageService:
-    """Servicio para almacenamiento en cloud (S3/GCS)"""
+# Recursos compartidos por proceso (se recrean tras un fork, p.ej. workers prefork)
+_s3_client = None
+_executor = None
+_owner_pid = None
+_lock = threading.Lock()
+
+
+def _ensure_process_resources():
+    """Crear (una vez por proceso) el cliente S3 compartido y el pool de threads"""
+    global _s3_client, _executor, _owner_pid
     
-    def __init__(self):
+    if _owner_pid == os.getpid():
+        return
+    
+    with _lock:
+        if _owner_pid == os.getpid():
+            return
+        
         if settings.USE_S3:
-            self.s3_client = boto3.client(
+            _s3_client = boto3.session.Session().client(
                 's3',
                 aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
                 aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-                region_name=settings.AWS_REGION
+                region_name=settings.AWS_REGION,
+                endpoint_url=settings.S3_ENDPOINT_URL,
+                config=Config(
+                    max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS,
+                    connect_timeout=settings.S3_CONNECT_TIMEOUT,
+                    read_timeout=settings.S3_READ_TIMEOUT,
+                    retries={"max_attempts": settings.S3_MAX_RETRIES, "mode": "adaptive"},
+                    tcp_keepalive=True
+                )
             )
-            self.bucket_name = settings.S3_BUCKET_NAME
         else:
-            self.s3_client = None
-            self.bucket_name = None
+            _s3_client = None
+        
+        # Más threads que conexiones sólo añadiría espera en el pool de urllib3
+        _executor = ThreadPoolExecutor(
+            max_workers=min(settings.STORAGE_THREAD_POOL_SIZE, settings.S3_MAX_POOL_CONNECTIONS),
+            thread_name_prefix="storage"
+        )
+        _owner_pid = os.getpid()
+
+
+class StorageService:
+    """Servicio para almacenamiento en cloud (S3/GCS)"""
+    
+    def __init__(self):
+        _ensure_process_resources()
+        self.s3_client = _s3_client
+        self.bucket_name = settings.S3_BUCKET_NAME if self.s3_client else None
+        self.local_base_dir = Path(settings.LOCAL_STORAGE_PATH)
+    
+    async def _run(self, func, *args, **kwargs):
+        """Ejecutar una operación bloqueante en el pool de threads de storage"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, partial(func, *args, **kwargs))
+    
+    # ==================== API async (FastAPI) ====================
     
     async def upload_video(self, file_content: bytes, filename: str) -> str:
         """
@@ -31,78 +89,196 @@ class StorageService:
         Returns:
             URL del archivo en S3
         """
-        if not settings.USE_S3 or not self.s3_client:
+        return await self._run(self.put_bytes, file_content, filename, "videos", "video/mp4")
+    
+    async def upload_image(self, file_content: bytes, filename: str, folder: str = "faces") -> str:
+        """Subir imagen (cara, thumbnail, etc.) a S3"""
+        return await self._run(self.put_bytes, file_content, filename, folder, "image/jpeg")
+    
+    async def download_file(self, s3_key: str) -> bytes:
+        """Descargar archivo de S3"""
+        return await self._run(self.get_bytes, s3_key)
+    
+    async def download_range(self, s3_key: str, offset: int, length: int) -> bytes:
+        """Descargar un rango de bytes de un archivo"""
+        return await self._run(self.read_range, s3_key, offset, length)
+    
+    async def delete_file(self, s3_key: str) -> bool:
+        """Eliminar archivo de S3"""
+        return await self._run(self.remove, s3_key)
+    
+    # ==================== API bloqueante (workers) ====================
+    
+    def put_bytes(
+        self,
+        file_content: bytes,
+        filename: str,
+        folder: str,
+        content_type: str,
+        fallback_local: bool = True
+    ) -> str:
+        """
+        Subir contenido a "{folder}/{filename}" (bloqueante)
+        
+        Args:
+            fallback_local: Si S3 falla, guardar localmente en lugar de propagar el error
+        
+        Returns:
+            URL del archivo (S3 o local si S3 no está disponible)
+        """
+        if not self.s3_client:
             # Fallback: guardar localmente
-            return self._save_locally(file_content, filename, "videos")
+            return self._save_locally(file_content, filename, folder)
         
+        key = f"{folder}/{filename}"
         try:
-            # Upload a S3
             self.s3_client.put_object(
                 Bucket=self.bucket_name,
-                Key=f"videos/{filename}",
+                Key=key,
                 Body=file_content,
-                ContentType='video/mp4'
+                ContentType=content_type
             )
-            
-            # Retornar URL
-            url = f"https://{self.bucket_name}.s3.{settings.AWS_REGION}.amazonaws.com/videos/{filename}"
-            return url
+            return self.object_url(key)
         except ClientError as e:
+            if not fallback_local:
+                raise
             print(f"Error subiendo a S3: {e}")
-            return self._save_locally(file_content, filename, "videos")
-    
-    async def upload_image(self, file_content: bytes, filename: str, folder: str = "faces") -> str:
-        """Subir imagen (cara, thumbnail, etc.) a S3"""
-        if not settings.USE_S3 or not self.s3_client:
             return self._save_locally(file_content, filename, folder)
+    
+    def get_bytes(self, s3_key: str) -> bytes:
+        """Descargar archivo completo (bloqueante)"""
+        if not self.s3_client:
+            return self._read_locally(s3_key)
         
         try:
-            self.s3_client.put_object(
+            response = self.s3_client.get_object(
                 Bucket=self.bucket_name,
-                Key=f"{folder}/{filename}",
-                Body=file_content,
-                ContentType='image/jpeg'
+                Key=s3_key
             )
-            
-            url = f"https://{self.bucket_name}.s3.{settings.AWS_REGION}.amazonaws.com/{folder}/{filename}"
-            return url
+            return response['Body'].read()
         except ClientError as e:
-            print(f"Error subiendo imagen a S3: {e}")
-            return self._save_locally(file_content, filename, folder)
+            print(f"Error descargando de S3: {e}")
+            return b""
     
-    def _save_locally(self, file_content: bytes, filename: str, folder: str) -> str:
-        """Guardar archivo localmente (fallback)"""
-        from pathlib import Path
-        
-        base_dir = Path("/tmp/forensic_storage")
-        folder_path = base_dir / folder
-        folder_path.mkdir(parents=True, exist_ok=True)
+    def read_range(self, s3_key: str, offset: int, length: int) -> bytes:
+        """
+        Leer `length` bytes desde `offset` (bloqueante), con un único GET por rango
         
-        file_path = folder_path / filename
-        with open(file_path, 'wb') as f:
-            f.write(file_content)
+        Raises:
+            FileNotFoundError: Si el archivo no existe
+        """
+        if not self.s3_client:
+            file_path = self.local_base_dir / s3_key
+            if not file_path.is_file():
+                raise FileNotFoundError(f"Archivo no encontrado en storage local: {s3_key}")
+            with open(file_path, 'rb') as f:
+                f.seek(offset)
+                return f.read(length)
         
-        return f"/storage/{folder}/{filename}"
+        try:
+            response = self.s3_client.get_object(
+                Bucket=self.bucket_name,
+                Key=s3_key,
+                Range=f"bytes={offset}-{offset + length - 1}"
+            )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                raise FileNotFoundError(f"Archivo no encontrado en S3: {s3_key}") from e
+            raise
+        return response['Body'].read()
     
-    async def download_file(self, s3_key: str) -> bytes:
-        """Descargar archivo de S3"""
-        if not settings.USE_S3 or not self.s3_client:
-            return b""
+    def download_to_file(
+        self,
+        s3_key: str,
+        dest_path: str,
+        expected_sha256: Optional[str] = None,
+        part_size: Optional[int] = None,
+        concurrency: Optional[int] = None
+    ) -> int:
+        """
+        Descargar un archivo directo a disco (bloqueante), con memoria constante
+        
+        En S3 se usan GETs por rango en paralelo: como máximo `concurrency` partes
+        en vuelo, que se escriben y se agregan al hash SHA-256 en orden. Si el
+        hash no coincide con `expected_sha256` se elimina el archivo parcial.
+        
+        Returns:
+            Bytes descargados
+        """
+        part_size = part_size or settings.STORAGE_DOWNLOAD_PART_SIZE_MB * 1024 * 1024
+        concurrency = concurrency or settings.STORAGE_DOWNLOAD_CONCURRENCY
+        sha256 = hashlib.sha256()
         
         try:
+            with open(dest_path, 'wb') as f:
+                if self.s3_client:
+                    size = self._download_ranges(s3_key, f, sha256, part_size, concurrency)
+                else:
+                    size = self._copy_locally(s3_key, f, sha256, part_size)
+        except Exception:
+            Path(dest_path).unlink(missing_ok=True)
+            raise
+        
+        if expected_sha256 and sha256.hexdigest() != expected_sha256:
+            Path(dest_path).unlink(missing_ok=True)
+            raise ValueError(
+                f"Integridad comprometida en {s3_key}: SHA-256 {sha256.hexdigest()} != {expected_sha256}"
+            )
+        
+        return size
+    
+    def _download_ranges(self, s3_key: str, f, sha256, part_size: int, concurrency: int) -> int:
+        """GETs por rango en paralelo con ventana acotada, escritos en orden"""
+        head = self.s3_client.head_object(Bucket=self.bucket_name, Key=s3_key)
+        size = head['ContentLength']
+        etag = head['ETag']
+        
+        def fetch(start: int) -> bytes:
+            end = min(start + part_size, size) - 1
             response = self.s3_client.get_object(
                 Bucket=self.bucket_name,
-                Key=s3_key
+                Key=s3_key,
+                Range=f"bytes={start}-{end}",
+                IfMatch=etag  # Falla si el objeto cambia durante la descarga
             )
             return response['Body'].read()
-        except ClientError as e:
-            print(f"Error descargando de S3: {e}")
-            return b""
+        
+        offsets = iter(range(0, size, part_size))
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="download") as executor:
+            in_flight = deque(executor.submit(fetch, start) for _, start in zip(range(concurrency), offsets))
+            while in_flight:
+                data = in_flight.popleft().result()
+                f.write(data)
+                sha256.update(data)
+                next_start = next(offsets, None)
+                if next_start is not None:
+                    in_flight.append(executor.submit(fetch, next_start))
+        
+        return size
     
-    async def delete_file(self, s3_key: str) -> bool:
-        """Eliminar archivo de S3"""
-        if not settings.USE_S3 or not self.s3_client:
-            return False
+    def _copy_locally(self, key: str, f, sha256, chunk_size: int) -> int:
+        """Copiar desde el backend local por bloques"""
+        file_path = self.local_base_dir / key
+        if not file_path.is_file():
+            raise FileNotFoundError(f"Archivo no encontrado en storage local: {key}")
+        
+        size = 0
+        with open(file_path, 'rb') as src:
+            while chunk := src.read(chunk_size):
+                f.write(chunk)
+                sha256.update(chunk)
+                size += len(chunk)
+        
+        return size
+    
+    def remove(self, s3_key: str) -> bool:
+        """Eliminar archivo (bloqueante)"""
+        if not self.s3_client:
+            file_path = self.local_base_dir / s3_key
+            if not file_path.is_file():
+                return False
+            file_path.unlink()
+            return True
         
         try:
             self.s3_client.delete_object(
@@ -113,3 +289,186 @@ class StorageService:
         except ClientError as e:
             print(f"Error eliminando de S3: {e}")
             return False
+    
+    # ==================== Subida directa (URLs prefirmadas) ====================
+    
+    def presign_put(self, s3_key: str, content_type: str, content_length: int, expires_in: int) -> str:
+        """URL prefirmada para un PUT único; el tamaño queda incluido en la firma"""
+        return self.s3_client.generate_presigned_url(
+            'put_object',
+            Params={
+                'Bucket': self.bucket_name,
+                'Key': s3_key,
+                'ContentType': content_type,
+                'ContentLength': content_length
+            },
+            ExpiresIn=expires_in
+        )
+    
+    def create_multipart_upload(self, s3_key: str, content_type: str) -> str:
+        """Iniciar una subida multipart y retornar su UploadId"""
+        response = self.s3_client.create_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=s3_key,
+            ContentType=content_type
+        )
+        return response['UploadId']
+    
+    def presign_upload_part(self, s3_key: str, upload_id: str, part_number: int, expires_in: int) -> str:
+        """URL prefirmada para una parte de una subida multipart"""
+        return self.s3_client.generate_presigned_url(
+            'upload_part',
+            Params={
+                'Bucket': self.bucket_name,
+                'Key': s3_key,
+                'UploadId': upload_id,
+                'PartNumber': part_number
+            },
+            ExpiresIn=expires_in
+        )
+    
+    def complete_multipart_upload(self, s3_key: str, upload_id: str) -> int:
+        """
+        Completar una subida multipart con las partes registradas en S3
+        
+        Returns:
+            Número de partes ensambladas
+        """
+        parts = []
+        paginator = self.s3_client.get_paginator('list_parts')
+        for page in paginator.paginate(Bucket=self.bucket_name, Key=s3_key, UploadId=upload_id):
+            parts.extend({'PartNumber': p['PartNumber'], 'ETag': p['ETag']} for p in page.get('Parts', []))
+        
+        if not parts:
+            raise FileNotFoundError(f"Subida multipart sin partes: {s3_key}")
+        
+        self.s3_client.complete_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=s3_key,
+            UploadId=upload_id,
+            MultipartUpload={'Parts': parts}
+        )
+        return len(parts)
+    
+    def abort_multipart_upload(self, s3_key: str, upload_id: str):
+        """Cancelar una subida multipart (libera las partes ya subidas)"""
+        try:
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket_name, Key=s3_key, UploadId=upload_id)
+        except ClientError as e:
+            print(f"Error cancelando subida multipart: {e}")
+    
+    def object_size(self, s3_key: str) -> int:
+        """
+        Tamaño de un archivo (bloqueante)
+        
+        Raises:
+            FileNotFoundError: Si el archivo no existe
+        """
+        if not self.s3_client:
+            file_path = self.local_base_dir / s3_key
+            if not file_path.is_file():
+                raise FileNotFoundError(f"Archivo no encontrado en storage local: {s3_key}")
+            return file_path.stat().st_size
+        
+        try:
+            return self.s3_client.head_object(Bucket=self.bucket_name, Key=s3_key)['ContentLength']
+        except ClientError as e:
+            raise FileNotFoundError(f"Archivo no encontrado en S3: {s3_key}") from e
+    
+    def digest_object(self, s3_key: str, head_bytes: int = 0, chunk_size: int = 8 * 1024 * 1024) -> dict:
+        """
+        Calcular SHA-256 y SHA-512 leyendo el archivo en streaming (memoria constante)
+        
+        Returns:
+            {"size", "sha256", "sha512", "head"} donde head son los primeros `head_bytes`
+        """
+        sha256 = hashlib.sha256()
+        sha512 = hashlib.sha512()
+        head = bytearray()
+        size = 0
+        
+        if self.s3_client:
+            body = self.s3_client.get_object(Bucket=self.bucket_name, Key=s3_key)['Body']
+            chunks = body.iter_chunks(chunk_size)
+        else:
+            file_path = self.local_base_dir / s3_key
+            if not file_path.is_file():
+                raise FileNotFoundError(f"Archivo no encontrado en storage local: {s3_key}")
+            source = open(file_path, 'rb')
+            chunks = iter(partial(source.read, chunk_size), b"")
+        
+        try:
+            for chunk in chunks:
+                sha256.update(chunk)
+                sha512.update(chunk)
+                size += len(chunk)
+                if len(head) < head_bytes:
+                    head.extend(chunk[:head_bytes - len(head)])
+        finally:
+            if not self.s3_client:
+                source.close()
+        
+        return {"size": size, "sha256": sha256.hexdigest(), "sha512": sha512.hexdigest(), "head": bytes(head)}
+    
+    def move(self, src_key: str, dest_key: str) -> str:
+        """
+        Mover un archivo dentro del storage sin transferirlo por este proceso
+        (copia del lado de S3, multipart para objetos grandes)
+        
+        Returns:
+            URL del archivo en su nueva ubicación
+        """
+        if not self.s3_client:
+            dest_path = self.local_base_dir / dest_key
+            dest_path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(self.local_base_dir / src_key, dest_path)
+            return f"/storage/{dest_key}"
+        
+        self.s3_client.copy(
+            {'Bucket': self.bucket_name, 'Key': src_key},
+            self.bucket_name,
+            dest_key
+        )
+        self.s3_client.delete_object(Bucket=self.bucket_name, Key=src_key)
+        return self.object_url(dest_key)
+    
+    # ==================== URLs ====================
+    
+    def object_url(self, key: str) -> str:
+        """URL pública de un objeto S3"""
+        if settings.S3_ENDPOINT_URL:
+            # S3 compatible (MinIO, etc.): path-style
+            return f"{settings.S3_ENDPOINT_URL.rstrip('/')}/{self.bucket_name}/{key}"
+        return f"https://{self.bucket_name}.s3.{settings.AWS_REGION}.amazonaws.com/{key}"
+    
+    def key_from_url(self, url: str) -> str:
+        """Obtener la key de storage ("folder/filename") desde una URL generada por este servicio"""
+        if url.startswith("/storage/"):
+            return url[len("/storage/"):]
+        
+        if self.bucket_name:
+            s3_prefix = self.object_url("")
+            if url.startswith(s3_prefix):
+                return url[len(s3_prefix):]
+        
+        raise ValueError(f"URL de storage no reconocida: {url}")
+    
+    # ==================== Backend local ====================
+    
+    def _save_locally(self, file_content: bytes, filename: str, folder: str) -> str:
+        """Guardar archivo localmente (fallback)"""
+        folder_path = self.local_base_dir / folder
+        folder_path.mkdir(parents=True, exist_ok=True)
+        
+        file_path = folder_path / filename
+        with open(file_path, 'wb') as f:
+            f.write(file_content)
+        
+        return f"/storage/{folder}/{filename}"
+    
+    def _read_locally(self, key: str) -> bytes:
+        """Leer archivo guardado localmente (fallback)"""
+        file_path = self.local_base_dir / key
+        if not file_path.is_file():
+            return b""
+        return file_path.read_bytes()
@@ -0,0 +1,214 @@
+"""
+Subida directa de videos a storage con URLs prefirmadas
+
+El cliente sube los bytes directo a S3 (PUT único o multipart); la API sólo
+emite las URLs y, al completar, verifica tamaño y hashes leyendo el objeto en
+streaming. Sin S3, un endpoint local de la API actúa como stand-in de las URLs.
+
+El estado de la subida viaja en un token JWT firmado (sin tabla adicional):
+usuario, key de staging, tamaño declarado y UploadId multipart. Se firma con
+una clave propia (UPLOAD_TOKEN_SECRET_KEY o una derivada de SECRET_KEY) y con
+audiencia propia, así nunca es aceptado como token de acceso a la API. En el
+stand-in local viaja en el header X-Upload-Token, no en la URL (que queda en
+logs de proxies y de acceso).
+"""
+import hashlib
+import hmac
+import math
+import re
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
+
+from jose import JWTError, jwt
+
+from app.core.config import settings
+from app.services.storage_service import StorageService
+
+
+UPLOAD_TOKEN_TYPE = "video_upload"
+UPLOAD_TOKEN_AUDIENCE = "video-upload"
+UPLOAD_TOKEN_HEADER = "X-Upload-Token"
+STAGING_FOLDER = "uploads"
+LOCAL_UPLOAD_PATH = f"{settings.API_V1_STR}/videos/uploads/local"
+
+# Límites de S3 para multipart
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+
+
+class UploadError(Exception):
+    """Subida inválida, expirada o que no coincide con lo declarado"""
+
+
+def _signing_key() -> str:
+    """Clave de los tokens de subida (nunca la de los tokens de acceso)"""
+    if settings.UPLOAD_TOKEN_SECRET_KEY:
+        return settings.UPLOAD_TOKEN_SECRET_KEY
+    return hmac.new(settings.SECRET_KEY.encode(), UPLOAD_TOKEN_AUDIENCE.encode(), hashlib.sha256).hexdigest()
+
+
+def _safe_filename(filename: str) -> str:
+    """Nombre de archivo sin rutas ni caracteres problemáticos para una key"""
+    name = Path(filename).name
+    return re.sub(r"[^\w.\-]", "_", name) or "video.mp4"
+
+
+class DirectUploadService:
+    """Emisión de URLs prefirmadas y verificación de subidas directas"""
+    
+    def __init__(self, storage: Optional[StorageService] = None):
+        self.storage = storage or StorageService()
+    
+    def initiate(
+        self,
+        user_id,
+        filename: str,
+        size: int,
+        content_type: str = "video/mp4",
+        sha256: Optional[str] = None
+    ) -> dict:
+        """
+        Preparar una subida directa (bloqueante: crea el multipart en S3)
+        
+        Args:
+            size: Tamaño declarado en bytes (se verifica al completar)
+            sha256: Hash declarado por el cliente (opcional, se verifica al completar)
+        
+        Returns:
+            {"upload_token", "method": "single"|"multipart", "url" | "parts", "part_size", "expires_at"}
+            y, en el stand-in local, "headers" a enviar en cada PUT
+        """
+        if size <= 0 or size > settings.MAX_UPLOAD_SIZE_MB * 1024 * 1024:
+            raise UploadError(f"Tamaño inválido. Máximo: {settings.MAX_UPLOAD_SIZE_MB}MB")
+        
+        upload_id = uuid.uuid4().hex
+        filename = _safe_filename(filename)
+        key = f"{STAGING_FOLDER}/{upload_id}/{filename}"
+        expires_in = settings.DIRECT_UPLOAD_URL_EXPIRE_MINUTES * 60
+        expires_at = datetime.utcnow() + timedelta(seconds=expires_in)
+        
+        claims = {
+            "sub": str(user_id),
+            "type": UPLOAD_TOKEN_TYPE,
+            "aud": UPLOAD_TOKEN_AUDIENCE,
+            "upload_id": upload_id,
+            "key": key,
+            "filename": filename,
+            "size": size,
+            "content_type": content_type,
+            "sha256": sha256.lower() if sha256 else None,
+            "exp": expires_at
+        }
+        
+        result = {"method": "single", "expires_at": expires_at.isoformat()}
+        if size > settings.DIRECT_UPLOAD_MULTIPART_THRESHOLD_MB * 1024 * 1024:
+            part_size = max(settings.DIRECT_UPLOAD_PART_SIZE_MB * 1024 * 1024, MIN_PART_SIZE, math.ceil(size / MAX_PARTS))
+            part_count = math.ceil(size / part_size)
+            claims["part_size"] = part_size
+            claims["multipart_upload_id"] = (
+                self.storage.create_multipart_upload(key, content_type) if self.storage.s3_client else upload_id
+            )
+            result.update(method="multipart", part_size=part_size)
+        
+        token = jwt.encode(claims, _signing_key(), algorithm=settings.ALGORITHM)
+        result["upload_token"] = token
+        if not self.storage.s3_client:
+            # Stand-in local: el token autoriza el PUT y va en un header, no en la URL
+            result["headers"] = {UPLOAD_TOKEN_HEADER: token}
+        
+        if result["method"] == "single":
+            result["url"] = (
+                self.storage.presign_put(key, content_type, size, expires_in)
+                if self.storage.s3_client else f"{LOCAL_UPLOAD_PATH}/{upload_id}"
+            )
+        else:
+            result["parts"] = [
+                {
+                    "part_number": number,
+                    "url": (
+                        self.storage.presign_upload_part(key, claims["multipart_upload_id"], number, expires_in)
+                        if self.storage.s3_client else f"{LOCAL_UPLOAD_PATH}/{upload_id}?part_number={number}"
+                    )
+                }
+                for number in range(1, part_count + 1)
+            ]
+        return result
+    
+    def decode_token(self, token: str, user_id=None) -> dict:
+        """Validar firma, expiración, tipo y (opcionalmente) propietario de un token de subida"""
+        try:
+            claims = jwt.decode(token, _signing_key(), algorithms=[settings.ALGORITHM], audience=UPLOAD_TOKEN_AUDIENCE)
+        except JWTError as e:
+            raise UploadError("Token de subida inválido o expirado") from e
+        
+        if claims.get("type") != UPLOAD_TOKEN_TYPE:
+            raise UploadError("Token de subida inválido")
+        if user_id is not None and claims["sub"] != str(user_id):
+            raise UploadError("El token de subida pertenece a otro usuario")
+        return claims
+    
+    def local_part_path(self, claims: dict, part_number: Optional[int] = None) -> Path:
+        """Ruta destino del stand-in local (archivo final o parte multipart)"""
+        if part_number is None:
+            path = self.storage.local_base_dir / claims["key"]
+        else:
+            if "multipart_upload_id" not in claims or not 1 <= part_number <= MAX_PARTS:
+                raise UploadError("Parte inválida")
+            path = self.storage.local_base_dir / STAGING_FOLDER / claims["upload_id"] / "parts" / f"{part_number:05d}"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path
+    
+    def complete(self, claims: dict) -> dict:
+        """
+        Ensamblar la subida y verificar tamaño y hashes en streaming (bloqueante)
+        
+        Returns:
+            {"key", "size", "sha256", "sha512", "head"} del archivo en staging
+        
+        Raises:
+            UploadError: Si falta el archivo o no coincide con lo declarado (se elimina)
+        """
+        key = claims["key"]
+        try:
+            if "multipart_upload_id" in claims:
+                if self.storage.s3_client:
+                    self.storage.complete_multipart_upload(key, claims["multipart_upload_id"])
+                else:
+                    self._assemble_local_parts(claims)
+            
+            size = self.storage.object_size(key)
+        except FileNotFoundError as e:
+            raise UploadError("El archivo no fue subido") from e
+        
+        if size != claims["size"]:
+            self.storage.remove(key)
+            raise UploadError(f"Tamaño recibido {size} distinto del declarado {claims['size']}")
+        
+        digest = self.storage.digest_object(key, head_bytes=settings.DIRECT_UPLOAD_EXIF_HEAD_KB * 1024)
+        if claims.get("sha256") and digest["sha256"] != claims["sha256"]:
+            self.storage.remove(key)
+            raise UploadError("SHA-256 recibido distinto del declarado")
+        
+        digest["key"] = key
+        return digest
+    
+    def finalize(self, staging_key: str, dest_filename: str) -> str:
+        """Mover el archivo verificado a videos/ (copia del lado del storage); retorna su URL"""
+        return self.storage.move(staging_key, f"videos/{dest_filename}")
+    
+    def _assemble_local_parts(self, claims: dict):
+        """Concatenar en orden las partes del stand-in local"""
+        parts_dir = self.storage.local_base_dir / STAGING_FOLDER / claims["upload_id"] / "parts"
+        parts = sorted(parts_dir.glob("*")) if parts_dir.is_dir() else []
+        if not parts:
+            raise FileNotFoundError(f"Subida multipart sin partes: {claims['key']}")
+        
+        with open(self.storage.local_base_dir / claims["key"], 'wb') as dest:
+            for part in parts:
+                with open(part, 'rb') as src:
+                    while chunk := src.read(8 * 1024 * 1024):
+                        dest.write(chunk)
+                part.unlink()
+        parts_dir.rmdir()
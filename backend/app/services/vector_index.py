@@ -0,0 +1,331 @@
+"""
+Gestión del índice vectorial de face_embeddings (HNSW / IVFFlat con pgvector)
+
+- Construcción con parámetros configurables, CONCURRENTLY y con swap atómico
+  (las búsquedas siguen funcionando durante el rebuild)
+- IVFFlat se entrena con los datos existentes: no se crea sobre la tabla vacía
+  y se re-entrena cuando la tabla crece más de VECTOR_INDEX_REBUILD_GROWTH
+- Por consulta, `probes` / `ef_search` se fijan con SET LOCAL según el recall
+  pedido, usando el perfil calibrado (benchmark) o valores por defecto
+- Cuantización (VECTOR_INDEX_QUANTIZATION): el índice puede construirse sobre
+  una expresión halfvec (2 bytes/dim) o binary_quantize (1 bit/dim). La tabla
+  conserva el vector float32, que se lee sólo para re-ordenar los candidatos;
+  lo que debe caber en RAM es el índice (2x / 32x más chico)
+  (halfvec y binary_quantize requieren pgvector >= 0.7)
+"""
+import math
+import time
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.database import engine
+from app.models.models import VectorIndexState
+
+
+FACE_EMBEDDING_INDEX = "idx_face_embedding"
+FACE_EMBEDDING_TABLE = "face_embeddings"
+INDEX_TYPES = ("hnsw", "ivfflat")
+EMBEDDING_DIMENSIONS = 512
+
+# Cuantización -> (expresión sobre la columna, operator class, operador de distancia)
+QUANTIZATIONS = {
+    "none": ("embedding", "vector_cosine_ops", "<=>"),
+    "halfvec": (f"CAST(embedding AS halfvec({EMBEDDING_DIMENSIONS}))", "halfvec_cosine_ops", "<=>"),
+    "binary": (f"CAST(binary_quantize(embedding) AS bit({EMBEDDING_DIMENSIONS}))", "bit_hamming_ops", "<~>"),
+}
+
+# Recall objetivo -> ef_search (HNSW) por defecto; IVFFlat usa múltiplos de sqrt(lists)
+DEFAULT_HNSW_PROFILE = {"0.8": 20, "0.9": 40, "0.95": 80, "0.99": 200}
+DEFAULT_IVFFLAT_PROFILE_FACTORS = {"0.8": 0.5, "0.9": 1.0, "0.95": 2.0, "0.99": 5.0}
+
+MAX_EF_SEARCH = 1000  # Límite de pgvector
+
+# Estado leído por proceso (la API lo consulta en cada búsqueda)
+_state_cache = {"state": None, "loaded_at": 0.0}
+STATE_CACHE_SECONDS = 60
+
+
+class VectorIndexManager:
+    """Construcción, mantenimiento y parámetros de búsqueda del índice de embeddings"""
+    
+    def __init__(self, index_name: str = FACE_EMBEDDING_INDEX, table_name: str = FACE_EMBEDDING_TABLE):
+        self.index_name = index_name
+        self.table_name = table_name
+    
+    # ==================== Definición ====================
+    
+    def desired_params(self, index_type: str, row_count: int) -> dict:
+        """Parámetros de construcción según configuración y tamaño de la tabla"""
+        if index_type == "hnsw":
+            return {"m": settings.HNSW_M, "ef_construction": settings.HNSW_EF_CONSTRUCTION}
+        
+        lists = settings.IVFFLAT_LISTS
+        if not lists:
+            # Recomendación de pgvector: filas/1000 hasta 1M, sqrt(filas) por encima
+            lists = row_count // 1000 if row_count <= 1_000_000 else int(math.sqrt(row_count))
+        return {"lists": max(lists, 1)}
+    
+    def index_column(self, quantization: str = "none") -> str:
+        """Expresión indexada (columna o cast) y su operator class"""
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Cuantización no soportada: {quantization}")
+        expression, opclass, _ = QUANTIZATIONS[quantization]
+        return f"{expression} {opclass}" if quantization == "none" else f"({expression}) {opclass}"
+    
+    def create_statement(self, name: str, index_type: str, params: dict, quantization: str = "none") -> str:
+        """CREATE INDEX CONCURRENTLY para el tipo, parámetros y cuantización dados"""
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Tipo de índice no soportado: {index_type}")
+        with_clause = ", ".join(f"{key} = {int(value)}" for key, value in params.items())
+        return (
+            f"CREATE INDEX CONCURRENTLY {name} ON {self.table_name} "
+            f"USING {index_type} ({self.index_column(quantization)}) WITH ({with_clause})"
+        )
+    
+    def quantization(self, db: Session) -> str:
+        """Cuantización del índice construido (la consulta debe usar la misma expresión)"""
+        state = self.get_state(db, use_cache=True)
+        return (state.quantization or "none") if state else "none"
+    
+    # ==================== Estado ====================
+    
+    def row_count(self) -> int:
+        """Filas estimadas (pg_class.reltuples: sin recorrer la tabla)"""
+        with engine.connect() as conn:
+            estimate = conn.execute(
+                text("SELECT reltuples::bigint FROM pg_class WHERE relname = :table"),
+                {"table": self.table_name}
+            ).scalar()
+        return max(int(estimate or 0), 0)
+    
+    def index_exists(self) -> bool:
+        """El índice existe y es válido (un CREATE CONCURRENTLY fallido deja uno inválido)"""
+        with engine.connect() as conn:
+            return bool(conn.execute(
+                text("""
+                    SELECT i.indisvalid FROM pg_index i
+                    JOIN pg_class c ON c.oid = i.indexrelid
+                    WHERE c.relname = :name
+                """),
+                {"name": self.index_name}
+            ).scalar())
+    
+    def index_size(self) -> int:
+        """Tamaño en bytes del índice (lo que debe caber en memoria)"""
+        with engine.connect() as conn:
+            return int(conn.execute(
+                text("SELECT COALESCE(pg_relation_size(to_regclass(:name)), 0)"),
+                {"name": self.index_name}
+            ).scalar())
+    
+    def get_state(self, db: Session, use_cache: bool = False) -> Optional[VectorIndexState]:
+        """Estado registrado del índice (opcionalmente cacheado por proceso)"""
+        if use_cache and time.monotonic() - _state_cache["loaded_at"] < STATE_CACHE_SECONDS:
+            return _state_cache["state"]
+        
+        state = db.query(VectorIndexState).filter(VectorIndexState.index_name == self.index_name).first()
+        if state is not None:
+            db.expunge(state)
+        _state_cache.update(state=state, loaded_at=time.monotonic())
+        return state
+    
+    def status(self, db: Session) -> dict:
+        """Resumen para el comando de mantenimiento"""
+        state = self.get_state(db)
+        rows = self.row_count()
+        return {
+            "index_name": self.index_name,
+            "exists": self.index_exists(),
+            "configured_type": settings.VECTOR_INDEX_TYPE,
+            "built_type": state.index_type if state else None,
+            "params": state.params if state else None,
+            "configured_quantization": settings.VECTOR_INDEX_QUANTIZATION,
+            "built_quantization": state.quantization if state else None,
+            "rows_at_build": state.rows_at_build if state else None,
+            "rows_now": rows,
+            "index_size_mb": round(self.index_size() / 1024 ** 2, 1),
+            "built_at": state.built_at.isoformat() if state and state.built_at else None,
+            "build_seconds": state.build_seconds if state else None,
+            "recall_profile": state.recall_profile if state else None,
+            "needs_rebuild": self.needs_rebuild(db, rows)
+        }
+    
+    def needs_rebuild(self, db: Session, row_count: Optional[int] = None) -> bool:
+        """Decidir si construir / reconstruir el índice"""
+        index_type = settings.VECTOR_INDEX_TYPE
+        rows = self.row_count() if row_count is None else row_count
+        
+        if index_type == "ivfflat" and rows < settings.IVFFLAT_MIN_ROWS:
+            return False  # Pocas filas: el scan exacto es suficiente y los centroides no serían útiles
+        
+        state = self.get_state(db)
+        if not self.index_exists() or state is None or state.index_type != index_type:
+            return True
+        if (state.quantization or "none") != settings.VECTOR_INDEX_QUANTIZATION:
+            return True  # Migración de cuantización: nuevo índice sobre otra expresión
+        
+        if index_type == "hnsw":
+            # HNSW se mantiene con cada insert: sólo se reconstruye si cambian los parámetros
+            return state.params != self.desired_params(index_type, rows)
+        
+        # IVFFlat: centroides entrenados con rows_at_build filas
+        return rows > (state.rows_at_build or 0) * (1 + settings.VECTOR_INDEX_REBUILD_GROWTH)
+    
+    # ==================== Construcción ====================
+    
+    def build(
+        self,
+        db: Session,
+        index_type: Optional[str] = None,
+        params: Optional[dict] = None,
+        quantization: Optional[str] = None
+    ) -> dict:
+        """
+        Construir el índice en paralelo al existente y reemplazarlo atómicamente
+        
+        Cambiar la cuantización no modifica las filas: el índice nuevo se construye
+        sobre la expresión cuantizada y las búsquedas pasan a usarla con el swap.
+        
+        Returns:
+            Estado registrado (tipo, parámetros, cuantización, filas, duración)
+        """
+        index_type = index_type or settings.VECTOR_INDEX_TYPE
+        quantization = quantization or settings.VECTOR_INDEX_QUANTIZATION
+        rows = self.row_count()
+        params = params or self.desired_params(index_type, rows)
+        new_name = f"{self.index_name}_new"
+        
+        start = time.perf_counter()
+        # CREATE INDEX CONCURRENTLY no puede ejecutarse dentro de una transacción
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text(f"SET maintenance_work_mem = '{settings.VECTOR_INDEX_MAINTENANCE_WORK_MEM}'"))
+            conn.execute(text(f"SET max_parallel_maintenance_workers = {int(settings.VECTOR_INDEX_BUILD_WORKERS)}"))
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {new_name}"))  # Resto de un build fallido
+            conn.execute(text(self.create_statement(new_name, index_type, params, quantization)))
+            
+            # Swap: bloqueo exclusivo breve, sin ventana sin índice
+            conn.execute(text("BEGIN"))
+            conn.execute(text(f"DROP INDEX IF EXISTS {self.index_name}"))
+            conn.execute(text(f"ALTER INDEX {new_name} RENAME TO {self.index_name}"))
+            conn.execute(text("COMMIT"))
+            conn.execute(text(f"ANALYZE {self.table_name}"))
+        build_seconds = time.perf_counter() - start
+        
+        state = db.query(VectorIndexState).filter(VectorIndexState.index_name == self.index_name).first()
+        if state is None:
+            state = VectorIndexState(index_name=self.index_name, table_name=self.table_name)
+            db.add(state)
+        if state.index_type != index_type or state.params != params or state.quantization != quantization:
+            state.recall_profile = None  # La calibración previa no aplica al nuevo índice
+        state.index_type = index_type
+        state.params = params
+        state.quantization = quantization
+        state.rows_at_build = rows
+        state.build_seconds = build_seconds
+        state.built_at = datetime.utcnow()
+        db.commit()
+        _state_cache.update(state=None, loaded_at=0.0)
+        
+        print(
+            f"✅ Índice {self.index_name} ({index_type} {params}, {quantization}) "
+            f"construido en {build_seconds:.1f}s con {rows} filas"
+        )
+        return {
+            "index_type": index_type,
+            "params": params,
+            "quantization": quantization,
+            "rows": rows,
+            "build_seconds": build_seconds
+        }
+    
+    def maintain(self, db: Session) -> dict:
+        """Construir o re-entrenar el índice si hace falta (tarea periódica y tras cargas masivas)"""
+        # Un solo mantenimiento a la vez entre workers
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock_conn:
+            lock_key = f"vector_index:{self.index_name}"
+            if not lock_conn.execute(text("SELECT pg_try_advisory_lock(hashtext(:key))"), {"key": lock_key}).scalar():
+                return {"rebuilt": False, "reason": "mantenimiento en curso"}
+            try:
+                # Tras COPY masivos reltuples puede estar desactualizado
+                lock_conn.execute(text(f"ANALYZE {self.table_name}"))
+                if not self.needs_rebuild(db):
+                    return {"rebuilt": False}
+                return {"rebuilt": True, **self.build(db)}
+            finally:
+                lock_conn.execute(text("SELECT pg_advisory_unlock(hashtext(:key))"), {"key": lock_key})
+    
+    def save_recall_profile(self, db: Session, profile: dict):
+        """Registrar el perfil recall -> probes/ef_search medido para el índice actual"""
+        state = db.query(VectorIndexState).filter(VectorIndexState.index_name == self.index_name).first()
+        if state is None:
+            raise ValueError(f"El índice {self.index_name} no está registrado")
+        state.recall_profile = {str(recall): int(value) for recall, value in profile.items()}
+        db.commit()
+        _state_cache.update(state=None, loaded_at=0.0)
+    
+    # ==================== Parámetros de búsqueda ====================
+    
+    def search_settings(
+        self,
+        db: Session,
+        recall: Optional[float] = None,
+        limit: int = 10,
+        iterative: bool = False
+    ) -> dict:
+        """
+        Parámetros de sesión para alcanzar el recall pedido
+        
+        recall >= 1.0 fuerza búsqueda exacta (sin índice vectorial). Con `iterative`
+        (búsquedas filtradas) el índice sigue escaneando hasta reunir k filas que
+        cumplan el filtro, acotado por VECTOR_ITERATIVE_MAX_SCAN_TUPLES (pgvector >= 0.8).
+        """
+        recall = recall if recall is not None else settings.FACE_SEARCH_DEFAULT_RECALL
+        if recall >= 1.0:
+            return {"enable_indexscan": "off"}
+        
+        state = self.get_state(db, use_cache=True)
+        if state is None:
+            return {}  # Sin índice gestionado: scan exacto
+        
+        search_settings = self._recall_settings(state, recall, limit)
+        if iterative and state.index_type == "hnsw":
+            search_settings["hnsw.iterative_scan"] = "relaxed_order"
+            search_settings["hnsw.max_scan_tuples"] = int(settings.VECTOR_ITERATIVE_MAX_SCAN_TUPLES)
+        elif iterative:
+            search_settings["ivfflat.iterative_scan"] = "relaxed_order"
+        return search_settings
+    
+    def _recall_settings(self, state: VectorIndexState, recall: float, limit: int) -> dict:
+        """probes / ef_search del perfil (calibrado o por defecto) para el recall pedido"""
+        if state.recall_profile:
+            profile = state.recall_profile
+        elif state.index_type == "hnsw":
+            profile = DEFAULT_HNSW_PROFILE
+        else:
+            sqrt_lists = math.sqrt(state.params["lists"])
+            profile = {level: math.ceil(factor * sqrt_lists) for level, factor in DEFAULT_IVFFLAT_PROFILE_FACTORS.items()}
+        
+        # Menor nivel del perfil que alcanza el recall pedido (o el más alto disponible)
+        levels = sorted(profile.items(), key=lambda item: float(item[0]))
+        value = next((v for level, v in levels if float(level) >= recall), levels[-1][1])
+        
+        if state.index_type == "hnsw":
+            return {"hnsw.ef_search": min(max(int(value), limit), MAX_EF_SEARCH)}
+        return {"ivfflat.probes": min(max(int(value), 1), state.params["lists"])}
+    
+    def apply_search_settings(
+        self,
+        db: Session,
+        recall: Optional[float] = None,
+        limit: int = 10,
+        iterative: bool = False
+    ) -> dict:
+        """Fijar los parámetros con SET LOCAL (sólo duran la transacción actual)"""
+        search_settings = self.search_settings(db, recall, limit, iterative)
+        for name, value in search_settings.items():
+            db.execute(text(f"SET LOCAL {name} = {value}"))
+        return search_settings
@@ -0,0 +1,315 @@
+"""
+Cache local de videos para workers - direccionado por contenido (SHA-256)
+
+Reintentos, reprocesamientos y tareas secundarias sobre el mismo video reutilizan
+una copia en disco del nodo en lugar de volver a descargarla de S3.
+- Entradas por Video.sha256_hash, verificadas por SHA-256 antes de cada uso:
+  al descargar (en streaming) y, en cada hit, re-hasheando la copia local con el
+  lock compartido (no bloquea a otros lectores). Un manifiesto junto al video
+  guarda el digest, tamaño y mtime de la descarga y descarta sin leerlas las
+  entradas incompletas o modificadas
+- Presupuesto de tamaño con evicción LRU (mtime del manifiesto actualizado en cada hit)
+- Locks de archivo (fcntl): los hits se resuelven con el lock compartido, que se
+  mantiene durante el uso; el exclusivo se toma sólo para descargar una entrada
+  ausente. Así un hit no espera a otra tarea que esté usando el mismo video, y
+  la evicción nunca borra un video en uso
+"""
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+from app.core.config import settings
+from app.services.storage_service import StorageService
+
+
+class CachedVideo:
+    """Video disponible en disco local mientras no se llame a release()"""
+    
+    def __init__(
+        self,
+        path: str,
+        lock_file=None,
+        temporary: bool = False,
+        cache_hit: bool = False,
+        integrity_check: str = "sha256_download"
+    ):
+        """
+        Args:
+            integrity_check: Cómo se verificó el SHA-256 para este uso:
+                "sha256_download" (al descargar) o "sha256_cache_hit" (re-hash de la copia en cache)
+        """
+        self.path = path
+        self.cache_hit = cache_hit
+        self.integrity_check = integrity_check
+        self._lock_file = lock_file
+        self._temporary = temporary
+    
+    def release(self):
+        """Liberar el video: soltar el lock compartido (o borrar la copia temporal)"""
+        if self._lock_file is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+        if self._temporary:
+            Path(self.path).unlink(missing_ok=True)
+            self._temporary = False
+
+
+class VideoCache:
+    """Cache de videos por nodo con presupuesto de tamaño y evicción LRU"""
+    
+    def __init__(
+        self,
+        storage: Optional[StorageService] = None,
+        cache_dir: Optional[str] = None,
+        max_bytes: Optional[int] = None,
+        enabled: Optional[bool] = None
+    ):
+        self.storage = storage or StorageService()
+        self.cache_dir = Path(cache_dir or settings.VIDEO_CACHE_DIR)
+        self.max_bytes = max_bytes if max_bytes is not None else int(settings.VIDEO_CACHE_MAX_GB * 1024 ** 3)
+        self.enabled = settings.VIDEO_CACHE_ENABLED if enabled is None else enabled
+        
+        if self.enabled:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+    
+    def acquire(self, sha256_hash: str, s3_key: str, expected_size: Optional[int] = None) -> CachedVideo:
+        """
+        Obtener el video en disco local, descargándolo sólo si no está en cache
+        
+        El llamador debe invocar release() al terminar de usar el archivo.
+        """
+        if not self.enabled:
+            with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as tmp_file:
+                video_path = tmp_file.name
+            self.storage.download_to_file(s3_key, video_path, expected_sha256=sha256_hash)
+            return CachedVideo(video_path, temporary=True)
+        
+        entry_path = self._entry_path(sha256_hash)
+        lock_file = open(self._lock_path(sha256_hash), 'a+')
+        
+        try:
+            cache_hit = True
+            verified = False  # SHA-256 ya comprobado en esta llamada (con el lock exclusivo)
+            while True:
+                # Compartido: verificar y usar. Otros lectores pueden entrar; la evicción no
+                lock_file = self._lock(lock_file, sha256_hash, fcntl.LOCK_SH)
+                if self._is_valid(entry_path, sha256_hash):
+                    if verified or self._verify(entry_path, sha256_hash):
+                        os.utime(self._manifest_path(entry_path))  # LRU: marcar como usado recientemente
+                        break
+                    print(f"⚠️  Entrada de cache corrupta (SHA-256 no coincide): {sha256_hash}")
+                
+                # Ausente, modificada o corrupta: exclusivo para volver a comprobar o descargar
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file = self._lock(lock_file, sha256_hash, fcntl.LOCK_EX)
+                if not (self._is_valid(entry_path, sha256_hash) and self._verify(entry_path, sha256_hash)):
+                    self._download(entry_path, sha256_hash, s3_key, expected_size)
+                    cache_hit = False
+                verified = True
+                # Vuelve a comprobar el manifiesto con el lock compartido (la conversión de flock no es atómica)
+            
+            self._record(hit=cache_hit)
+            return CachedVideo(
+                str(entry_path), lock_file=lock_file, cache_hit=cache_hit,
+                integrity_check="sha256_cache_hit" if cache_hit else "sha256_download"
+            )
+        except Exception:
+            if not lock_file.closed:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+            raise
+    
+    def stats(self) -> dict:
+        """Estadísticas del cache del nodo (acumuladas entre procesos)"""
+        counters = self._read_counters()
+        total = counters["hits"] + counters["misses"]
+        entries = list(self.cache_dir.glob("*/*.mp4")) if self.enabled else []
+        
+        return {
+            "enabled": self.enabled,
+            "hits": counters["hits"],
+            "misses": counters["misses"],
+            "hit_rate": counters["hits"] / total if total else 0.0,
+            "entries": len(entries),
+            "size_bytes": sum(p.stat().st_size for p in entries if p.exists()),
+            "max_bytes": self.max_bytes
+        }
+    
+    def _is_valid(self, entry_path: Path, sha256_hash: str) -> bool:
+        """Entrada completa y sin cambios de tamaño/mtime desde la descarga (el contenido lo verifica _verify)"""
+        try:
+            manifest = json.loads(self._manifest_path(entry_path).read_text())
+            stat = entry_path.stat()
+        except (FileNotFoundError, ValueError):
+            return False
+        return (
+            manifest.get("sha256") == sha256_hash
+            and manifest.get("size") == stat.st_size
+            and manifest.get("mtime_ns") == stat.st_mtime_ns
+        )
+    
+    def _verify(self, path: Path, sha256_hash: str) -> bool:
+        """Recalcular el SHA-256 de la entrada antes de usarla"""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while chunk := f.read(8 * 1024 * 1024):
+                digest.update(chunk)
+        return digest.hexdigest() == sha256_hash
+    
+    def _download(self, entry_path: Path, sha256_hash: str, s3_key: str, expected_size: Optional[int]):
+        """Descargar y verificar la entrada (con el lock exclusivo tomado) y escribir su manifiesto"""
+        manifest_path = self._manifest_path(entry_path)
+        if entry_path.exists():
+            print(f"⚠️  Entrada de cache inválida, se descarga de nuevo: {sha256_hash}")
+        manifest_path.unlink(missing_ok=True)
+        entry_path.unlink(missing_ok=True)
+        
+        self._evict(reserve_bytes=expected_size or 0)
+        
+        entry_path.parent.mkdir(parents=True, exist_ok=True)
+        partial_path = entry_path.with_suffix('.part')
+        # download_to_file calcula el SHA-256 al escribir y falla si no coincide
+        self.storage.download_to_file(s3_key, str(partial_path), expected_sha256=sha256_hash)
+        os.replace(partial_path, entry_path)
+        
+        stat = entry_path.stat()
+        manifest_partial = manifest_path.with_suffix('.json.part')
+        manifest_partial.write_text(json.dumps({
+            "sha256": sha256_hash,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns
+        }))
+        os.replace(manifest_partial, manifest_path)
+    
+    def _lock(self, lock_file, sha256_hash: str, operation: int):
+        """
+        flock sobre el archivo de lock vigente de la entrada
+        
+        La evicción borra el archivo de lock de las entradas que elimina: si eso
+        ocurrió mientras se esperaba el lock, se reabre el archivo actual.
+        """
+        while True:
+            fcntl.flock(lock_file, operation)
+            try:
+                current = os.stat(lock_file.name)
+                locked = os.fstat(lock_file.fileno())
+                if (current.st_dev, current.st_ino) == (locked.st_dev, locked.st_ino):
+                    return lock_file
+            except FileNotFoundError:
+                pass
+            lock_file.close()
+            lock_file = open(self._lock_path(sha256_hash), 'a+')
+    
+    def _evict(self, reserve_bytes: int = 0):
+        """
+        Eliminar las entradas menos usadas hasta dejar espacio para reserve_bytes
+        
+        También limpia los restos que no cuentan en el presupuesto: descargas
+        parciales (.part) de procesos caídos y archivos de lock sin entrada.
+        """
+        with open(self.cache_dir / ".evict.lock", 'a+') as evict_lock:
+            fcntl.flock(evict_lock, fcntl.LOCK_EX)
+            
+            entries = []
+            for path in self.cache_dir.glob("*/*.mp4"):
+                try:
+                    size = path.stat().st_size
+                except FileNotFoundError:
+                    continue
+                try:
+                    last_used = self._manifest_path(path).stat().st_mtime
+                except FileNotFoundError:
+                    last_used = 0.0  # Sin manifiesto: entrada incompleta, primera en salir
+                entries.append((last_used, size, path))
+            
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total + reserve_bytes <= self.max_bytes:
+                    break
+                
+                if self._remove_entry(path.stem):
+                    total -= size
+            
+            # Restos sin entrada: .part de descargas interrumpidas y locks huérfanos
+            leftovers = {
+                path.name.split(".", 1)[0]
+                for pattern in ("*/*.part", "*/*.lock")
+                for path in self.cache_dir.glob(pattern)
+            }
+            for sha256_hash in leftovers:
+                if not self._entry_path(sha256_hash).exists():
+                    self._remove_entry(sha256_hash)
+    
+    def _remove_entry(self, sha256_hash: str) -> bool:
+        """
+        Borrar la entrada, sus parciales y su lock si nadie la usa ni la descarga
+        
+        Returns:
+            False si otro proceso tiene el lock (en uso o descargando)
+        """
+        entry_path = self._entry_path(sha256_hash)
+        lock_path = self._lock_path(sha256_hash)
+        with open(lock_path, 'a+') as entry_lock:
+            try:
+                fcntl.flock(entry_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False  # En uso por otro proceso
+            manifest_path = self._manifest_path(entry_path)
+            for path in (
+                manifest_path, entry_path, entry_path.with_suffix('.part'), manifest_path.with_suffix('.json.part')
+            ):
+                path.unlink(missing_ok=True)
+            # Borrado con el lock tomado: quien espere en este archivo lo reabre (ver _lock)
+            lock_path.unlink(missing_ok=True)
+        return True
+    
+    def _record(self, hit: bool):
+        """Acumular hits/misses en el archivo de estadísticas del nodo"""
+        with open(self.cache_dir / "stats.json", 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            try:
+                counters = json.loads(f.read() or "{}")
+            except ValueError:
+                counters = {}
+            
+            key = "hits" if hit else "misses"
+            counters[key] = counters.get(key, 0) + 1
+            counters["updated_at"] = time.time()
+            
+            f.seek(0)
+            f.truncate()
+            f.write(json.dumps(counters))
+    
+    def _read_counters(self) -> dict:
+        """Leer hits/misses acumulados"""
+        stats_path = self.cache_dir / "stats.json"
+        counters = {"hits": 0, "misses": 0}
+        if not self.enabled or not stats_path.exists():
+            return counters
+        
+        try:
+            counters.update(json.loads(stats_path.read_text() or "{}"))
+        except ValueError:
+            pass
+        return counters
+    
+    def _entry_path(self, sha256_hash: str) -> Path:
+        """Ruta de la entrada (subdirectorio por prefijo para no saturar un directorio)"""
+        return self.cache_dir / sha256_hash[:2] / f"{sha256_hash}.mp4"
+    
+    def _manifest_path(self, entry_path: Path) -> Path:
+        """Manifiesto de la entrada: digest verificado al descargar, tamaño y mtime"""
+        return entry_path.with_suffix('.json')
+    
+    def _lock_path(self, sha256_hash: str) -> Path:
+        """Archivo de lock de la entrada (persistente, independiente del video)"""
+        lock_dir = self.cache_dir / sha256_hash[:2]
+        lock_dir.mkdir(parents=True, exist_ok=True)
+        return lock_dir / f"{sha256_hash}.lock"
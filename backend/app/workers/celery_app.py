@@ -40,4 +40,16 @@ celery_app.conf.beat_schedule = {
         "task": "app.workers.tasks.cleanup_old_tasks",
         "schedule": 3600.0,  # Cada hora
     },
+    "maintain-vector-index": {
+        "task": "app.workers.tasks.maintain_vector_index_task",
+        "schedule": 3600.0,  # Cada hora (y tras cargas masivas)
+    },
+    "cluster-faces": {
+        "task": "app.workers.tasks.cluster_faces_task",
+        "schedule": 300.0,  # Caras pendientes que no alcanzó el disparo tras el ingest
+    },
+    "recluster-faces": {
+        "task": "app.workers.tasks.recluster_faces_task",
+        "schedule": 86400.0,  # Diario
+    },
 }
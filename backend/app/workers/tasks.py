@@ -5,25 +5,110 @@ Pipeline completo: Detección de objetos, reconocimiento facial, super-resolutio
 import cv2
 import numpy as np
 from celery import Task
-from typing import List
-import tempfile
-from pathlib import Path
+from typing import List, Optional
 from datetime import datetime, timedelta
 import uuid
 
 from app.workers.celery_app import celery_app
 from app.models.database import SessionLocal
 from app.models.models import (
-    Video, VideoStatus, FaceEmbedding, DetectedObject,
+    Video, VideoStatus, FaceEmbedding,
     ProcessingTask, MotionHeatmap, ChainOfCustody, Alert, AlertLevel
 )
 from app.forensics.ai_inference import AIInferenceModule
 from app.forensics.super_resolution import SuperResolutionModule
 from app.services.video_service import VideoService
 from app.services.storage_service import StorageService
+from app.services.artifact_uploader import ArtifactUploader
+from app.services.face_crop_archive import FaceCropArchiveWriter, read_crop
+from app.services.renditions import RenditionGenerator
+from app.services.bulk_writer import BulkDetectionWriter
+from app.services.object_summary import ObjectSummaryAccumulator
+from app.services.object_tracker import ObjectTracker
+from app.services.poi_watchlist import POIMatchRecorder, get_watchlist
+from app.services.face_clustering import FaceClusterer
+from app.services.cooccurrence import CooccurrenceIndex, completed_videos
+from app.services.face_search_service import search_similar_faces
+from app.services.vector_index import VectorIndexManager
+from app.services.video_cache import VideoCache
 from app.core.config import settings
 
 
+# Módulo de Super-Resolution reutilizado entre tareas del mismo proceso worker
+_sr_module = None
+
+
+def get_sr_module() -> SuperResolutionModule:
+    """Cargar Real-ESRGAN una sola vez por proceso worker"""
+    global _sr_module
+    if _sr_module is None:
+        _sr_module = SuperResolutionModule(
+            model_path=settings.ESRGAN_MODEL_PATH,
+            tile_size=settings.ESRGAN_TILE_SIZE,
+            tile_overlap=settings.ESRGAN_TILE_OVERLAP,
+            tile_workers=settings.ESRGAN_TILE_WORKERS,
+            memory_fraction=settings.ESRGAN_MEMORY_FRACTION,
+            fallback_tier=settings.ESRGAN_FALLBACK_TIER
+        )
+    return _sr_module
+
+
+def should_enhance_on_ingest(face_confidence: float, face_crop: np.ndarray) -> bool:
+    """Decidir según FACE_ENHANCEMENT_POLICY si una cara se mejora durante el ingest"""
+    policy = settings.FACE_ENHANCEMENT_POLICY
+    if policy == "eager":
+        return True
+    if policy == "eager_high_quality":
+        return (
+            (face_confidence or 0) >= settings.FACE_ENHANCEMENT_MIN_CONFIDENCE
+            and min(face_crop.shape[:2]) >= settings.FACE_ENHANCEMENT_MIN_SIZE
+        )
+    # "lazy": sólo bajo demanda con enhance_face_task
+    return False
+
+
+# Columnas de FaceEmbedding por carpeta de recortes: (URL compatible, renditions)
+_CROP_FIELDS = {
+    "faces": ("face_image_url", "face_renditions"),
+    "faces_enhanced": ("enhanced_face_url", "enhanced_face_renditions")
+}
+
+
+def _store_face_crop(
+    uploader: ArtifactUploader,
+    archive: Optional[FaceCropArchiveWriter],
+    face_id,
+    renditions: dict,
+    stem: str,
+    folder: str
+):
+    """
+    Guardar las renditions de un recorte según FACE_CROP_STORAGE
+    
+    En ambos formatos las columnas se registran al resolver la subida (del shard
+    o de los objetos individuales), una vez que la fila ya existe.
+    """
+    url_field, renditions_field = _CROP_FIELDS[folder]
+    target = (FaceEmbedding, face_id, renditions_field)
+    if archive is not None:
+        archive.append_renditions(face_id, renditions, target=target, url_field=url_field)
+    else:
+        uploader.submit_renditions(renditions, stem, folder, target=target, url_field=url_field)
+
+
+def _enhance_and_upload(
+    sr_module: SuperResolutionModule,
+    uploader: ArtifactUploader,
+    generator: RenditionGenerator,
+    pending: list,
+    archive: Optional[FaceCropArchiveWriter] = None
+):
+    """Mejorar en batch los recortes pendientes y guardar sus renditions (enhanced_face_*)"""
+    enhanced_faces = sr_module.batch_enhance_faces([crop for _, crop in pending], target_resolution="4k")
+    for (face_id, _), renditions in zip(pending, generator.generate_many(enhanced_faces)):
+        _store_face_crop(uploader, archive, face_id, renditions, str(face_id), "faces_enhanced")
+
+
 class DatabaseTask(Task):
     """Base task con sesión de base de datos"""
     _db = None
@@ -52,6 +137,9 @@ def process_video_task(self, video_id: str):
     if not video:
         return {"error": "Video no encontrado"}
     
+    cached_video = None
+    uploader = None
+    
     try:
         # Actualizar estado
         video.status = VideoStatus.PROCESSING
@@ -60,14 +148,15 @@ def process_video_task(self, video_id: str):
         # Actualizar progreso: 10%
         self.update_state(state='PROGRESS', meta={'progress': 10, 'status': 'Descargando video'})
         
-        # Descargar video de S3
+        # Obtener video del cache local del nodo o descargarlo de S3 (SHA-256 verificado)
         storage = StorageService()
-        video_content = await storage.download_file(f"videos/{video.filename}")
-        
-        # Guardar temporalmente
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as tmp_file:
-            tmp_file.write(video_content)
-            video_path = tmp_file.name
+        uploader = ArtifactUploader(storage)
+        cached_video = VideoCache(storage).acquire(
+            video.sha256_hash,
+            f"videos/{video.filename}",
+            expected_size=video.file_size
+        )
+        video_path = cached_video.path
         
         # Extraer metadata
         self.update_state(state='PROGRESS', meta={'progress': 20, 'status': 'Extrayendo metadata'})
@@ -82,10 +171,12 @@ def process_video_task(self, video_id: str):
         # Generar thumbnail
         self.update_state(state='PROGRESS', meta={'progress': 25, 'status': 'Generando thumbnail'})
         thumbnail = video_service.generate_thumbnail(video_path)
-        thumbnail_bytes = cv2.imencode('.jpg', thumbnail)[1].tobytes()
-        thumbnail_url = await storage.upload_image(thumbnail_bytes, f"{video.id}_thumb.jpg", "thumbnails")
-        video.thumbnail_url = thumbnail_url
-        db.commit()
+        generator = RenditionGenerator()
+        uploader.submit_renditions(
+            generator.generate(thumbnail), f"{video.id}_thumb", "thumbnails",
+            target=(Video, video.id, "thumbnail_renditions"),
+            url_field="thumbnail_url"
+        )
         
         # Extraer frames para análisis
         self.update_state(state='PROGRESS', meta={'progress': 30, 'status': 'Extrayendo frames'})
@@ -96,12 +187,32 @@ def process_video_task(self, video_id: str):
             yolo_model_path=settings.YOLO_MODEL_PATH,
             deepface_model=settings.DEEPFACE_MODEL
         )
-        sr_module = SuperResolutionModule(model_path=settings.ESRGAN_MODEL_PATH)
+        # Real-ESRGAN sólo se carga si la política mejora caras durante el ingest
+        sr_module = get_sr_module() if settings.FACE_ENHANCEMENT_POLICY != "lazy" else None
+        
+        # Formato empaquetado: recortes agregados a shards por video en lugar de un objeto por cara
+        face_archive = enhanced_archive = None
+        if settings.FACE_CROP_STORAGE == "packed":
+            face_archive = FaceCropArchiveWriter(video.id, "faces", uploader)
+            enhanced_archive = FaceCropArchiveWriter(video.id, "faces_enhanced", uploader)
+        
+        # Detecciones y embeddings se escriben en bloque (COPY / executemany), sin objetos ORM
+        writer = BulkDetectionWriter(db)
+        
+        # Caras nuevas contra la watchlist POI en memoria (un producto matricial por lote)
+        poi_recorder = POIMatchRecorder(get_watchlist(), video)
+        
+        # Resumen por clase de objeto (una fila por clase al final del video)
+        object_summary = ObjectSummaryAccumulator()
+        
+        # Tracks de objetos (IoU + clase): una fila por objeto en lugar de una por frame
+        tracker = ObjectTracker(video.id) if settings.OBJECT_TRACKING_ENABLED else None
         
         # Procesar cada frame
         total_frames = len(frames)
         faces_detected = 0
         objects_detected = 0
+        pending_enhancement = []  # (id de FaceEmbedding, recorte) a mejorar en batch
         
         for idx, (frame_number, frame) in enumerate(frames):
             progress = 30 + (idx / total_frames * 50)  # 30% - 80%
@@ -118,19 +229,23 @@ def process_video_task(self, video_id: str):
             # Detectar objetos con YOLO
             objects = ai_module.detect_objects(frame, confidence_threshold=settings.OBJECT_DETECTION_CONFIDENCE)
             for obj in objects:
-                detected_obj = DetectedObject(
-                    video_id=video.id,
-                    frame_number=frame_number,
-                    timestamp_in_video=timestamp,
-                    object_class=obj['class'],
-                    confidence=obj['confidence'],
-                    bbox_x=obj['bbox']['x'],
-                    bbox_y=obj['bbox']['y'],
-                    bbox_width=obj['bbox']['width'],
-                    bbox_height=obj['bbox']['height']
-                )
-                db.add(detected_obj)
+                if tracker is None or settings.OBJECT_STORE_FRAME_DETECTIONS:
+                    writer.add_object(
+                        video_id=video.id,
+                        frame_number=frame_number,
+                        timestamp_in_video=timestamp,
+                        object_class=obj['class'],
+                        confidence=obj['confidence'],
+                        bbox_x=obj['bbox']['x'],
+                        bbox_y=obj['bbox']['y'],
+                        bbox_width=obj['bbox']['width'],
+                        bbox_height=obj['bbox']['height']
+                    )
+                object_summary.add(obj['class'], frame_number, timestamp, obj['confidence'])
                 objects_detected += 1
+            if tracker is not None:
+                for track in tracker.update(frame_number, timestamp, objects):
+                    writer.add_track(**track)
             
             # Detectar caras con DeepFace
             faces = ai_module.detect_faces(frame, confidence_threshold=settings.FACE_DETECTION_CONFIDENCE)
@@ -151,21 +266,18 @@ def process_video_task(self, video_id: str):
                 # Analizar atributos faciales
                 attributes = ai_module.analyze_face_attributes(face_crop)
                 
-                # Guardar cara original
-                face_bytes = cv2.imencode('.jpg', face_crop)[1].tobytes()
-                face_filename = f"{video.id}_face_{frame_number}_{uuid.uuid4()}.jpg"
-                face_url = await storage.upload_image(face_bytes, face_filename, "faces")
-                
-                # Mejorar cara con Super-Resolution
-                enhanced_face = sr_module.enhance_face(face_crop, target_resolution="4k")
-                enhanced_bytes = cv2.imencode('.jpg', enhanced_face)[1].tobytes()
-                enhanced_filename = f"{video.id}_face_enhanced_{frame_number}_{uuid.uuid4()}.jpg"
-                enhanced_url = await storage.upload_image(enhanced_bytes, enhanced_filename, "faces_enhanced")
+                # Guardar cara original (shard o subida en cola resuelta luego)
+                face_id = uuid.uuid4()
+                _store_face_crop(
+                    uploader, face_archive, face_id, generator.generate(face_crop),
+                    f"{video.id}_face_{frame_number}_{face_id}", "faces"
+                )
                 
                 # Crear registro de embedding facial
-                face_embedding = FaceEmbedding(
+                writer.add_face(
+                    id=face_id,
                     video_id=video.id,
-                    embedding=embedding.tolist(),
+                    embedding=embedding,
                     frame_number=frame_number,
                     timestamp_in_video=timestamp,
                     confidence=face['confidence'],
@@ -176,16 +288,40 @@ def process_video_task(self, video_id: str):
                     age=attributes.get('age'),
                     gender=attributes.get('gender'),
                     emotion=attributes.get('emotion'),
-                    race=attributes.get('race'),
-                    face_image_url=face_url,
-                    enhanced_face_url=enhanced_url
+                    race=attributes.get('race')
                 )
-                db.add(face_embedding)
+                poi_recorder.add(face_id, embedding, timestamp)
                 faces_detected += 1
+                
+                # Mejorar cara con Super-Resolution (o dejarla para enhance_face_task)
+                if sr_module is not None and should_enhance_on_ingest(face['confidence'], face_crop):
+                    pending_enhancement.append((face_id, face_crop.copy()))
+            
+            if len(pending_enhancement) >= settings.FACE_ENHANCEMENT_BATCH_SIZE:
+                _enhance_and_upload(sr_module, uploader, generator, pending_enhancement, enhanced_archive)
+                pending_enhancement = []
             
-            # Commit cada 10 frames
-            if idx % 10 == 0:
+            # Escribir el lote al llenarse y registrar en bloque las URLs ya subidas
+            # (sólo tras el flush: las filas destino deben existir)
+            if writer.is_full:
+                writer.flush()
+                poi_recorder.flush(db)
                 db.commit()
+                uploader.resolve(db)
+        
+        if pending_enhancement:
+            _enhance_and_upload(sr_module, uploader, generator, pending_enhancement, enhanced_archive)
+        if tracker is not None:
+            for track in tracker.finish():
+                writer.add_track(**track)
+        writer.flush()
+        poi_recorder.flush(db)
+        object_summary.save(db, video)
+        
+        # Subir los últimos shards y sus índices
+        for archive in (face_archive, enhanced_archive):
+            if archive is not None:
+                archive.close()
         
         # Commit final
         db.commit()
@@ -194,19 +330,28 @@ def process_video_task(self, video_id: str):
         self.update_state(state='PROGRESS', meta={'progress': 85, 'status': 'Generando heatmap de movimiento'})
         frame_images = [f[1] for f in frames[:100]]  # Primeros 100 frames
         heatmap = ai_module.generate_motion_heatmap(frame_images)
-        heatmap_bytes = cv2.imencode('.jpg', heatmap)[1].tobytes()
-        heatmap_url = await storage.upload_image(heatmap_bytes, f"{video.id}_heatmap.jpg", "heatmaps")
         
-        # Guardar heatmap
+        # Guardar heatmap (URL registrada al resolver la subida)
+        heatmap_id = uuid.uuid4()
+        uploader.submit_renditions(
+            generator.generate(heatmap), f"{video.id}_heatmap", "heatmaps",
+            target=(MotionHeatmap, heatmap_id, "heatmap_renditions"),
+            url_field="heatmap_image_url"
+        )
         motion_heatmap = MotionHeatmap(
+            id=heatmap_id,
             video_id=video.id,
-            heatmap_image_url=heatmap_url,
             start_time=0,
             end_time=min(100 / metadata['fps'], metadata['duration']),
             total_movement_score=0,  # TODO: Calcular score
             hotspot_count=0
         )
         db.add(motion_heatmap)
+        db.commit()
+        
+        # Esperar las subidas pendientes y registrar sus URLs
+        self.update_state(state='PROGRESS', meta={'progress': 90, 'status': 'Subiendo artefactos'})
+        uploader.resolve(db, wait_all=True)
         
         # Actualizar video
         self.update_state(state='PROGRESS', meta={'progress': 95, 'status': 'Finalizando procesamiento'})
@@ -229,7 +374,9 @@ def process_video_task(self, video_id: str):
             operation_details={
                 "faces_detected": faces_detected,
                 "objects_detected": objects_detected,
-                "processing_time": "completed"
+                "processing_time": "completed",
+                "integrity_verified": True,
+                "integrity_check": cached_video.integrity_check
             }
         )
         db.add(custody)
@@ -247,14 +394,24 @@ def process_video_task(self, video_id: str):
         db.add(alert)
         db.commit()
         
-        # Limpiar archivo temporal
-        Path(video_path).unlink(missing_ok=True)
+        # Carga masiva de embeddings: IVFFlat puede necesitar re-entrenarse
+        if faces_detected >= settings.VECTOR_INDEX_BULK_LOAD_ROWS:
+            celery_app.send_task("app.workers.tasks.maintain_vector_index_task")
+        
+        # Asignar identidades a las caras nuevas
+        if faces_detected:
+            celery_app.send_task("app.workers.tasks.cluster_faces_task")
         
         return {
             "status": "completed",
             "video_id": str(video.id),
             "faces_detected": faces_detected,
-            "objects_detected": objects_detected
+            "objects_detected": objects_detected,
+            "object_tracks": tracker.tracks_closed if tracker is not None else 0,
+            "poi_matches": poi_recorder.hits,
+            "video_cache_hit": cached_video.cache_hit,
+            "artifacts_uploaded": uploader.uploaded,
+            "artifact_upload_failures": uploader.failed
         }
     
     except Exception as e:
@@ -273,30 +430,190 @@ def process_video_task(self, video_id: str):
         db.commit()
         
         raise
+    
+    finally:
+        # Liberar el video (copia temporal si el cache está deshabilitado)
+        if cached_video is not None:
+            cached_video.release()
+        if uploader is not None:
+            uploader.close()
 
 
 @celery_app.task(name="app.workers.tasks.search_similar_faces_task")
 def search_similar_faces_task(face_embedding_id: str, threshold: float = 0.6):
-    """Búsqueda asíncrona de caras similares"""
-    # Implementar búsqueda de similitud
-    pass
+    """Búsqueda asíncrona de caras similares (registra las coincidencias en FaceMatch)"""
+    db = SessionLocal()
+    
+    try:
+        face = db.query(FaceEmbedding).filter(FaceEmbedding.id == uuid.UUID(face_embedding_id)).first()
+        if not face:
+            return {"error": "Cara no encontrada"}
+        
+        results = search_similar_faces(
+            db,
+            face.embedding,
+            threshold=threshold,
+            max_results=settings.MAX_FACE_MATCHES,
+            exclude_face_id=face.id
+        )
+        FaceClusterer().record_edges(db, ((face.id, row.id, row.distance) for row in results))
+        db.commit()
+        
+        return {
+            "face_embedding_id": face_embedding_id,
+            "matches": [
+                {"face_id": str(row.id), "video_id": str(row.video_id), "distance": row.distance}
+                for row in results
+            ]
+        }
+    finally:
+        db.close()
+
+
+@celery_app.task(name="app.workers.tasks.cluster_faces_task")
+def cluster_faces_task(max_batches: Optional[int] = None):
+    """Asignar identidad a las caras nuevas (varios workers pueden correr en paralelo)"""
+    db = SessionLocal()
+    
+    try:
+        result = FaceClusterer().assign_pending(db, max_batches=max_batches)
+        
+        # Videos con todas sus caras asignadas: actualizar co-apariciones
+        ready = completed_videos(db, result["video_ids"])
+        if ready:
+            celery_app.send_task("app.workers.tasks.build_cooccurrence_task", kwargs={"video_ids": ready})
+        return result
+    finally:
+        db.close()
+
+
+@celery_app.task(name="app.workers.tasks.recluster_faces_task")
+def recluster_faces_task():
+    """Re-agrupamiento periódico: fusionar identidades conectadas"""
+    db = SessionLocal()
+    
+    try:
+        result = FaceClusterer().recluster(db)
+        
+        # Las identidades fusionadas cambian los pares de estos videos
+        if result["video_ids"]:
+            celery_app.send_task("app.workers.tasks.build_cooccurrence_task", kwargs={"video_ids": result["video_ids"]})
+        return result
+    finally:
+        db.close()
+
+
+@celery_app.task(name="app.workers.tasks.build_cooccurrence_task")
+def build_cooccurrence_task(video_ids: List[str]):
+    """Reconstruir el índice de co-apariciones de los videos indicados"""
+    db = SessionLocal()
+    index = CooccurrenceIndex()
+    
+    try:
+        pairs = 0
+        for video_id in video_ids:
+            pairs += index.build_video(db, uuid.UUID(video_id))
+            db.commit()
+        return {"videos": len(video_ids), "pairs": pairs}
+    finally:
+        db.close()
 
 
 @celery_app.task(name="app.workers.tasks.enhance_face_task")
-def enhance_face_task(face_embedding_id: str):
-    """Tarea para mejorar calidad de una cara específica"""
+def enhance_face_task(face_embedding_ids: Optional[List[str]] = None, poi_only: bool = False):
+    """
+    Mejorar caras bajo demanda con Super-Resolution (cola "enhancement")
+    
+    Args:
+        face_embedding_ids: IDs de FaceEmbedding a mejorar
+        poi_only: Si no se indican IDs, mejorar todas las caras marcadas como POI
+    
+    Las renditions se guardan con keys deterministas (faces_enhanced/{id}_{rendition})
+    y se registran en enhanced_face_renditions / enhanced_face_url; las caras ya
+    mejoradas no se reprocesan.
+    """
+    if not face_embedding_ids and not poi_only:
+        return {"error": "Se requieren face_embedding_ids o poi_only"}
+    
     db = SessionLocal()
+    uploader = None
     
     try:
-        face = db.query(FaceEmbedding).filter(FaceEmbedding.id == uuid.UUID(face_embedding_id)).first()
-        if not face:
-            return {"error": "Face not found"}
+        query = db.query(FaceEmbedding).filter(
+            FaceEmbedding.enhanced_face_url.is_(None),
+            FaceEmbedding.face_image_url.isnot(None)
+        )
+        if face_embedding_ids:
+            query = query.filter(FaceEmbedding.id.in_([uuid.UUID(f) for f in face_embedding_ids]))
+        else:
+            query = query.filter(FaceEmbedding.is_person_of_interest == True)
+        
+        faces = query.all()
+        if not faces:
+            return {"status": "enhanced", "enhanced": 0, "skipped": 0}
         
-        # Descargar cara
         storage = StorageService()
-        # TODO: Implementar mejora
+        uploader = ArtifactUploader(storage)
+        sr_module = get_sr_module()
+        generator = RenditionGenerator()
+        archives = {}  # video_id -> FaceCropArchiveWriter (formato empaquetado)
+        enhanced_count = 0
+        skipped = 0
         
-        return {"status": "enhanced"}
+        # Procesar en lotes: una pasada del modelo por bucket de tamaño
+        for start in range(0, len(faces), settings.FACE_ENHANCEMENT_BATCH_SIZE):
+            batch_faces = []
+            batch_crops = []
+            for face in faces[start:start + settings.FACE_ENHANCEMENT_BATCH_SIZE]:
+                # Descargar cara original
+                try:
+                    face_bytes = read_crop(storage, face.face_image_url)
+                except (FileNotFoundError, ValueError):
+                    face_bytes = b""
+                face_crop = cv2.imdecode(np.frombuffer(face_bytes, np.uint8), cv2.IMREAD_COLOR) if face_bytes else None
+                if face_crop is None:
+                    skipped += 1
+                    continue
+                batch_faces.append(face)
+                batch_crops.append(face_crop)
+            
+            # Las subidas de este lote se solapan con la inferencia del siguiente
+            enhanced_faces = sr_module.batch_enhance_faces(batch_crops, target_resolution="4k")
+            for face, renditions in zip(batch_faces, generator.generate_many(enhanced_faces)):
+                archive = None
+                if settings.FACE_CROP_STORAGE == "packed":
+                    if face.video_id not in archives:
+                        archives[face.video_id] = FaceCropArchiveWriter(face.video_id, "faces_enhanced", uploader)
+                    archive = archives[face.video_id]
+                _store_face_crop(uploader, archive, face.id, renditions, str(face.id), "faces_enhanced")
+            enhanced_count += uploader.resolve(db)
+            db.commit()
+        
+        for archive in archives.values():
+            archive.close()
+        enhanced_count += uploader.resolve(db, wait_all=True)
+        db.commit()
+        
+        return {"status": "enhanced", "enhanced": enhanced_count, "skipped": skipped}
+    finally:
+        if uploader is not None:
+            uploader.close()
+        db.close()
+
+
+@celery_app.task(name="app.workers.tasks.video_cache_stats_task")
+def video_cache_stats_task():
+    """Estadísticas del cache local de videos del nodo (hit rate, tamaño, entradas)"""
+    return VideoCache().stats()
+
+
+@celery_app.task(name="app.workers.tasks.maintain_vector_index_task")
+def maintain_vector_index_task():
+    """Construir o re-entrenar el índice vectorial de caras si hace falta"""
+    db = SessionLocal()
+    
+    try:
+        return VectorIndexManager().maintain(db)
     finally:
         db.close()
 
@@ -2,12 +2,17 @@
 API Principal - ForensicVideo AI Platform
 FastAPI con endpoints para autenticación, upload de videos, procesamiento, búsqueda facial y reportes
 """
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form, BackgroundTasks, Response, Request, Query, Header
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import RedirectResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, defer
 from typing import List, Optional
-from datetime import timedelta
+from datetime import datetime, timedelta
+import asyncio
 import hashlib
 import uuid
 from pydantic import BaseModel, EmailStr
@@ -17,15 +22,27 @@ from app.core.auth import (
     AuthService, get_current_user, require_admin, 
     require_investigator, PermissionChecker
 )
-from app.models.database import get_db, init_db
+from app.core.pagination import NEXT_CURSOR_HEADER, Keyset, projection
+from app.core.user_cache import InvalidationError, close_redis, invalidate_user, listen_for_invalidations
+from app.models.database import get_db, get_async_db, init_db
 from app.models.models import (
     User, Video, FaceEmbedding, ChainOfCustody, Alert, 
-    ForensicReport, ProcessingTask, UserRole, VideoStatus, AlertLevel
+    ForensicReport, ProcessingTask, UserRole, VideoStatus, AlertLevel, FaceIdentity, VideoObjectSummary,
+    ObjectTrack
 )
 # from app.services.video_service import VideoService
-# from app.services.storage_service import StorageService
+from app.services.storage_service import StorageService
+from app.services.face_crop_archive import shard_key
+from app.services.renditions import pick_rendition
+from app.services.upload_service import UPLOAD_TOKEN_HEADER, DirectUploadService, UploadError
+from app.services.cooccurrence import CooccurrenceIndex
+from app.services.object_tracker import decode_trajectory
+from app.services.face_search_service import (
+    SearchFilters, search_similar_faces as run_face_search, search_similar_faces_batch
+)
+from app.forensics.integrity import IntegrityModule
 # from app.services.forensic_service import ForensicService
-# from app.workers.celery_app import celery_app
+from app.workers.celery_app import celery_app
 # from app.workers.tasks import process_video_task
 
 # Inicializar FastAPI
@@ -39,6 +56,7 @@ app = FastAPI(
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.BACKEND_CORS_ORIGINS,
+    expose_headers=[NEXT_CURSOR_HEADER],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -68,6 +86,13 @@ class UserResponse(BaseModel):
         from_attributes = True
 
 
+class UserUpdate(BaseModel):
+    full_name: Optional[str] = None
+    role: Optional[UserRole] = None
+    organization: Optional[str] = None
+    is_active: Optional[bool] = None
+
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -81,6 +106,18 @@ class VideoUploadResponse(BaseModel):
     message: str
 
 
+class DirectUploadRequest(BaseModel):
+    filename: str
+    size: int
+    content_type: str = "video/mp4"
+    sha256: Optional[str] = None  # Si se indica, se verifica al completar
+
+
+class DirectUploadComplete(BaseModel):
+    upload_token: str
+    camera_id: Optional[str] = None
+
+
 class VideoResponse(BaseModel):
     id: uuid.UUID
     filename: str
@@ -92,6 +129,8 @@ class VideoResponse(BaseModel):
     uploaded_at: str
     processing_progress: float
     thumbnail_url: Optional[str]
+    thumbnail_renditions: Optional[dict] = None
+    camera_id: Optional[str] = None
     
     class Config:
         from_attributes = True
@@ -105,6 +144,8 @@ class FaceEmbeddingResponse(BaseModel):
     confidence: float
     face_image_url: Optional[str]
     enhanced_face_url: Optional[str]
+    face_renditions: Optional[dict] = None
+    enhanced_face_renditions: Optional[dict] = None
     is_person_of_interest: bool
     poi_label: Optional[str]
     age: Optional[int]
@@ -115,10 +156,21 @@ class FaceEmbeddingResponse(BaseModel):
         from_attributes = True
 
 
+class FaceSearchFilters(BaseModel):
+    video_ids: Optional[List[uuid.UUID]] = None
+    camera_ids: Optional[List[str]] = None
+    organization: Optional[str] = None
+    recorded_from: Optional[datetime] = None
+    recorded_to: Optional[datetime] = None
+    poi_only: bool = False
+
+
 class FaceSearchRequest(BaseModel):
     face_embedding_id: uuid.UUID
     threshold: float = 0.6
     max_results: int = 10
+    recall: Optional[float] = None  # Recall objetivo del índice vectorial (1.0 = búsqueda exacta)
+    filters: Optional[FaceSearchFilters] = None  # Acotar la búsqueda (p. ej. a un caso)
 
 
 class FaceMatchResponse(BaseModel):
@@ -130,6 +182,110 @@ class FaceMatchResponse(BaseModel):
     timestamp_in_video: float
 
 
+class FaceSearchQuery(BaseModel):
+    face_embedding_id: uuid.UUID
+    threshold: Optional[float] = None  # Por defecto el umbral del lote
+
+
+class BatchFaceSearchRequest(BaseModel):
+    queries: List[FaceSearchQuery] = []
+    video_id: Optional[uuid.UUID] = None  # Alternativa a queries: todas las caras del video
+    threshold: float = 0.6
+    max_results: int = 10
+    recall: Optional[float] = None
+    exclude_same_video: bool = True  # Ignorar coincidencias dentro del video de la cara consultada
+    filters: Optional[FaceSearchFilters] = None
+
+
+class FaceSearchGroupResponse(BaseModel):
+    query_face_id: uuid.UUID
+    threshold: float
+    matches: List[FaceMatchResponse]
+
+
+class FaceAppearanceResponse(BaseModel):
+    face_id: uuid.UUID
+    video_id: uuid.UUID
+    video_filename: str
+    timestamp_in_video: Optional[float]
+    confidence: Optional[float]
+    face_image_url: Optional[str]
+
+
+class FaceAppearancesResponse(BaseModel):
+    identity_id: uuid.UUID
+    label: Optional[str]
+    face_count: int
+    video_count: int
+    first_seen_at: Optional[datetime]
+    last_seen_at: Optional[datetime]
+    appearances: List[FaceAppearanceResponse]
+
+
+class CooccurrenceEvidence(BaseModel):
+    video_id: uuid.UUID
+    video_filename: str
+    first_timestamp: Optional[float]
+    last_timestamp: Optional[float]
+    occurrences: int
+
+
+class CooccurrenceResponse(BaseModel):
+    identity_id: uuid.UUID
+    label: Optional[str]
+    representative_face_id: Optional[uuid.UUID]
+    face_count: Optional[int]
+    videos: int
+    occurrences: int
+    evidence: List[CooccurrenceEvidence]
+
+
+class ObjectClassSummaryResponse(BaseModel):
+    object_class: str
+    detection_count: int
+    frame_count: int
+    first_seen: Optional[float]
+    last_seen: Optional[float]
+    max_confidence: Optional[float]
+    minute_histogram: List[int] = []
+    
+    class Config:
+        from_attributes = True
+
+
+class TrajectoryPoint(BaseModel):
+    frame_number: int
+    bbox_x: int
+    bbox_y: int
+    bbox_width: int
+    bbox_height: int
+
+
+class ObjectTrackResponse(BaseModel):
+    id: uuid.UUID
+    object_class: str
+    start_frame: int
+    end_frame: int
+    start_time: Optional[float]
+    end_time: Optional[float]
+    detection_count: int
+    peak_confidence: Optional[float]
+    peak_frame: Optional[int]
+    trajectory_points: int
+    trajectory: Optional[List[TrajectoryPoint]] = None
+
+
+class ObjectSearchResult(BaseModel):
+    video_id: uuid.UUID
+    video_filename: str
+    recorded_at: Optional[datetime]
+    object_class: str
+    detection_count: int
+    first_seen: Optional[float]
+    last_seen: Optional[float]
+    max_confidence: Optional[float]
+
+
 class AlertResponse(BaseModel):
     id: uuid.UUID
     title: str
@@ -149,6 +305,11 @@ class MarkPOIRequest(BaseModel):
     notes: Optional[str] = None
 
 
+class FaceEnhanceRequest(BaseModel):
+    face_embedding_ids: List[uuid.UUID] = []
+    poi_only: bool = False
+
+
 class ReportGenerateRequest(BaseModel):
     video_id: uuid.UUID
     report_type: str
@@ -157,6 +318,15 @@ class ReportGenerateRequest(BaseModel):
     include_chain_of_custody: bool = True
 
 
+# Claves de paginación keyset (cada una con su índice compuesto)
+VIDEO_KEYSET = Keyset(Video.uploaded_at, Video.id)
+FACE_KEYSET = Keyset(FaceEmbedding.frame_number, FaceEmbedding.id, descending=False)
+ALERT_KEYSET = Keyset(Alert.created_at, Alert.id)
+USER_KEYSET = Keyset(User.created_at, User.id)
+TRACK_KEYSET = Keyset(ObjectTrack.start_time, ObjectTrack.id, descending=False)
+OBJECT_SEARCH_KEYSET = Keyset(VideoObjectSummary.recorded_at, VideoObjectSummary.video_id, VideoObjectSummary.object_class)
+
+
 # ==================== Health Check ====================
 
 @app.get("/")
@@ -173,9 +343,19 @@ async def root():
 async def startup_event():
     """Inicializar base de datos al arrancar"""
     init_db()
+    # Invalidaciones del cache de usuarios publicadas por otros procesos API
+    app.state.user_invalidation_listener = asyncio.create_task(listen_for_invalidations())
     print(f"✅ {settings.PROJECT_NAME} v{settings.VERSION} iniciado correctamente")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Detener la suscripción de invalidaciones y cerrar el cliente Redis compartido"""
+    app.state.user_invalidation_listener.cancel()
+    await asyncio.gather(app.state.user_invalidation_listener, return_exceptions=True)
+    await close_redis()
+
+
 # ==================== Authentication Endpoints ====================
 
 @app.post(f"{settings.API_V1_STR}/auth/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
@@ -192,7 +372,7 @@ async def register_user(
         raise HTTPException(status_code=400, detail="Username ya existe")
     
     # Crear usuario
-    hashed_password = AuthService.get_password_hash(user_data.password)
+    hashed_password = await AuthService.get_password_hash_async(user_data.password)
     new_user = User(
         email=user_data.email,
         username=user_data.username,
@@ -212,10 +392,10 @@ async def register_user(
 @app.post(f"{settings.API_V1_STR}/auth/login", response_model=Token)
 async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Login con OAuth2"""
-    user = AuthService.authenticate_user(db, form_data.username, form_data.password)
+    user = await AuthService.authenticate_user_async(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -243,6 +423,7 @@ async def get_current_user_info(current_user: User = Depends(get_current_user)):
 @app.post(f"{settings.API_V1_STR}/videos/upload", response_model=VideoUploadResponse)
 async def upload_video(
     file: UploadFile = File(...),
+    camera_id: Optional[str] = Form(None),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -290,6 +471,7 @@ async def upload_video(
         sha256_hash=sha256_hash,
         sha512_hash=sha512_hash,
         exif_metadata=exif_metadata,
+        camera_id=camera_id,
         status=VideoStatus.UPLOADED
     )
     
@@ -330,30 +512,178 @@ async def upload_video(
     )
 
 
+@app.post(f"{settings.API_V1_STR}/videos/uploads/initiate")
+async def initiate_direct_upload(
+    request: DirectUploadRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Iniciar una subida directa a storage
+    - Retorna URL prefirmada (PUT único) o URLs por parte (multipart)
+    - Los bytes no pasan por la API; al terminar, llamar a /videos/uploads/complete
+    """
+    upload_service = DirectUploadService()
+    try:
+        return await run_in_threadpool(
+            upload_service.initiate,
+            current_user.id, request.filename, request.size, request.content_type, request.sha256
+        )
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.put(f"{settings.API_V1_STR}/videos/uploads/local/{{upload_id}}")
+async def put_local_upload(
+    upload_id: str,
+    request: Request,
+    part_number: Optional[int] = None,
+    upload_token: str = Header(..., alias=UPLOAD_TOKEN_HEADER)
+):
+    """
+    Stand-in local de las URLs prefirmadas (sólo sin S3)
+    El token de subida firmado (header X-Upload-Token) autoriza el PUT, igual que la firma de S3
+    """
+    upload_service = DirectUploadService()
+    if upload_service.storage.s3_client:
+        raise HTTPException(status_code=404, detail="No disponible con S3")
+    
+    try:
+        claims = upload_service.decode_token(upload_token)
+        if claims["upload_id"] != upload_id:
+            raise UploadError("El token de subida no corresponde a esta URL")
+        dest_path = upload_service.local_part_path(claims, part_number)
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    received = 0
+    with open(dest_path, 'wb') as f:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > claims["size"]:
+                f.close()
+                dest_path.unlink(missing_ok=True)
+                raise HTTPException(status_code=400, detail="El contenido excede el tamaño declarado")
+            await run_in_threadpool(f.write, chunk)
+    
+    return Response(status_code=200, headers={"ETag": f'"{claims["upload_id"]}-{part_number or 0}"'})
+
+
+@app.post(f"{settings.API_V1_STR}/videos/uploads/complete", response_model=VideoUploadResponse)
+async def complete_direct_upload(
+    request: DirectUploadComplete,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Completar una subida directa
+    - Verifica tamaño y hash SHA-256/512 leyendo el archivo en streaming
+    - Crea el video, la cadena de custodia y la tarea de procesamiento
+    """
+    upload_service = DirectUploadService()
+    try:
+        claims = upload_service.decode_token(request.upload_token, user_id=current_user.id)
+        digest = await run_in_threadpool(upload_service.complete, claims)
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    sha256_hash = digest["sha256"]
+    
+    # Verificar si ya existe este video (prevenir duplicados)
+    existing = db.query(Video).filter(Video.sha256_hash == sha256_hash).first()
+    if existing:
+        await run_in_threadpool(upload_service.storage.remove, digest["key"])
+        raise HTTPException(status_code=400, detail="Este video ya fue subido anteriormente")
+    
+    # Mover de staging a videos/ (copia del lado del storage)
+    filename = f"{sha256_hash}_{claims['filename']}"
+    s3_url = await run_in_threadpool(upload_service.finalize, digest["key"], filename)
+    
+    # Crear registro de video
+    video = Video(
+        user_id=current_user.id,
+        filename=filename,
+        original_filename=claims["filename"],
+        s3_url=s3_url,
+        file_size=digest["size"],
+        sha256_hash=sha256_hash,
+        sha512_hash=digest["sha512"],
+        exif_metadata=IntegrityModule.extract_exif_metadata(digest["head"]),
+        camera_id=request.camera_id,
+        status=VideoStatus.UPLOADED
+    )
+    
+    db.add(video)
+    db.commit()
+    db.refresh(video)
+    
+    # Registrar en cadena de custodia
+    custody = ChainOfCustody(
+        video_id=video.id,
+        action="uploaded",
+        actor_id=current_user.id,
+        actor_name=current_user.full_name or current_user.username,
+        hash_after=sha256_hash,
+        operation_details={
+            "filename": claims["filename"],
+            "size_bytes": digest["size"],
+            "upload_method": "direct",
+            "integrity_verified": True
+        }
+    )
+    db.add(custody)
+    db.commit()
+    
+    # Iniciar procesamiento asíncrono con Celery
+    task = celery_app.send_task("app.workers.tasks.process_video_task", args=[str(video.id)])
+    
+    # Registrar tarea
+    processing_task = ProcessingTask(
+        video_id=video.id,
+        celery_task_id=task.id,
+        task_type="full_video_processing"
+    )
+    db.add(processing_task)
+    db.commit()
+    
+    return VideoUploadResponse(
+        video_id=video.id,
+        filename=video.filename,
+        status=video.status,
+        sha256_hash=sha256_hash,
+        message="Video verificado correctamente. Procesamiento iniciado."
+    )
+
+
 @app.get(f"{settings.API_V1_STR}/videos", response_model=List[VideoResponse])
 async def list_videos(
-    skip: int = 0,
-    limit: int = 100,
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Listar videos del usuario (clientes solo ven los suyos, investigadores ven todos)"""
-    if current_user.role in [UserRole.ADMIN, UserRole.INVESTIGATOR]:
-        videos = db.query(Video).offset(skip).limit(limit).all()
-    else:
-        videos = db.query(Video).filter(Video.user_id == current_user.id).offset(skip).limit(limit).all()
+    """
+    Listar videos del usuario (clientes solo ven los suyos, investigadores ven todos)
+    Más recientes primero; página siguiente con el cursor del header X-Next-Cursor
+    """
+    columns = projection(Video, fields, VideoResponse.model_fields, VIDEO_KEYSET)
+    query = select(*columns) if columns else select(Video)
+    if current_user.role not in [UserRole.ADMIN, UserRole.INVESTIGATOR]:
+        query = query.where(Video.user_id == current_user.id)
+    result = await db.execute(VIDEO_KEYSET.apply(query, cursor, limit))
     
-    return videos
+    return VIDEO_KEYSET.page(result.all() if columns else result.scalars().all(), limit, response, bool(columns))
 
 
 @app.get(f"{settings.API_V1_STR}/videos/{{video_id}}", response_model=VideoResponse)
 async def get_video(
     video_id: uuid.UUID,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Obtener información de un video específico"""
-    video = db.query(Video).filter(Video.id == video_id).first()
+    video = await db.get(Video, video_id)
     
     if not video:
         raise HTTPException(status_code=404, detail="Video no encontrado")
@@ -368,10 +698,10 @@ async def get_video(
 async def get_video_processing_status(
     video_id: uuid.UUID,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Obtener estado del procesamiento del video"""
-    video = db.query(Video).filter(Video.id == video_id).first()
+    video = await db.get(Video, video_id)
     
     if not video:
         raise HTTPException(status_code=404, detail="Video no encontrado")
@@ -380,7 +710,7 @@ async def get_video_processing_status(
         raise HTTPException(status_code=403, detail="Acceso denegado")
     
     # Obtener tareas relacionadas
-    tasks = db.query(ProcessingTask).filter(ProcessingTask.video_id == video_id).all()
+    tasks = (await db.execute(select(ProcessingTask).where(ProcessingTask.video_id == video_id))).scalars().all()
     
     return {
         "video_id": video.id,
@@ -396,16 +726,317 @@ async def get_video_processing_status(
     }
 
 
+@app.get(f"{settings.API_V1_STR}/videos/{{video_id}}/objects/summary", response_model=List[ObjectClassSummaryResponse])
+async def get_video_object_summary(
+    video_id: uuid.UUID,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Clases de objeto detectadas en el video con su línea de tiempo (histograma por minuto)"""
+    video = await db.get(Video, video_id)
+    
+    if not video:
+        raise HTTPException(status_code=404, detail="Video no encontrado")
+    
+    if not PermissionChecker.can_access_video(current_user, str(video.user_id)):
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+    
+    result = await db.execute(
+        select(VideoObjectSummary)
+        .where(VideoObjectSummary.video_id == video_id)
+        .order_by(VideoObjectSummary.detection_count.desc())
+    )
+    return result.scalars().all()
+
+
+@app.get(f"{settings.API_V1_STR}/videos/{{video_id}}/objects/tracks", response_model=List[ObjectTrackResponse])
+async def get_video_object_tracks(
+    video_id: uuid.UUID,
+    response: Response,
+    object_class: Optional[str] = None,
+    start_time: Optional[float] = None,
+    end_time: Optional[float] = None,
+    include_trajectory: bool = False,
+    limit: int = Query(500, ge=1, le=5000),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Línea de tiempo de objetos del video (un track por objeto seguido entre frames)
+    Con include_trajectory se decodifican los puntos clave del bbox
+    Página siguiente con el cursor del header X-Next-Cursor
+    """
+    video = await db.get(Video, video_id)
+    
+    if not video:
+        raise HTTPException(status_code=404, detail="Video no encontrado")
+    
+    if not PermissionChecker.can_access_video(current_user, str(video.user_id)):
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+    
+    query = select(ObjectTrack).where(ObjectTrack.video_id == video_id)
+    if object_class:
+        query = query.where(ObjectTrack.object_class == object_class)
+    if start_time is not None:
+        query = query.where(ObjectTrack.end_time >= start_time)
+    if end_time is not None:
+        query = query.where(ObjectTrack.start_time <= end_time)
+    if not include_trajectory:
+        query = query.options(defer(ObjectTrack.trajectory))
+    result = await db.execute(TRACK_KEYSET.apply(query, cursor, limit))
+    tracks = TRACK_KEYSET.page(result.scalars().all(), limit, response)
+    
+    return [
+        ObjectTrackResponse(
+            id=track.id,
+            object_class=track.object_class,
+            start_frame=track.start_frame,
+            end_frame=track.end_frame,
+            start_time=track.start_time,
+            end_time=track.end_time,
+            detection_count=track.detection_count,
+            peak_confidence=track.peak_confidence,
+            peak_frame=track.peak_frame,
+            trajectory_points=track.trajectory_points,
+            trajectory=decode_trajectory(track.trajectory, track.start_frame) if include_trajectory else None
+        )
+        for track in tracks
+    ]
+
+
+@app.get(f"{settings.API_V1_STR}/objects/search", response_model=List[ObjectSearchResult])
+async def search_objects(
+    response: Response,
+    object_class: List[str] = Query(...),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    min_confidence: Optional[float] = None,
+    min_count: int = 1,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Videos con detecciones de las clases pedidas (p. ej. "cuchillo en los últimos 30 días")
+    Se responde desde video_object_summaries, sin recorrer detected_objects
+    Más recientes primero; página siguiente con el cursor del header X-Next-Cursor
+    """
+    query = (
+        select(VideoObjectSummary, Video.filename)
+        .join(Video, Video.id == VideoObjectSummary.video_id)
+        .where(
+            VideoObjectSummary.object_class.in_(object_class),
+            VideoObjectSummary.detection_count >= min_count
+        )
+    )
+    if current_user.role not in [UserRole.ADMIN, UserRole.INVESTIGATOR]:
+        query = query.where(VideoObjectSummary.user_id == current_user.id)
+    if since:
+        query = query.where(VideoObjectSummary.recorded_at >= since)
+    if until:
+        query = query.where(VideoObjectSummary.recorded_at < until)
+    if min_confidence is not None:
+        query = query.where(VideoObjectSummary.max_confidence >= min_confidence)
+    
+    rows = (await db.execute(OBJECT_SEARCH_KEYSET.apply(query, cursor, limit))).all()
+    results = [
+        ObjectSearchResult(
+            video_id=summary.video_id,
+            video_filename=filename,
+            recorded_at=summary.recorded_at,
+            object_class=summary.object_class,
+            detection_count=summary.detection_count,
+            first_seen=summary.first_seen,
+            last_seen=summary.last_seen,
+            max_confidence=summary.max_confidence
+        )
+        for summary, filename in rows
+    ]
+    # El cursor se arma desde los resultados: llevan las mismas columnas del orden
+    return OBJECT_SEARCH_KEYSET.page(results, limit, response)
+
+
 # ==================== Face Detection & Search Endpoints ====================
 
 @app.get(f"{settings.API_V1_STR}/videos/{{video_id}}/faces", response_model=List[FaceEmbeddingResponse])
 async def get_detected_faces(
     video_id: uuid.UUID,
+    response: Response,
+    limit: int = Query(500, ge=1, le=5000),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Obtener todas las caras detectadas en un video"""
-    video = db.query(Video).filter(Video.id == video_id).first()
+    """
+    Caras detectadas en un video, en orden de frame
+    Página siguiente con el cursor del header X-Next-Cursor
+    """
+    video = await db.get(Video, video_id)
+    
+    if not video:
+        raise HTTPException(status_code=404, detail="Video no encontrado")
+    
+    if not PermissionChecker.can_access_video(current_user, str(video.user_id)):
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+    
+    # Sin la columna embedding: la respuesta no la incluye
+    columns = projection(FaceEmbedding, fields, FaceEmbeddingResponse.model_fields, FACE_KEYSET)
+    query = select(*columns) if columns else select(FaceEmbedding).options(defer(FaceEmbedding.embedding))
+    result = await db.execute(FACE_KEYSET.apply(query.where(FaceEmbedding.video_id == video_id), cursor, limit))
+    
+    return FACE_KEYSET.page(result.all() if columns else result.scalars().all(), limit, response, bool(columns))
+
+
+@app.get(f"{settings.API_V1_STR}/faces/{{face_id}}/image")
+async def get_face_image(
+    face_id: uuid.UUID,
+    size: Optional[int] = None,
+    enhanced: bool = False,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Redirigir a la rendition más pequeña cuyo lado mayor alcanza `size` pixels
+    
+    Sin `size` se sirve la rendition completa. Las caras previas a las renditions
+    usan su URL original.
+    """
+    face = (
+        await db.execute(
+            select(FaceEmbedding, Video.user_id)
+            .options(defer(FaceEmbedding.embedding))
+            .join(Video, FaceEmbedding.video_id == Video.id)
+            .where(FaceEmbedding.id == face_id)
+        )
+    ).first()
+    
+    if not face:
+        raise HTTPException(status_code=404, detail="Cara no encontrada")
+    
+    face, video_user_id = face
+    if not PermissionChecker.can_access_video(current_user, str(video_user_id)):
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+    
+    renditions = face.enhanced_face_renditions if enhanced else face.face_renditions
+    rendition = pick_rendition(renditions, size)
+    url = rendition["url"] if rendition else (face.enhanced_face_url if enhanced else face.face_image_url)
+    
+    if not url:
+        raise HTTPException(status_code=404, detail="Imagen no disponible")
+    
+    return RedirectResponse(url, status_code=status.HTTP_307_TEMPORARY_REDIRECT)
+
+
+@app.get(f"{settings.API_V1_STR}/faces/{{face_id}}/appearances", response_model=FaceAppearancesResponse)
+async def get_face_appearances(
+    face_id: uuid.UUID,
+    skip: int = 0,
+    limit: int = 100,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Todas las apariciones de la persona de esta cara (identidad del clustering)
+    Lectura indexada por identity_id; clientes solo ven apariciones en sus videos
+    """
+    face = (
+        await db.execute(
+            select(FaceEmbedding.identity_id, Video.user_id)
+            .join(Video, FaceEmbedding.video_id == Video.id)
+            .where(FaceEmbedding.id == face_id)
+        )
+    ).first()
+    
+    if not face:
+        raise HTTPException(status_code=404, detail="Cara no encontrada")
+    
+    if not PermissionChecker.can_access_video(current_user, str(face.user_id)):
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+    
+    if face.identity_id is None:
+        raise HTTPException(status_code=409, detail="La cara aún no tiene identidad asignada (clustering pendiente)")
+    
+    identity = await db.get(FaceIdentity, face.identity_id)
+    
+    query = (
+        select(FaceEmbedding, Video.filename)
+        .options(defer(FaceEmbedding.embedding))
+        .join(Video, FaceEmbedding.video_id == Video.id)
+        .where(FaceEmbedding.identity_id == face.identity_id)
+    )
+    if current_user.role not in [UserRole.ADMIN, UserRole.INVESTIGATOR]:
+        query = query.where(Video.user_id == current_user.id)
+    rows = (
+        await db.execute(
+            query.order_by(FaceEmbedding.video_id, FaceEmbedding.timestamp_in_video)
+            .offset(skip).limit(limit)
+        )
+    ).all()
+    
+    return FaceAppearancesResponse(
+        identity_id=identity.id,
+        label=identity.label,
+        face_count=identity.face_count or 0,
+        video_count=identity.video_count or 0,
+        first_seen_at=identity.first_seen_at,
+        last_seen_at=identity.last_seen_at,
+        appearances=[
+            FaceAppearanceResponse(
+                face_id=appearance.id,
+                video_id=appearance.video_id,
+                video_filename=filename,
+                timestamp_in_video=appearance.timestamp_in_video,
+                confidence=appearance.confidence,
+                face_image_url=appearance.face_image_url
+            )
+            for appearance, filename in rows
+        ]
+    )
+
+
+@app.get(f"{settings.API_V1_STR}/identities/{{identity_id}}/cooccurrences", response_model=List[CooccurrenceResponse])
+async def get_identity_cooccurrences(
+    identity_id: uuid.UUID,
+    limit: int = 20,
+    evidence_limit: int = 5,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Personas que aparecen junto a esta identidad (índice de co-apariciones)
+    Ordenadas por videos compartidos, con evidencia de video y tiempo
+    """
+    if not await db.get(FaceIdentity, identity_id):
+        raise HTTPException(status_code=404, detail="Identidad no encontrada")
+    
+    # Clientes: sólo evidencia de sus propios videos
+    owner_id = None if current_user.role in [UserRole.ADMIN, UserRole.INVESTIGATOR] else current_user.id
+    return await db.run_sync(
+        lambda session: CooccurrenceIndex().related(
+            session, identity_id, limit=limit, evidence_limit=evidence_limit, owner_id=owner_id
+        )
+    )
+
+
+@app.get(f"{settings.API_V1_STR}/face-crops/{{video_id}}/{{shard}}/{{offset}}/{{length}}")
+async def get_packed_face_crop(
+    video_id: uuid.UUID,
+    shard: str,
+    offset: int,
+    length: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Servir un recorte facial empaquetado con una única lectura por rango del shard"""
+    if offset < 0 or length <= 0 or length > settings.FACE_CROP_SHARD_MAX_MB * 1024 * 1024:
+        raise HTTPException(status_code=400, detail="Rango inválido")
+    if not shard.replace("-", "").replace("_", "").isalnum():
+        raise HTTPException(status_code=400, detail="Shard inválido")
+    
+    video = await db.get(Video, video_id)
     
     if not video:
         raise HTTPException(status_code=404, detail="Video no encontrado")
@@ -413,51 +1044,54 @@ async def get_detected_faces(
     if not PermissionChecker.can_access_video(current_user, str(video.user_id)):
         raise HTTPException(status_code=403, detail="Acceso denegado")
     
-    faces = db.query(FaceEmbedding).filter(FaceEmbedding.video_id == video_id).all()
-    return faces
+    storage_service = StorageService()
+    try:
+        content = await storage_service.download_range(shard_key(video_id, shard), offset, length)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Recorte no encontrado")
+    
+    if len(content) != length:
+        raise HTTPException(status_code=404, detail="Recorte no encontrado")
+    
+    # Los shards son inmutables: la URL identifica el contenido
+    return Response(
+        content=content,
+        media_type="image/webp" if content[8:12] == b"WEBP" else "image/jpeg",
+        headers={"Cache-Control": "private, max-age=31536000, immutable"}
+    )
 
 
 @app.post(f"{settings.API_V1_STR}/faces/search", response_model=List[FaceMatchResponse])
 async def search_similar_faces(
     search_request: FaceSearchRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Buscar caras similares usando pgvector
     Permite identificar si el mismo delincuente aparece en otros videos
     """
     # Obtener el embedding de consulta
-    query_face = db.query(FaceEmbedding).filter(FaceEmbedding.id == search_request.face_embedding_id).first()
+    query_embedding = (
+        await db.execute(
+            select(FaceEmbedding.embedding).where(FaceEmbedding.id == search_request.face_embedding_id)
+        )
+    ).scalar_one_or_none()
     
-    if not query_face:
+    if query_embedding is None:
         raise HTTPException(status_code=404, detail="Cara no encontrada")
     
-    # Búsqueda de similitud con pgvector (distancia coseno)
-    from sqlalchemy import text
-    
-    query = text("""
-        SELECT 
-            fe.id, fe.video_id, fe.face_image_url, fe.timestamp_in_video,
-            v.filename,
-            (fe.embedding <=> :query_embedding) as distance
-        FROM face_embeddings fe
-        JOIN videos v ON fe.video_id = v.id
-        WHERE fe.id != :query_face_id
-        AND (fe.embedding <=> :query_embedding) < :threshold
-        ORDER BY distance
-        LIMIT :max_results
-    """)
-    
-    results = db.execute(
-        query,
-        {
-            "query_embedding": query_face.embedding,
-            "query_face_id": str(search_request.face_embedding_id),
-            "threshold": search_request.threshold,
-            "max_results": search_request.max_results
-        }
-    ).fetchall()
+    # Búsqueda de similitud con pgvector (distancia coseno, índice HNSW / IVFFlat)
+    # El servicio es sync: run_sync lo ejecuta sobre la conexión asyncpg sin bloquear el event loop
+    results = await db.run_sync(
+        run_face_search,
+        query_embedding,
+        threshold=search_request.threshold,
+        max_results=search_request.max_results,
+        exclude_face_id=search_request.face_embedding_id,
+        recall=search_request.recall,
+        filters=SearchFilters(**search_request.filters.model_dump()) if search_request.filters else None
+    )
     
     matches = []
     for row in results:
@@ -473,6 +1107,87 @@ async def search_similar_faces(
     return matches
 
 
+@app.post(f"{settings.API_V1_STR}/faces/search/batch", response_model=List[FaceSearchGroupResponse])
+async def search_similar_faces_batch_endpoint(
+    search_request: BatchFaceSearchRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Buscar caras similares para muchas caras en una sola consulta
+    Permite cruzar todas las caras de un video nuevo contra la base en un request
+    """
+    if (search_request.video_id is None) == (not search_request.queries):
+        raise HTTPException(status_code=400, detail="Indique queries o video_id (sólo uno)")
+    
+    if search_request.video_id is not None:
+        video = await db.get(Video, search_request.video_id)
+        if not video:
+            raise HTTPException(status_code=404, detail="Video no encontrado")
+        if not PermissionChecker.can_access_video(current_user, str(video.user_id)):
+            raise HTTPException(status_code=403, detail="Acceso denegado")
+        query_ids = (
+            await db.execute(select(FaceEmbedding.id).where(FaceEmbedding.video_id == search_request.video_id))
+        ).scalars().all()
+        thresholds = {face_id: search_request.threshold for face_id in query_ids}
+    else:
+        thresholds = {
+            query.face_embedding_id: query.threshold if query.threshold is not None else search_request.threshold
+            for query in search_request.queries
+        }
+        # Verificar existencia y permisos sin cargar los embeddings
+        owners = dict(
+            (
+                await db.execute(
+                    select(FaceEmbedding.id, Video.user_id)
+                    .join(Video, FaceEmbedding.video_id == Video.id)
+                    .where(FaceEmbedding.id.in_(list(thresholds)))
+                )
+            ).all()
+        )
+        missing = [str(face_id) for face_id in thresholds if face_id not in owners]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Caras no encontradas: {', '.join(missing)}")
+        if not all(PermissionChecker.can_access_video(current_user, str(user_id)) for user_id in owners.values()):
+            raise HTTPException(status_code=403, detail="Acceso denegado")
+    
+    if len(thresholds) > settings.FACE_SEARCH_BATCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máximo {settings.FACE_SEARCH_BATCH_MAX_QUERIES} caras por búsqueda"
+        )
+    
+    results = await db.run_sync(
+        search_similar_faces_batch,
+        queries=thresholds if search_request.video_id is None else None,
+        video_id=search_request.video_id,
+        threshold=search_request.threshold,
+        max_results=search_request.max_results,
+        recall=search_request.recall,
+        exclude_same_video=search_request.exclude_same_video,
+        filters=SearchFilters(**search_request.filters.model_dump()) if search_request.filters else None
+    )
+    
+    return [
+        FaceSearchGroupResponse(
+            query_face_id=face_id,
+            threshold=threshold,
+            matches=[
+                FaceMatchResponse(
+                    face_id=row.id,
+                    video_id=row.video_id,
+                    similarity_score=1 - row.distance,
+                    face_image_url=row.face_image_url,
+                    video_filename=row.filename,
+                    timestamp_in_video=row.timestamp_in_video
+                )
+                for row in results.get(face_id, [])
+            ]
+        )
+        for face_id, threshold in thresholds.items()
+    ]
+
+
 @app.post(f"{settings.API_V1_STR}/faces/mark-poi")
 async def mark_person_of_interest(
     request: MarkPOIRequest,
@@ -488,6 +1203,7 @@ async def mark_person_of_interest(
     face.is_person_of_interest = True
     face.poi_label = request.poi_label
     face.notes = request.notes
+    face.poi_marked_at = datetime.utcnow()  # Los workers la incorporan a su watchlist en el próximo refresco
     
     db.commit()
     
@@ -504,27 +1220,60 @@ async def mark_person_of_interest(
     db.add(alert)
     db.commit()
     
+    # Las caras POI son las que se revisan: mejorar bajo demanda si aún no lo está
+    if not face.enhanced_face_url:
+        celery_app.send_task(
+            "app.workers.tasks.enhance_face_task",
+            kwargs={"face_embedding_ids": [str(face.id)]}
+        )
+    
     return {"message": "Persona de interés marcada exitosamente", "face_id": face.id}
 
 
+@app.post(f"{settings.API_V1_STR}/faces/enhance", status_code=status.HTTP_202_ACCEPTED)
+async def enhance_faces(
+    request: FaceEnhanceRequest,
+    current_user: User = Depends(require_investigator)
+):
+    """
+    Solicitar mejora con Super-Resolution de caras específicas o de todas las POI
+    Se procesa en la cola 'enhancement'; enhanced_face_url se completa al terminar
+    """
+    if not request.face_embedding_ids and not request.poi_only:
+        raise HTTPException(status_code=400, detail="Indique face_embedding_ids o poi_only")
+    
+    task = celery_app.send_task(
+        "app.workers.tasks.enhance_face_task",
+        kwargs={
+            "face_embedding_ids": [str(f) for f in request.face_embedding_ids] or None,
+            "poi_only": request.poi_only
+        }
+    )
+    
+    return {"task_id": task.id, "message": "Mejora de caras encolada"}
+
+
 # ==================== Alerts Endpoints ====================
 
 @app.get(f"{settings.API_V1_STR}/alerts", response_model=List[AlertResponse])
 async def get_alerts(
-    skip: int = 0,
-    limit: int = 50,
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
     unread_only: bool = False,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Obtener alertas del usuario"""
-    query = db.query(Alert).filter(Alert.user_id == current_user.id)
+    """Obtener alertas del usuario (más recientes primero, cursor en X-Next-Cursor)"""
+    columns = projection(Alert, fields, AlertResponse.model_fields, ALERT_KEYSET)
+    query = (select(*columns) if columns else select(Alert)).where(Alert.user_id == current_user.id)
     
     if unread_only:
-        query = query.filter(Alert.is_read == False)
+        query = query.where(Alert.is_read == False)
     
-    alerts = query.order_by(Alert.created_at.desc()).offset(skip).limit(limit).all()
-    return alerts
+    result = await db.execute(ALERT_KEYSET.apply(query, cursor, limit))
+    return ALERT_KEYSET.page(result.all() if columns else result.scalars().all(), limit, response, bool(columns))
 
 
 @app.patch(f"{settings.API_V1_STR}/alerts/{{alert_id}}/read")
@@ -670,12 +1419,51 @@ async def get_chain_of_custody(
 
 @app.get(f"{settings.API_V1_STR}/admin/users", response_model=List[UserResponse])
 async def list_all_users(
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    current_user: User = Depends(require_admin),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Listar usuarios (solo admin), más recientes primero; cursor en X-Next-Cursor"""
+    columns = projection(User, fields, UserResponse.model_fields, USER_KEYSET)
+    result = await db.execute(USER_KEYSET.apply(select(*columns) if columns else select(User), cursor, limit))
+    return USER_KEYSET.page(result.all() if columns else result.scalars().all(), limit, response, bool(columns))
+
+
+@app.patch(f"{settings.API_V1_STR}/admin/users/{{user_id}}", response_model=UserResponse)
+async def update_user(
+    user_id: uuid.UUID,
+    user_update: UserUpdate,
     current_user: User = Depends(require_admin),
     db: Session = Depends(get_db)
 ):
-    """Listar todos los usuarios (solo admin)"""
-    users = db.query(User).all()
-    return users
+    """Actualizar rol, estado u organización de un usuario (solo admin)"""
+    user = db.query(User).filter(User.id == user_id).first()
+    
+    if not user:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    
+    for field, value in user_update.model_dump(exclude_unset=True).items():
+        setattr(user, field, value)
+    db.commit()
+    db.refresh(user)
+    
+    # El usuario cacheado por get_current_user deja de valer en todos los procesos API
+    try:
+        await invalidate_user(user.id)
+    except InvalidationError:
+        raise HTTPException(
+            status_code=503,
+            detail=(
+                "Usuario actualizado, pero no se pudo invalidar su sesión en los demás procesos; "
+                f"el cambio puede tardar hasta {settings.AUTH_USER_CACHE_TTL_SECONDS}s en aplicarse. "
+                "Reintentar la operación vuelve a publicar la invalidación."
+            )
+        )
+    
+    return user
 
 
 @app.get(f"{settings.API_V1_STR}/admin/stats")
@@ -0,0 +1,60 @@
+"""
+Script para recalcular video_object_summaries de videos ya procesados
+
+Uso:
+    python scripts/backfill_object_summaries.py            # sólo videos sin resumen
+    python scripts/backfill_object_summaries.py --all      # todos los videos completados
+
+Los videos sin detected_objects (procesados con OBJECT_STORE_FRAME_DETECTIONS
+desactivado, sólo object_tracks) se omiten: su resumen se escribió al procesar.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+# Agregar el directorio padre al path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.models.database import SessionLocal, init_db
+from app.models.models import Video, VideoObjectSummary, VideoStatus
+from app.services.object_summary import rebuild_video_summaries
+
+
+def backfill(rebuild_all: bool = False):
+    """Recalcular los resúmenes video por video (un commit por video)"""
+    init_db()
+    
+    db = SessionLocal()
+    
+    try:
+        query = db.query(Video).filter(Video.status == VideoStatus.COMPLETED)
+        if not rebuild_all:
+            summarized = db.query(VideoObjectSummary.video_id).distinct()
+            query = query.filter(Video.id.notin_(summarized))
+        videos = query.order_by(Video.uploaded_at).all()
+        
+        print(f"🔄 Recalculando resúmenes de {len(videos)} videos")
+        skipped = 0
+        for index, video in enumerate(videos, start=1):
+            classes = rebuild_video_summaries(db, video)
+            if classes is None:
+                skipped += 1
+                print(f"   [{index}/{len(videos)}] {video.id}: sin detected_objects (sólo tracks), se omite")
+                continue
+            db.commit()
+            print(f"   [{index}/{len(videos)}] {video.id}: {classes} clases")
+        
+        print(f"✅ Resúmenes de objetos actualizados ({skipped} videos omitidos)")
+    
+    except Exception as e:
+        print(f"❌ Error recalculando resúmenes: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill de video_object_summaries")
+    parser.add_argument("--all", action="store_true", help="Recalcular también los videos que ya tienen resumen")
+    args = parser.parse_args()
+    backfill(rebuild_all=args.all)
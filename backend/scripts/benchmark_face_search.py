@@ -0,0 +1,286 @@
+"""
+Benchmark de búsqueda facial: recall y latencia según configuración del índice vectorial
+
+Genera embeddings sintéticos de 512 dimensiones agrupados en clusters (varias
+caras por identidad), los carga con COPY binario en el schema `bench` de un
+Postgres+pgvector y ejecuta exactamente el SQL de face_search_service bajo:
+- scan exacto (ground truth, equivalente a fuerza bruta)
+- IVFFlat con distintos `probes`
+- HNSW con distintos `ef_search`
+cada uno opcionalmente sobre la expresión cuantizada (halfvec / binary con
+re-ranking) para medir memoria del índice contra pérdida de recall.
+
+Reporta p50/p95/p99 (ms), QPS y recall@k contra el scan exacto, y sugiere un
+perfil recall -> parámetro para `manage_vector_index.py set-profile`.
+
+Uso:
+    python scripts/benchmark_face_search.py --rows 1000000 --clusters 20000
+    python scripts/benchmark_face_search.py --rows 10000000 --reuse --index-types hnsw --ef-search 40,80,160
+    python scripts/benchmark_face_search.py --database-url postgresql://bench@localhost/bench --clients 8
+    python scripts/benchmark_face_search.py --reuse --keep --quantizations none,halfvec,binary
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+# Agregar el directorio padre al path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import numpy as np
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from app.models.database import Base
+from app.services.bulk_writer import BulkDetectionWriter
+from app.services.face_search_service import EMBEDDING_DIMENSIONS, candidate_count, similar_faces_sql
+from app.services.vector_index import VectorIndexManager
+
+SCHEMA = "bench"
+RECALL_LEVELS = (0.8, 0.9, 0.95, 0.99)
+
+
+def connect(engine):
+    """Conexión con search_path al schema de benchmark (el SQL de producción no se modifica)"""
+    conn = engine.connect()
+    conn.execute(text(f"SET search_path TO {SCHEMA}, public"))
+    conn.commit()
+    return conn
+
+
+def generate_chunk(rng, centers, size, noise):
+    """Embeddings normalizados: centro del cluster + ruido gaussiano"""
+    labels = rng.integers(0, len(centers), size=size)
+    vectors = centers[labels] + rng.normal(0, noise, (size, EMBEDDING_DIMENSIONS)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def load_dataset(engine, args):
+    """Crear el schema de benchmark y cargar las filas; retorna los embeddings de consulta"""
+    rng = np.random.default_rng(args.seed)
+    centers = rng.normal(0, 1, (args.clusters, EMBEDDING_DIMENSIONS)).astype(np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    
+    with engine.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+    Base.metadata.create_all(bind=engine)  # Tablas de referencia para LIKE
+    
+    with engine.begin() as conn:
+        if not args.reuse:
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA}"))
+        # Misma estructura que producción, sin FKs ni índices
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {SCHEMA}.videos (LIKE public.videos INCLUDING DEFAULTS)"))
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {SCHEMA}.face_embeddings (LIKE public.face_embeddings INCLUDING DEFAULTS)"
+        ))
+        existing = conn.execute(text(f"SELECT count(*) FROM {SCHEMA}.face_embeddings")).scalar()
+    
+    if args.reuse and existing >= args.rows:
+        print(f"Reutilizando {existing} filas existentes")
+    else:
+        video_ids = [uuid.uuid4() for _ in range(args.videos)]
+        with engine.begin() as conn:
+            conn.execute(text(f"TRUNCATE {SCHEMA}.videos, {SCHEMA}.face_embeddings"))
+            for video_id in video_ids:
+                conn.execute(
+                    text(f"""
+                        INSERT INTO {SCHEMA}.videos (id, user_id, filename, original_filename, sha256_hash)
+                        VALUES (:id, :id, :name, :name, :hash)
+                    """),
+                    {"id": video_id, "name": f"bench_{video_id}.mp4", "hash": uuid.uuid4().hex * 2}
+                )
+        
+        start = time.perf_counter()
+        conn = connect(engine)
+        session = Session(bind=conn)
+        writer = BulkDetectionWriter(session, batch_size=args.batch_size, method="copy")
+        loaded = 0
+        while loaded < args.rows:
+            size = min(args.batch_size, args.rows - loaded)
+            for vector in generate_chunk(rng, centers, size, args.noise):
+                writer.add_face(
+                    video_id=video_ids[loaded % len(video_ids)],
+                    embedding=vector,
+                    frame_number=loaded,
+                    timestamp_in_video=float(loaded)
+                )
+                loaded += 1
+            writer.flush()
+            session.commit()
+            print(f"  cargadas {loaded}/{args.rows} filas", end="\r")
+        session.close()
+        conn.close()
+        print(f"\nCarga: {args.rows} filas en {time.perf_counter() - start:.1f}s")
+        
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text(f"VACUUM ANALYZE {SCHEMA}.face_embeddings"))
+    
+    # Consultas: caras nuevas de los mismos clusters (la misma persona vista en otro video)
+    return generate_chunk(np.random.default_rng(args.seed + 1), centers, args.queries, args.noise)
+
+
+def run_queries(engine, queries, session_settings, args, quantization="none"):
+    """Ejecutar todas las consultas con N clientes; retorna (latencias ms, ids por consulta, QPS)"""
+    latencies = [None] * len(queries)
+    results = [None] * len(queries)
+    sql = similar_faces_sql(quantization)
+    
+    def client(indices):
+        conn = connect(engine)
+        try:
+            for i in indices:
+                start = time.perf_counter()
+                with conn.begin():
+                    for name, value in session_settings.items():
+                        conn.execute(text(f"SET LOCAL {name} = {value}"))
+                    rows = conn.execute(sql, {
+                        "query_embedding": queries[i],
+                        "query_face_id": None,
+                        "threshold": args.threshold,
+                        "max_results": args.k,
+                        "candidates": candidate_count(args.k, quantization)
+                    }).fetchall()
+                latencies[i] = (time.perf_counter() - start) * 1000
+                results[i] = [row.id for row in rows]
+        finally:
+            conn.close()
+    
+    start = time.perf_counter()
+    threads = [
+        threading.Thread(target=client, args=(range(c, len(queries), args.clients),))
+        for c in range(args.clients)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    qps = len(queries) / (time.perf_counter() - start)
+    return np.array(latencies), results, qps
+
+
+def recall_at_k(results, ground_truth) -> float:
+    """Fracción promedio de los k vecinos exactos recuperados"""
+    scores = [
+        len(set(found) & set(exact)) / len(exact)
+        for found, exact in zip(results, ground_truth) if exact
+    ]
+    return float(np.mean(scores)) if scores else 0.0
+
+
+def build_index(engine, manager, index_type, params, quantization, maintenance_work_mem):
+    """Construir el índice de benchmark; retorna (segundos, MB)"""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(f"SET search_path TO {SCHEMA}, public"))
+        conn.execute(text(f"SET maintenance_work_mem = '{maintenance_work_mem}'"))
+        conn.execute(text(f"DROP INDEX IF EXISTS {SCHEMA}.bench_embedding_idx"))
+        start = time.perf_counter()
+        conn.execute(text(manager.create_statement("bench_embedding_idx", index_type, params, quantization)))
+        seconds = time.perf_counter() - start
+        size = conn.execute(text(f"SELECT pg_relation_size('{SCHEMA}.bench_embedding_idx')")).scalar()
+    return seconds, size / 1024 ** 2
+
+
+def report(name, latencies, qps, recall):
+    print(
+        f"{name:<28} {np.percentile(latencies, 50):>8.2f} {np.percentile(latencies, 95):>8.2f} "
+        f"{np.percentile(latencies, 99):>8.2f} {qps:>8.1f} {recall:>9.4f}"
+    )
+
+
+def suggest_profile(measurements):
+    """Menor parámetro que alcanza cada nivel de recall"""
+    profile = {}
+    for level in RECALL_LEVELS:
+        reached = [value for value, recall in sorted(measurements) if recall >= level]
+        if reached:
+            profile[str(level)] = reached[0]
+    return profile
+
+
+def run_benchmark(args):
+    engine = create_engine(args.database_url, pool_size=args.clients + 2)
+    manager = VectorIndexManager(table_name=f"{SCHEMA}.face_embeddings")
+    queries = load_dataset(engine, args)
+    header = f"{'configuración':<28} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'QPS':>8} {'recall@' + str(args.k):>9}"
+    
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(f"DROP INDEX IF EXISTS {SCHEMA}.bench_embedding_idx"))
+    
+    # Ground truth: scan exacto con el mismo SQL
+    print(f"\n{args.rows} filas, {args.clusters} clusters, {args.queries} consultas, k={args.k}, {args.clients} clientes\n")
+    print(header)
+    latencies, ground_truth, qps = run_queries(engine, queries, {"enable_indexscan": "off"}, args)
+    report("exacto", latencies, qps, 1.0)
+    
+    profiles = {}
+    configurations = [
+        (index_type, quantization)
+        for quantization in args.quantizations.split(",")
+        for index_type in args.index_types.split(",")
+    ]
+    for index_type, quantization in configurations:
+        if index_type == "hnsw":
+            params = {"m": args.hnsw_m, "ef_construction": args.hnsw_ef_construction}
+            # ef_search menor que los candidatos pedidos trunca el primer paso
+            minimum = candidate_count(args.k, quantization)
+            sweep = ("hnsw.ef_search", sorted({max(int(v), minimum) for v in args.ef_search.split(",")}))
+        else:
+            params = manager.desired_params("ivfflat", args.rows) if not args.lists else {"lists": args.lists}
+            sweep = ("ivfflat.probes", [int(v) for v in args.probes.split(",") if int(v) <= params["lists"]])
+        
+        seconds, size_mb = build_index(engine, manager, index_type, params, quantization, args.maintenance_work_mem)
+        print(f"\n{index_type} {params} ({quantization}): construcción {seconds:.1f}s, tamaño {size_mb:.0f} MB")
+        print(header)
+        
+        measurements = []
+        setting, values = sweep
+        for value in values:
+            latencies, results, qps = run_queries(engine, queries, {setting: value}, args, quantization)
+            recall = recall_at_k(results, ground_truth)
+            measurements.append((value, recall))
+            report(f"{setting}={value}", latencies, qps, recall)
+        profiles[f"{index_type}/{quantization}"] = {
+            "params": params,
+            "index_size_mb": round(size_mb, 1),
+            "profile": suggest_profile(measurements)
+        }
+    
+    print("\nPerfiles sugeridos (recall -> parámetro), aplicables con manage_vector_index.py set-profile:")
+    print(json.dumps(profiles, indent=2))
+    
+    if not args.keep:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+
+
+if __name__ == "__main__":
+    from app.core.config import settings
+    
+    parser = argparse.ArgumentParser(description="Benchmark de búsqueda facial con pgvector")
+    parser.add_argument("--database-url", default=settings.DATABASE_URL)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--clusters", type=int, default=5000, help="Identidades sintéticas")
+    parser.add_argument("--noise", type=float, default=0.03, help="Sigma por dimensión alrededor del centro")
+    parser.add_argument("--videos", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--threshold", type=float, default=2.0, help="Distancia máxima (2.0 = sin filtro)")
+    parser.add_argument("--clients", type=int, default=1, help="Conexiones concurrentes")
+    parser.add_argument("--index-types", default="ivfflat,hnsw")
+    parser.add_argument("--quantizations", default="none", help="none,halfvec,binary")
+    parser.add_argument("--hnsw-m", type=int, default=settings.HNSW_M)
+    parser.add_argument("--hnsw-ef-construction", type=int, default=settings.HNSW_EF_CONSTRUCTION)
+    parser.add_argument("--ef-search", default="10,20,40,80,160,320")
+    parser.add_argument("--lists", type=int, default=settings.IVFFLAT_LISTS, help="0 = automático")
+    parser.add_argument("--probes", default="1,2,5,10,20,50,100")
+    parser.add_argument("--maintenance-work-mem", default=settings.VECTOR_INDEX_MAINTENANCE_WORK_MEM)
+    parser.add_argument("--batch-size", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--reuse", action="store_true", help="Reutilizar los datos del schema bench")
+    parser.add_argument("--keep", action="store_true", help="No eliminar el schema bench al terminar")
+    args = parser.parse_args()
+    run_benchmark(args)
@@ -0,0 +1,102 @@
+"""
+Benchmark de los niveles del enhancer de fallback (sin Real-ESRGAN)
+Mide latencia y calidad (PSNR/SSIM de compare_quality) de fast / balanced / best
+
+Cada imagen de referencia (HR) se reduce 4x con ruido gaussiano para simular un
+recorte de CCTV; luego se mejora con cada nivel y se compara contra la referencia.
+
+Uso:
+    python scripts/benchmark_fallback_tiers.py
+    python scripts/benchmark_fallback_tiers.py --images cara1.png cara2.png --noise 8
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Agregar el directorio padre al path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import cv2
+import numpy as np
+
+from app.forensics.super_resolution import SuperResolutionModule, FALLBACK_TIERS, FACE_RESOLUTIONS
+
+
+def load_references(image_paths):
+    """Imágenes de referencia: las indicadas o las de ejemplo de scikit-image"""
+    if image_paths:
+        return [(Path(p).name, cv2.imread(p)) for p in image_paths]
+    
+    from skimage import data
+    astronaut = cv2.cvtColor(data.astronaut(), cv2.COLOR_RGB2BGR)
+    return [
+        ("astronaut_face", astronaut[20:276, 120:376]),
+        ("astronaut", astronaut),
+        ("chelsea", cv2.cvtColor(data.chelsea(), cv2.COLOR_RGB2BGR)),
+        ("coffee", cv2.cvtColor(data.coffee(), cv2.COLOR_RGB2BGR)),
+    ]
+
+
+def degrade(reference, noise_sigma, rng):
+    """Reducir 4x y agregar ruido (recorte de baja calidad)"""
+    height, width = reference.shape[:2]
+    low = cv2.resize(reference, (width // 4, height // 4), interpolation=cv2.INTER_AREA)
+    noisy = low.astype(np.float32) + rng.normal(0, noise_sigma, low.shape)
+    return np.clip(noisy, 0, 255).astype(np.uint8)
+
+
+def timed(func, repeats):
+    """Ejecutar func (tras una pasada de calentamiento) y retornar (resultado, ms promedio)"""
+    func()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = func()
+    return result, (time.perf_counter() - start) / repeats * 1000
+
+
+def run_benchmark(args):
+    rng = np.random.default_rng(0)
+    references = load_references(args.images)
+    cv2.setNumThreads(args.threads)
+    
+    print(f"{'nivel':<9} {'imagen':<15} {'entrada':>9} {'image ms':>9} {'face ms':>8} {'PSNR':>7} {'SSIM':>6}")
+    for tier in FALLBACK_TIERS:
+        sr_module = SuperResolutionModule(model_path=None, fallback_tier=tier)
+        sr_module.model = None  # Forzar el fallback aunque Real-ESRGAN esté instalado
+        psnr_values, ssim_values, image_ms_values, face_ms_values = [], [], [], []
+        
+        for name, reference in references:
+            height, width = (reference.shape[0] // 4) * 4, (reference.shape[1] // 4) * 4
+            reference = reference[:height, :width]
+            low = degrade(reference, args.noise, rng)
+            
+            enhanced, image_ms = timed(lambda: sr_module.enhance_image(low), args.repeats)
+            _, face_ms = timed(lambda: sr_module.enhance_face(low, target_resolution="4k"), args.repeats)
+            metrics = sr_module.compare_quality(reference, enhanced)
+            
+            psnr_values.append(metrics["psnr"])
+            ssim_values.append(metrics["ssim"])
+            image_ms_values.append(image_ms)
+            face_ms_values.append(face_ms)
+            print(
+                f"{tier:<9} {name:<15} {low.shape[1]:>4}x{low.shape[0]:<4} {image_ms:>9.1f} {face_ms:>8.1f} "
+                f"{metrics['psnr']:>7.2f} {metrics['ssim']:>6.3f}"
+            )
+        
+        print(
+            f"{tier:<9} {'PROMEDIO':<15} {'':>9} {np.mean(image_ms_values):>9.1f} {np.mean(face_ms_values):>8.1f} "
+            f"{np.mean(psnr_values):>7.2f} {np.mean(ssim_values):>6.3f}\n"
+        )
+    
+    print(f"enhance_face: salida {FACE_RESOLUTIONS['4k'][0]}x{FACE_RESOLUTIONS['4k'][1]}, "
+          f"threads OpenCV={args.threads}, ruido sigma={args.noise}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de niveles del enhancer de fallback")
+    parser.add_argument("--images", nargs="*", help="Imágenes de referencia en alta resolución")
+    parser.add_argument("--noise", type=float, default=5.0, help="Sigma del ruido gaussiano agregado")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=1, help="Threads de OpenCV")
+    run_benchmark(parser.parse_args())
@@ -0,0 +1,101 @@
+"""
+Benchmark de Super-Resolution por tiles
+Mide memoria pico (RSS) y throughput de Real-ESRGAN según el tamaño de tile
+
+Uso:
+    python scripts/benchmark_super_resolution.py --width 1920 --height 1080 --tiles off,128,256,512
+    python scripts/benchmark_super_resolution.py --image frame.png --tiles auto,256 --workers 2
+"""
+import argparse
+import multiprocessing
+import resource
+import sys
+import time
+from pathlib import Path
+
+# Agregar el directorio padre al path
+sys.path.append(str(Path(__file__).parent.parent))
+
+# Valores especiales de --tiles (ver SuperResolutionModule.tile_size)
+TILE_ALIASES = {"auto": 0, "off": -1}
+
+
+def _run_config(image_path, width, height, tile, workers, repeats, queue):
+    """Ejecutar una configuración en un proceso aislado (RSS pico independiente)"""
+    import cv2
+    import numpy as np
+    from app.core.config import settings
+    from app.forensics.super_resolution import SuperResolutionModule
+    
+    if image_path:
+        image = cv2.imread(image_path)
+    else:
+        rng = np.random.default_rng(0)
+        image = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    
+    sr_module = SuperResolutionModule(
+        model_path=settings.ESRGAN_MODEL_PATH,
+        tile_size=TILE_ALIASES[tile] if tile in TILE_ALIASES else int(tile),
+        tile_overlap=settings.ESRGAN_TILE_OVERLAP,
+        tile_workers=workers,
+        memory_fraction=settings.ESRGAN_MEMORY_FRACTION
+    )
+    effective_tile = sr_module.choose_tile_size(*image.shape[:2])
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    
+    start = time.perf_counter()
+    for _ in range(repeats):
+        sr_module.enhance_image(image)
+    elapsed = (time.perf_counter() - start) / repeats
+    
+    queue.put({
+        "tile": tile,
+        "effective_tile": effective_tile,
+        "seconds": elapsed,
+        "mpix_per_s": image.shape[0] * image.shape[1] / elapsed / 1e6,
+        "model_rss_mb": rss_before / 1024,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "real_esrgan": sr_module.model is not None
+    })
+
+
+def run_benchmark(args):
+    """Ejecutar cada tamaño de tile en un subproceso y mostrar tabla de resultados"""
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    
+    for tile in args.tiles.split(","):
+        queue = ctx.Queue()
+        process = ctx.Process(
+            target=_run_config,
+            args=(args.image, args.width, args.height, tile.strip(), args.workers, args.repeats, queue)
+        )
+        process.start()
+        process.join()
+        
+        if process.exitcode != 0:
+            # Típicamente OOM-kill con tile=off en frames grandes
+            print(f"❌ tile={tile}: proceso terminó con código {process.exitcode}")
+            continue
+        results.append(queue.get())
+    
+    if results and not results[0]["real_esrgan"]:
+        print("⚠️  Real-ESRGAN no disponible: se mide el fallback, el tile no aplica")
+    
+    print(f"\n{'tile':>6} {'efectivo':>9} {'seg/img':>9} {'MPix/s':>8} {'RSS modelo MB':>14} {'RSS pico MB':>12}")
+    for r in results:
+        print(
+            f"{r['tile']:>6} {r['effective_tile']:>9} {r['seconds']:>9.2f} {r['mpix_per_s']:>8.3f} "
+            f"{r['model_rss_mb']:>14.0f} {r['peak_rss_mb']:>12.0f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de Real-ESRGAN por tiles")
+    parser.add_argument("--image", help="Imagen de entrada (por defecto ruido sintético)")
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--tiles", default="auto,128,256,512", help="Tamaños de tile separados por coma ('auto', 'off' o pixels)")
+    parser.add_argument("--workers", type=int, default=1, help="Threads por tile")
+    parser.add_argument("--repeats", type=int, default=1)
+    run_benchmark(parser.parse_args())
@@ -0,0 +1,75 @@
+"""
+Mantenimiento del índice vectorial de embeddings faciales (HNSW / IVFFlat)
+
+Uso:
+    python scripts/manage_vector_index.py status
+    python scripts/manage_vector_index.py maintain
+    python scripts/manage_vector_index.py build --type hnsw --m 16 --ef-construction 64
+    python scripts/manage_vector_index.py build --type ivfflat --lists 2000
+    python scripts/manage_vector_index.py build --quantization binary
+    python scripts/manage_vector_index.py search-params --recall 0.95 --limit 10
+    python scripts/manage_vector_index.py set-profile --profile '{"0.9": 40, "0.95": 80, "0.99": 200}'
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# Agregar el directorio padre al path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.models.database import SessionLocal, init_db
+from app.services.vector_index import VectorIndexManager
+
+
+def main(args):
+    init_db()
+    db = SessionLocal()
+    manager = VectorIndexManager()
+    
+    try:
+        if args.command == "status":
+            print(json.dumps(manager.status(db), indent=2, default=str))
+        
+        elif args.command == "maintain":
+            print(json.dumps(manager.maintain(db), indent=2, default=str))
+        
+        elif args.command == "build":
+            params = None
+            if args.type == "hnsw" and (args.m or args.ef_construction):
+                defaults = manager.desired_params("hnsw", 0)
+                params = {
+                    "m": args.m or defaults["m"],
+                    "ef_construction": args.ef_construction or defaults["ef_construction"]
+                }
+            elif args.type == "ivfflat" and args.lists:
+                params = {"lists": args.lists}
+            result = manager.build(db, index_type=args.type, params=params, quantization=args.quantization)
+            print(json.dumps(result, indent=2, default=str))
+        
+        elif args.command == "search-params":
+            print(json.dumps(manager.search_settings(db, args.recall, args.limit), indent=2))
+        
+        elif args.command == "set-profile":
+            # Perfil medido con scripts/benchmark_face_search.py (mismos parámetros de construcción)
+            manager.save_recall_profile(db, json.loads(args.profile))
+            print(json.dumps(manager.status(db), indent=2, default=str))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mantenimiento del índice vectorial de caras")
+    parser.add_argument("command", choices=["status", "maintain", "build", "search-params", "set-profile"])
+    parser.add_argument("--type", choices=["hnsw", "ivfflat"], help="Tipo de índice (por defecto VECTOR_INDEX_TYPE)")
+    parser.add_argument("--m", type=int, help="HNSW: conexiones por nodo")
+    parser.add_argument("--ef-construction", type=int, help="HNSW: candidatos durante la construcción")
+    parser.add_argument(
+        "--quantization", choices=["none", "halfvec", "binary"],
+        help="Expresión indexada (por defecto VECTOR_INDEX_QUANTIZATION)"
+    )
+    parser.add_argument("--lists", type=int, help="IVFFlat: número de listas (por defecto automático)")
+    parser.add_argument("--recall", type=float, help="search-params: recall objetivo")
+    parser.add_argument("--limit", type=int, default=10, help="search-params: k de la consulta")
+    parser.add_argument("--profile", help="set-profile: JSON recall -> probes/ef_search")
+    main(parser.parse_args())
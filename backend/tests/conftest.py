@@ -0,0 +1,78 @@
+"""
+Fixtures compartidas de los tests del backend
+
+Los tests que necesitan Postgres (con pgvector) usan TEST_DATABASE_URL y se
+omiten si no está definida. Las tablas se crean al inicio de la sesión y cada
+test corre en una transacción que se revierte al terminar.
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+@pytest.fixture(scope="session")
+def db_engine():
+    url = os.environ.get("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL no definida (Postgres con pgvector)")
+    
+    from sqlalchemy import create_engine, text
+    from app.models.models import Base
+    
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+    Base.metadata.create_all(engine)
+    yield engine
+    Base.metadata.drop_all(engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def db(db_engine):
+    from sqlalchemy.orm import Session
+    
+    connection = db_engine.connect()
+    transaction = connection.begin()
+    session = Session(bind=connection, join_transaction_mode="create_savepoint")
+    yield session
+    session.close()
+    transaction.rollback()
+    connection.close()
+
+
+@pytest.fixture
+def pgvector_version(db):
+    from sqlalchemy import text
+    
+    version = db.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar()
+    return tuple(int(part) for part in version.split("."))
+
+
+@pytest.fixture
+def make_video(db):
+    """Crear un video (y su usuario) mínimos para colgar filas de detección"""
+    import uuid
+    from app.models.models import User, Video
+    
+    user = User(email=f"{uuid.uuid4().hex}@test.local", username=uuid.uuid4().hex, hashed_password="x")
+    db.add(user)
+    db.flush()
+    
+    def factory(**values):
+        video = Video(
+            user_id=user.id,
+            filename=values.pop("filename", "video.mp4"),
+            original_filename="video.mp4",
+            sha256_hash=uuid.uuid4().hex * 2,
+            **values
+        )
+        db.add(video)
+        db.flush()
+        return video
+    
+    return factory
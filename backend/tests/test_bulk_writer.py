@@ -0,0 +1,74 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, select
+
+from app.models.models import DetectedObject, FaceEmbedding, ObjectTrack
+from app.services.bulk_writer import BulkDetectionWriter, ColumnarBuffer, _encode_timestamp
+
+
+class _Model:
+    __table__ = Table(
+        "bulk_defaults",
+        MetaData(),
+        Column("id", Integer, primary_key=True),
+        Column("name", String, default="sin nombre"),
+        Column("created_at", DateTime, default=datetime.utcnow),
+        Column("label", String, default=lambda context: f"fila-{context.get_current_parameters()['id']}")
+    )
+
+
+def test_defaults_scalar_callable_and_context_sensitive():
+    buffer = ColumnarBuffer(_Model)
+    buffer.append({"id": 7})
+    
+    [row] = buffer.rows()
+    assert row["name"] == "sin nombre"
+    assert isinstance(row["created_at"], datetime)
+    assert row["label"] == "fila-7"
+
+
+def test_timestamp_with_time_zone_is_stored_as_utc():
+    naive = datetime(2024, 3, 1, 12, 30, 15, 250)
+    aware = naive.replace(tzinfo=timezone.utc).astimezone(timezone(timedelta(hours=-3)))
+    
+    assert _encode_timestamp(aware) == _encode_timestamp(naive)
+
+
+@pytest.mark.parametrize("method", ["copy", "executemany"])
+def test_round_trip_through_postgres(db, make_video, method):
+    video = make_video()
+    embedding = np.linspace(-1, 1, 512, dtype=np.float32)
+    renditions = {"tile": {"url": "/storage/faces/t.webp", "width": 64, "height": 64}}
+    detected_at = datetime(2024, 3, 1, 9, 0, tzinfo=timezone(timedelta(hours=-3)))
+    
+    writer = BulkDetectionWriter(db, method=method)
+    face_id = uuid.uuid4()
+    writer.add_face(
+        id=face_id, video_id=video.id, embedding=embedding, frame_number=12, timestamp_in_video=0.4,
+        confidence=0.97, bbox_x=5, face_renditions=renditions, is_person_of_interest=True, detected_at=detected_at
+    )
+    writer.add_object(video_id=video.id, frame_number=12, object_class="car", confidence=None)
+    writer.add_track(
+        video_id=video.id, object_class="car", start_frame=0, end_frame=12, detection_count=2,
+        trajectory=b"\x00\x01\x02", trajectory_points=1
+    )
+    assert writer.flush() == 3
+    db.expire_all()
+    
+    face = db.get(FaceEmbedding, face_id)
+    assert face is not None
+    assert np.allclose(face.embedding, embedding)
+    assert face.face_renditions == renditions
+    assert face.detected_at == datetime(2024, 3, 1, 12, 0)
+    assert face.is_person_of_interest is True
+    assert (face.bbox_y, face.gender, face.identity_id, face.poi_marked_at) == (None, None, None, None)
+    
+    detected = db.execute(select(DetectedObject).where(DetectedObject.video_id == video.id)).scalar_one()
+    assert detected.confidence is None
+    assert detected.detected_at is not None  # Default del modelo
+    track = db.execute(select(ObjectTrack).where(ObjectTrack.video_id == video.id)).scalar_one()
+    assert bytes(track.trajectory) == b"\x00\x01\x02"
+    assert db.scalar(select(func.count()).select_from(FaceEmbedding).where(FaceEmbedding.video_id == video.id)) == 1
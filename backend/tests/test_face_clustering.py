@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.models.models import FaceEmbedding, FaceIdentity, FaceMatch
+from app.services.face_clustering import FaceClusterer
+
+
+def _face(db, video, identity):
+    face = FaceEmbedding(video_id=video.id, embedding=np.ones(512).tolist(), frame_number=0, identity_id=identity.id)
+    db.add(face)
+    return face
+
+
+def test_edges_store_similarity_and_recluster_merges_only_close_identities(db, make_video, monkeypatch):
+    monkeypatch.setattr(settings, "FACE_CLUSTER_MERGE_MIN_EDGES", 1)
+    video = make_video()
+    identities = [FaceIdentity(face_count=1) for _ in range(4)]
+    db.add_all(identities)
+    db.flush()
+    near_a, near_b, far_a, far_b = (_face(db, video, identity) for identity in identities)
+    db.flush()
+    
+    clusterer = FaceClusterer(threshold=0.3)
+    assert clusterer.record_edges(db, [(near_a.id, near_b.id, 0.1), (far_a.id, far_b.id, 0.5)]) == 2
+    scores = {
+        frozenset((match.query_face_id, match.matched_face_id)): match.similarity_score
+        for match in db.query(FaceMatch)
+    }
+    assert scores[frozenset((near_a.id, near_b.id))] == pytest.approx(0.9)
+    assert scores[frozenset((far_a.id, far_b.id))] == pytest.approx(0.5)
+    
+    merged, _ = clusterer._merge_chunk(db, [identity.id for identity in identities])
+    db.expire_all()
+    
+    assert merged == 1
+    assert db.get(FaceEmbedding, near_a.id).identity_id == db.get(FaceEmbedding, near_b.id).identity_id
+    assert db.get(FaceEmbedding, far_a.id).identity_id != db.get(FaceEmbedding, far_b.id).identity_id
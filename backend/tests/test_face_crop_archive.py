@@ -0,0 +1,62 @@
+from app.models.models import FaceEmbedding
+from app.services.artifact_uploader import ArtifactUploader
+from app.services.face_crop_archive import FaceCropArchiveWriter, parse_crop_url
+from app.services.renditions import Rendition
+
+
+class FakeStorage:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.fallback_local = []
+    
+    def put_bytes(self, content, filename, folder, content_type, fallback_local=True):
+        self.fallback_local.append(fallback_local)
+        if self.fail:
+            raise ConnectionError("S3 no disponible")
+        return f"s3://bucket/{folder}/{filename}"
+
+
+class FakeSession:
+    def __init__(self):
+        self.updates = []
+    
+    def bulk_update_mappings(self, model, rows):
+        self.updates.append((model, rows))
+
+
+def _renditions():
+    return {
+        "tile": Rendition("tile", b"t" * 10, 64, 64, ".webp", "image/webp"),
+        "full": Rendition("full", b"f" * 30, 256, 256, ".webp", "image/webp")
+    }
+
+
+def _archive_face(storage):
+    uploader = ArtifactUploader(storage, max_concurrency=1, max_pending=4, max_retries=0)
+    archive = FaceCropArchiveWriter("0" * 8 + "-0000-0000-0000-" + "0" * 12, "faces", uploader)
+    metadata = archive.append_renditions(
+        "face-1", _renditions(), target=(FaceEmbedding, "face-1", "face_renditions"), url_field="face_image_url"
+    )
+    archive.close()
+    db = FakeSession()
+    uploader.resolve(db, wait_all=True)
+    uploader.close()
+    return metadata, db
+
+
+def test_crop_urls_are_registered_after_shard_upload():
+    storage = FakeStorage()
+    metadata, db = _archive_face(storage)
+    
+    assert storage.fallback_local == [False, False]  # Shard e índice: nunca a disco local
+    [(model, rows)] = db.updates
+    assert model is FaceEmbedding
+    assert rows == [{"id": "face-1", "face_renditions": metadata, "face_image_url": metadata["full"]["url"]}]
+    assert parse_crop_url(metadata["full"]["url"])[2:] == (10, 30)
+
+
+def test_failed_shard_upload_leaves_rows_without_urls():
+    metadata, db = _archive_face(FakeStorage(fail=True))
+    
+    assert metadata["full"]["url"]
+    assert db.updates == []
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from sqlalchemy import text
+
+from app.models.models import FaceEmbedding, VectorIndexState
+from app.services import vector_index
+from app.services.face_search_service import choose_strategy, search_similar_faces_batch
+from app.services.vector_index import EMBEDDING_DIMENSIONS, FACE_EMBEDDING_INDEX, VectorIndexManager
+
+
+def test_exclude_same_video_uses_iterative_scan_without_other_filters():
+    assert choose_strategy(None, None)[0] == "index"
+    assert choose_strategy(None, None, exclude_same_video=True)[0] == "iterative"
+
+
+def _near(base, rng, scale):
+    vector = base + rng.normal(0, scale, EMBEDDING_DIMENSIONS)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def test_batch_search_finds_other_videos_when_same_video_neighbours_outnumber_k(
+    db, make_video, pgvector_version, monkeypatch
+):
+    if pgvector_version < (0, 8, 0):
+        pytest.skip("hnsw.iterative_scan requiere pgvector >= 0.8")
+    
+    rng = np.random.default_rng(7)
+    base = rng.normal(size=EMBEDDING_DIMENSIONS)
+    base /= np.linalg.norm(base)
+    
+    same_video, other_video = make_video(), make_video(filename="otro.mp4")
+    query = FaceEmbedding(video_id=same_video.id, embedding=base.tolist(), frame_number=0)
+    db.add(query)
+    # 40 vecinos del mismo video, todos más cerca que la única coincidencia de otro video
+    db.add_all(
+        FaceEmbedding(video_id=same_video.id, embedding=_near(base, rng, 0.002), frame_number=frame)
+        for frame in range(1, 41)
+    )
+    match = FaceEmbedding(video_id=other_video.id, embedding=_near(base, rng, 0.02), frame_number=0)
+    db.add(match)
+    db.add(VectorIndexState(
+        index_name=FACE_EMBEDDING_INDEX,
+        table_name="face_embeddings",
+        index_type="hnsw",
+        params={"m": 16, "ef_construction": 64},
+        recall_profile={"0.9": 10}  # ef_search (10) menor que los vecinos del mismo video
+    ))
+    db.flush()
+    
+    manager = VectorIndexManager()
+    statement = manager.create_statement(FACE_EMBEDDING_INDEX, "hnsw", {"m": 16, "ef_construction": 64})
+    db.execute(text(statement.replace("CONCURRENTLY ", "")))  # Dentro de la transacción del test
+    db.execute(text("SET LOCAL enable_seqscan = off"))  # Tabla chica: forzar el índice HNSW
+    monkeypatch.setitem(vector_index._state_cache, "state", None)
+    monkeypatch.setitem(vector_index._state_cache, "loaded_at", 0.0)
+    
+    results = search_similar_faces_batch(
+        db, queries={query.id: 0.6}, max_results=5, recall=0.9, exclude_same_video=True
+    )
+    
+    assert [row.id for row in results[query.id]] == [match.id]
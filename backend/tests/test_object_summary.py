@@ -0,0 +1,48 @@
+from types import SimpleNamespace
+
+from app.models.models import DetectedObject, ObjectTrack, VideoObjectSummary
+from app.services.object_summary import ObjectSummaryAccumulator, rebuild_video_summaries
+from app.services.object_tracker import encode_trajectory
+
+
+def test_accumulator_counts_frames_and_minutes():
+    accumulator = ObjectSummaryAccumulator()
+    accumulator.add("car", 0, 1.0, 0.5)
+    accumulator.add("car", 0, 1.0, 0.7)
+    accumulator.add("car", 30, 125.0, 0.6)
+    
+    [row] = accumulator.rows(SimpleNamespace(id=1, user_id=2, recorded_at=None, uploaded_at=None))
+    assert (row["detection_count"], row["frame_count"], row["max_confidence"]) == (3, 2, 0.7)
+    assert row["minute_histogram"] == [2, 0, 1]
+
+
+def test_rebuild_from_detected_objects(db, make_video):
+    video = make_video()
+    db.add_all([
+        DetectedObject(video_id=video.id, frame_number=0, timestamp_in_video=0.0, object_class="car", confidence=0.5),
+        DetectedObject(video_id=video.id, frame_number=0, timestamp_in_video=0.0, object_class="car", confidence=0.8),
+        DetectedObject(video_id=video.id, frame_number=90, timestamp_in_video=61.0, object_class="car", confidence=0.6)
+    ])
+    db.flush()
+    
+    assert rebuild_video_summaries(db, video) == 1
+    summary = db.query(VideoObjectSummary).filter_by(video_id=video.id).one()
+    assert (summary.detection_count, summary.frame_count, summary.minute_histogram) == (3, 2, [2, 1])
+
+
+def test_rebuild_keeps_summary_of_track_only_videos(db, make_video):
+    video = make_video()
+    accumulator = ObjectSummaryAccumulator()
+    for frame in range(5):
+        accumulator.add("person", frame, frame * 0.5, 0.9)
+    accumulator.save(db, video)
+    db.add(ObjectTrack(
+        video_id=video.id, object_class="person", start_frame=0, end_frame=4, start_time=0.0, end_time=2.0,
+        detection_count=5, peak_confidence=0.9, peak_frame=0,
+        trajectory=encode_trajectory([(0, 1, 1, 10, 10)], 0), trajectory_points=1
+    ))
+    db.flush()
+    
+    assert rebuild_video_summaries(db, video) is None
+    summary = db.query(VideoObjectSummary).filter_by(video_id=video.id).one()
+    assert (summary.detection_count, summary.frame_count) == (5, 5)
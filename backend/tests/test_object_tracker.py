@@ -0,0 +1,94 @@
+import pytest
+
+from app.services.object_tracker import ObjectTracker, decode_trajectory, encode_trajectory, iou
+
+
+def _detection(x, y, object_class="car", confidence=0.9, width=100, height=50):
+    return {"class": object_class, "confidence": confidence, "bbox": {"x": x, "y": y, "width": width, "height": height}}
+
+
+def _tracker(**overrides):
+    options = {"iou_threshold": 0.5, "max_gap_seconds": 2.0, "position_tolerance": 8}
+    options.update(overrides)
+    return ObjectTracker("video-1", **options)
+
+
+def test_iou():
+    assert iou((0, 0, 10, 10), (0, 0, 10, 10)) == 1.0
+    assert iou((0, 0, 10, 10), (20, 20, 10, 10)) == 0.0
+    assert iou((0, 0, 10, 10), (5, 0, 10, 10)) == pytest.approx(50 / 150)
+
+
+def test_overlapping_detections_extend_the_same_track():
+    tracker = _tracker()
+    for frame in range(10):
+        assert tracker.update(frame, frame * 0.1, [_detection(100 + frame * 2, 100)]) == []
+    
+    [track] = tracker.finish()
+    assert (track["start_frame"], track["end_frame"], track["detection_count"]) == (0, 9, 10)
+
+
+def test_detections_match_by_class_and_best_overlap():
+    tracker = _tracker()
+    tracker.update(0, 0.0, [_detection(0, 0), _detection(300, 0), _detection(0, 0, object_class="person")])
+    # Cruzadas en la lista: cada una va al track con el que más se solapa
+    tracker.update(1, 0.1, [_detection(302, 0, confidence=0.95), _detection(2, 0, confidence=0.8)])
+    
+    tracks = sorted(tracker.finish(), key=lambda row: (row["object_class"], row["start_frame"], row["peak_confidence"]))
+    cars = [track for track in tracks if track["object_class"] == "car"]
+    assert [track["detection_count"] for track in cars] == [2, 2]
+    assert sorted(track["peak_confidence"] for track in cars) == [0.9, 0.95]
+    person = next(track for track in tracks if track["object_class"] == "person")
+    assert person["detection_count"] == 1
+
+
+def test_low_overlap_starts_a_new_track():
+    tracker = _tracker()
+    tracker.update(0, 0.0, [_detection(0, 0)])
+    tracker.update(1, 0.1, [_detection(80, 0)])  # IoU 20/180
+    
+    assert len(tracker.finish()) == 2
+
+
+def test_gap_shorter_than_max_keeps_the_track_open():
+    tracker = _tracker()
+    tracker.update(0, 0.0, [_detection(0, 0)])
+    assert tracker.update(15, 1.5, []) == []
+    tracker.update(20, 2.0, [_detection(0, 0)])
+    
+    [track] = tracker.finish()
+    assert track["detection_count"] == 2
+
+
+def test_gap_longer_than_max_closes_the_track():
+    tracker = _tracker()
+    tracker.update(0, 0.0, [_detection(0, 0)])
+    tracker.update(10, 1.0, [_detection(0, 0)])
+    
+    closed = tracker.update(40, 4.0, [_detection(0, 0)])
+    assert [(track["start_frame"], track["end_frame"]) for track in closed] == [(0, 10)]
+    assert tracker.tracks_closed == 1
+    [reopened] = tracker.finish()
+    assert reopened["start_frame"] == 40
+
+
+def test_static_object_keeps_only_first_and_last_points():
+    tracker = _tracker()
+    for frame in range(0, 3600):
+        tracker.update(frame, float(frame), [_detection(500 + frame % 3, 200)])
+    
+    [track] = tracker.finish()
+    points = decode_trajectory(track["trajectory"], track["start_frame"])
+    assert track["trajectory_points"] == 2
+    assert [point["frame_number"] for point in points] == [0, 3599]
+
+
+def test_trajectory_round_trip():
+    points = [(1000, 10, 20, 30, 40), (1003, 12, 22, 30, 41), (1250, 400, 300, 64, 128)]
+    data = encode_trajectory(points, start_frame=1000)
+    
+    assert len(data) == len(points) * 5 * 4
+    assert decode_trajectory(data, start_frame=1000) == [
+        {"frame_number": frame, "bbox_x": x, "bbox_y": y, "bbox_width": width, "bbox_height": height}
+        for frame, x, y, width, height in points
+    ]
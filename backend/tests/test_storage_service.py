@@ -0,0 +1,115 @@
+import asyncio
+import time
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from app.core.config import settings
+from app.services import storage_service
+from app.services.storage_service import StorageService
+
+
+BUCKET = "forensic-test"
+
+
+@pytest.fixture
+def s3(monkeypatch, tmp_path):
+    """StorageService contra un S3 simulado (moto), con recursos de proceso nuevos"""
+    for name, value in {
+        "USE_S3": True,
+        "S3_BUCKET_NAME": BUCKET,
+        "S3_ENDPOINT_URL": None,
+        "AWS_REGION": "us-east-1",
+        "AWS_ACCESS_KEY_ID": "testing",
+        "AWS_SECRET_ACCESS_KEY": "testing",
+        "LOCAL_STORAGE_PATH": str(tmp_path)
+    }.items():
+        monkeypatch.setattr(settings, name, value)
+    for name in ("_s3_client", "_executor", "_owner_pid"):
+        monkeypatch.setattr(storage_service, name, None)
+    
+    with mock_aws():
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket=BUCKET)
+        storage = StorageService()
+        yield storage
+        storage_service._executor.shutdown(wait=True)
+
+
+def _object(key: str) -> bytes:
+    return boto3.client("s3", region_name="us-east-1").get_object(Bucket=BUCKET, Key=key)["Body"].read()
+
+
+def test_upload_video(s3):
+    url = asyncio.run(s3.upload_video(b"video-bytes", "clip.mp4"))
+    
+    assert url == f"https://{BUCKET}.s3.us-east-1.amazonaws.com/videos/clip.mp4"
+    assert _object("videos/clip.mp4") == b"video-bytes"
+
+
+def test_upload_image(s3):
+    url = asyncio.run(s3.upload_image(b"jpeg", "face.jpg", folder="faces"))
+    
+    assert s3.key_from_url(url) == "faces/face.jpg"
+    head = boto3.client("s3", region_name="us-east-1").head_object(Bucket=BUCKET, Key="faces/face.jpg")
+    assert head["ContentType"] == "image/jpeg"
+
+
+def test_download_file(s3):
+    asyncio.run(s3.upload_video(b"0123456789", "clip.mp4"))
+    
+    assert asyncio.run(s3.download_file("videos/clip.mp4")) == b"0123456789"
+    assert asyncio.run(s3.download_range("videos/clip.mp4", 2, 3)) == b"234"
+    assert asyncio.run(s3.download_file("videos/missing.mp4")) == b""
+
+
+def test_delete_file(s3):
+    asyncio.run(s3.upload_video(b"x", "clip.mp4"))
+    
+    assert asyncio.run(s3.delete_file("videos/clip.mp4")) is True
+    with pytest.raises(FileNotFoundError):
+        s3.read_range("videos/clip.mp4", 0, 1)
+
+
+def test_client_error_falls_back_to_local_storage(s3, tmp_path):
+    s3.bucket_name = "missing-bucket"  # put_object -> ClientError (NoSuchBucket)
+    
+    url = asyncio.run(s3.upload_image(b"jpeg", "face.jpg"))
+    
+    assert url == "/storage/faces/face.jpg"
+    assert (tmp_path / "faces" / "face.jpg").read_bytes() == b"jpeg"
+
+
+def test_client_error_propagates_without_fallback(s3):
+    s3.bucket_name = "missing-bucket"
+    
+    with pytest.raises(storage_service.ClientError):
+        s3.put_bytes(b"bin", "shard.bin", "face_archives", "application/octet-stream", fallback_local=False)
+
+
+def test_async_methods_do_not_block_the_event_loop(s3, monkeypatch):
+    put_object = s3.s3_client.put_object
+    
+    def slow_put_object(**kwargs):
+        time.sleep(0.3)  # Latencia de S3
+        return put_object(**kwargs)
+    
+    monkeypatch.setattr(s3.s3_client, "put_object", slow_put_object)
+    
+    async def upload_while_ticking():
+        ticks = 0
+        
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+        
+        task = asyncio.create_task(ticker())
+        await s3.upload_video(b"video-bytes", "slow.mp4")
+        task.cancel()
+        return ticks
+    
+    # Con la subida en el event loop el ticker no correría durante los 0.3 s
+    assert asyncio.run(upload_while_ticking()) >= 10
+    assert _object("videos/slow.mp4") == b"video-bytes"
@@ -0,0 +1,51 @@
+import asyncio
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.auth import AuthService, get_current_user
+from app.core.user_cache import auth_cache
+from app.services.upload_service import (
+    LOCAL_UPLOAD_PATH, UPLOAD_TOKEN_HEADER, DirectUploadService, UploadError
+)
+
+
+@pytest.fixture
+def upload_service(tmp_path):
+    return DirectUploadService(storage=SimpleNamespace(s3_client=None, local_base_dir=tmp_path))
+
+
+def test_local_upload_url_does_not_carry_the_token(upload_service):
+    result = upload_service.initiate(uuid.uuid4(), "clip.mp4", 1024)
+    claims = upload_service.decode_token(result["upload_token"])
+    
+    assert result["url"] == f"{LOCAL_UPLOAD_PATH}/{claims['upload_id']}"
+    assert result["upload_token"] not in result["url"]
+    assert result["headers"] == {UPLOAD_TOKEN_HEADER: result["upload_token"]}
+
+
+def test_upload_token_is_not_an_access_token(upload_service, monkeypatch):
+    monkeypatch.setattr(auth_cache, "tokens", type(auth_cache.tokens)(10))
+    token = upload_service.initiate(uuid.uuid4(), "clip.mp4", 1024)["upload_token"]
+    
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(get_current_user(token=token, db=None))
+    assert error.value.status_code == 401
+
+
+def test_access_token_is_not_an_upload_token(upload_service):
+    access_token = AuthService.create_access_token({"sub": str(uuid.uuid4())})
+    
+    with pytest.raises(UploadError):
+        upload_service.decode_token(access_token)
+
+
+def test_typed_tokens_signed_with_the_access_key_are_rejected(monkeypatch):
+    monkeypatch.setattr(auth_cache, "tokens", type(auth_cache.tokens)(10))
+    token = AuthService.create_access_token({"sub": str(uuid.uuid4()), "type": "video_upload"})
+    
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(get_current_user(token=token, db=None))
+    assert error.value.status_code == 401
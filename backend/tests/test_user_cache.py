@@ -0,0 +1,120 @@
+import asyncio
+import uuid
+
+import pytest
+import redis.asyncio as redis
+
+from app.core import user_cache
+from app.core.user_cache import InvalidationError, TTLCache, invalidate_user, listen_for_invalidations
+
+
+def test_ttl_cache_expires_and_evicts_lru(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(user_cache.time, "monotonic", lambda: now[0])
+    cache = TTLCache(max_entries=2)
+    cache.set("a", 1, ttl=10)
+    cache.set("b", 2, ttl=10)
+    assert cache.get("a") == 1
+    cache.set("c", 3, ttl=10)  # Desplaza a "b" (menos usado)
+    
+    assert cache.get("b") is None
+    now[0] = 111.0
+    assert cache.get("a") is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+class FakePubSub:
+    def __init__(self, client):
+        self.client = client
+        self.closed = False
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc):
+        self.closed = True
+    
+    async def subscribe(self, channel):
+        if len(self.client.pubsubs) <= 2:
+            raise redis.ConnectionError("Redis no disponible")
+    
+    async def listen(self):
+        yield {"type": "subscribe", "data": 1}
+        yield {"type": "message", "data": str(self.client.user_id).encode()}
+        self.client.delivered.set()
+        await asyncio.Event().wait()
+
+
+class FakeRedis:
+    def __init__(self):
+        self.pubsubs = []
+        self.closed = False
+        self.user_id = uuid.uuid4()
+        self.delivered = asyncio.Event()
+        self.published = []
+        self.publish_failures = 0
+    
+    async def publish(self, channel, message):
+        if self.publish_failures:
+            self.publish_failures -= 1
+            raise redis.ConnectionError("Redis no disponible")
+        self.published.append((channel, message))
+    
+    def pubsub(self):
+        self.pubsubs.append(FakePubSub(self))
+        return self.pubsubs[-1]
+    
+    async def aclose(self):
+        self.closed = True
+
+
+@pytest.fixture
+def clients(monkeypatch):
+    clients = []
+    monkeypatch.setattr(redis, "from_url", lambda url: clients.append(FakeRedis()) or clients[-1])
+    monkeypatch.setattr(user_cache, "_client", None)
+    sleep = asyncio.sleep
+    monkeypatch.setattr(user_cache.asyncio, "sleep", lambda seconds: sleep(0))
+    return clients
+
+
+def test_listener_and_publisher_share_one_client(clients):
+    async def run():
+        task = asyncio.create_task(listen_for_invalidations())
+        await asyncio.wait_for(_delivered(clients), timeout=2)
+        await invalidate_user(clients[0].user_id)
+        await invalidate_user(clients[0].user_id)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert not clients[0].closed  # Cancelar el listener no cierra el cliente compartido
+        await user_cache.close_redis()
+    
+    asyncio.run(run())
+    
+    [client] = clients
+    assert len(client.pubsubs) == 3  # Dos reconexiones
+    assert all(pubsub.closed for pubsub in client.pubsubs)
+    assert len(client.published) == 2
+    assert client.closed
+
+
+def test_invalidate_user_retries_then_raises(clients, capsys):
+    user_id = uuid.uuid4()
+    
+    async def run(failures):
+        user_cache._redis_client().publish_failures = failures
+        await invalidate_user(user_id)
+    
+    asyncio.run(run(user_cache.PUBLISH_ATTEMPTS - 1))
+    assert clients[0].published == [(user_cache.INVALIDATION_CHANNEL, str(user_id))]
+    
+    with pytest.raises(InvalidationError):
+        asyncio.run(run(user_cache.PUBLISH_ATTEMPTS))
+    assert "❌" in capsys.readouterr().out
+    assert len(clients) == 1
+
+
+async def _delivered(clients):
+    while not clients:
+        await asyncio.sleep(0)
+    await clients[0].delivered.wait()
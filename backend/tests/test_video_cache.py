@@ -0,0 +1,102 @@
+import fcntl
+import hashlib
+import os
+
+from app.services.video_cache import VideoCache
+
+
+CONTENT = b"video" * 1000
+SHA256 = hashlib.sha256(CONTENT).hexdigest()
+
+
+class FakeStorage:
+    def __init__(self):
+        self.downloads = 0
+    
+    def download_to_file(self, s3_key, dest_path, expected_sha256=None):
+        self.downloads += 1
+        with open(dest_path, "wb") as f:
+            f.write(CONTENT)
+        return len(CONTENT)
+
+
+def _cache(tmp_path, storage):
+    return VideoCache(storage, cache_dir=str(tmp_path), max_bytes=10 * len(CONTENT), enabled=True)
+
+
+def test_hit_while_entry_is_in_use_does_not_wait_or_download(tmp_path):
+    storage = FakeStorage()
+    cache = _cache(tmp_path, storage)
+    
+    first = cache.acquire(SHA256, "videos/a.mp4", len(CONTENT))
+    second = cache.acquire(SHA256, "videos/a.mp4", len(CONTENT))  # Con `first` aún en uso
+    
+    assert (first.cache_hit, second.cache_hit, storage.downloads) == (False, True, 1)
+    assert (first.integrity_check, second.integrity_check) == ("sha256_download", "sha256_cache_hit")
+    first.release()
+    second.release()
+
+
+def test_modified_entry_is_downloaded_again(tmp_path):
+    storage = FakeStorage()
+    cache = _cache(tmp_path, storage)
+    cache.acquire(SHA256, "videos/a.mp4", len(CONTENT)).release()
+    
+    with open(cache._entry_path(SHA256), "ab") as f:
+        f.write(b"corrupto")
+    entry = cache.acquire(SHA256, "videos/a.mp4", len(CONTENT))
+    
+    assert (entry.cache_hit, storage.downloads) == (False, 2)
+    assert os.path.getsize(entry.path) == len(CONTENT)
+    entry.release()
+
+
+def test_tampered_entry_with_same_size_and_mtime_is_detected(tmp_path):
+    storage = FakeStorage()
+    cache = _cache(tmp_path, storage)
+    cache.acquire(SHA256, "videos/a.mp4", len(CONTENT)).release()
+    
+    path = cache._entry_path(SHA256)
+    stat = path.stat()
+    with open(path, "r+b") as f:
+        f.write(b"X")
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))  # El manifiesto no lo detecta
+    entry = cache.acquire(SHA256, "videos/a.mp4", len(CONTENT))
+    
+    assert (entry.cache_hit, entry.integrity_check, storage.downloads) == (False, "sha256_download", 2)
+    with open(entry.path, "rb") as f:
+        assert f.read() == CONTENT
+    entry.release()
+
+
+def test_eviction_removes_leftovers_of_crashed_downloads(tmp_path):
+    storage = FakeStorage()
+    cache = _cache(tmp_path, storage)
+    stale = "ab" + "0" * 62
+    stale_entry = cache._entry_path(stale)
+    cache._lock_path(stale).touch()
+    stale_entry.with_suffix(".part").write_bytes(b"parcial")
+    orphan_lock = cache._lock_path("cd" + "1" * 62)
+    orphan_lock.touch()
+    
+    in_use = cache.acquire(SHA256, "videos/a.mp4", len(CONTENT))  # Descarga: corre la evicción
+    
+    assert not stale_entry.with_suffix(".part").exists()
+    assert not cache._lock_path(stale).exists()
+    assert not orphan_lock.exists()
+    assert cache._lock_path(SHA256).exists()  # Entrada en uso: su lock se conserva
+    in_use.release()
+
+
+def test_lock_file_removed_while_waiting_is_reopened(tmp_path):
+    cache = _cache(tmp_path, FakeStorage())
+    lock_path = cache._lock_path(SHA256)
+    lock_file = open(lock_path, "a+")
+    lock_path.unlink()  # La evicción borró el lock mientras se esperaba
+    
+    lock_file = cache._lock(lock_file, SHA256, fcntl.LOCK_SH)
+    
+    assert os.fstat(lock_file.fileno()).st_ino == os.stat(lock_path).st_ino
+    assert cache._remove_entry(SHA256) is False  # Lock tomado: la evicción no la toca
+    fcntl.flock(lock_file, fcntl.LOCK_UN)
+    lock_file.close()